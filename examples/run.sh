@@ -20,39 +20,47 @@ run_checked() {
     fi
 }
 
-# Without any arguments, run this script on all libraries in this script's
-# directory.
-if [ -z "$library" ]; then
-    for schema in $(dirname $0)/*.xsd; do
-        without_extension="${schema%.*}"
-        lib="$(basename $without_extension)"
-        # Call this script again, specifying the library that we found.
-        run_checked "$0" "$lib" "$@"
-    done
-    exit 0
-fi
-
 # Deduce where the stag root is based on where this script is assumed to be.
 REPO=$(readlink -f $(dirname $BASH_SOURCE)/../)
 
-# Go into the examples/ directory and run stag on the schema. 
-run_checked cd $REPO/examples
-run_checked racket $REPO/src/stag/main.rkt "$@" $library.xsd
+check_library() {
+    # Format, type check, and run the python modules that stag produced for
+    # the library named by the first argument to this function.
+    local lib="$1"
+    local files="${lib}msg.py ${lib}msgutil.py _${lib}msg.py"
+
+    # Format the python code in place.
+    for module in $files; do
+        run_checked yapf -i $module
+    done
+
+    # Run python's type checker on the generated code.
+    for module in $files; do
+        run_checked mypy --strict $module
+    done
 
-# Stag will have produced these three python modules.
-FILES="${library}msg.py ${library}msgutil.py _${library}msg.py"
+    # Run the generated modules in a python interpreter.
+    for module in $files; do
+        run_checked python3.6 $module
+    done
+}
 
-# Format the python code in place.
-for module in $FILES; do
-    run_checked yapf -i $module
-done
+# Go into the examples/ directory, where stag reads schemas and writes modules.
+run_checked cd $REPO/examples
 
-# Run python's type checker on the generated code.
-for module in $FILES; do
-    run_checked mypy --strict $module
-done
+# Without any arguments, run stag once on all libraries in this directory, and
+# then check each library's modules.
+if [ -z "$library" ]; then
+    libs=""
+    for schema in *.xsd; do
+        libs="$libs ${schema%.*}"
+    done
+    run_checked racket $REPO/src/stag/main.rkt --jobs "$(nproc)" "$@" *.xsd
+    for lib in $libs; do
+        check_library "$lib"
+    done
+    exit 0
+fi
 
-# Run the generated modules in a python interpreter.
-for module in $FILES; do
-    run_checked python3.6 $module
-done
+run_checked racket $REPO/src/stag/main.rkt "$@" $library.xsd
+check_library "$library"
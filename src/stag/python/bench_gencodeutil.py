@@ -0,0 +1,1268 @@
+'''benchmarks of gencodeutil
+
+Run one or more benchmarks by name, e.g.
+
+    $ python3 bench_gencodeutil.py columnar
+
+or run all of them by naming none. Each benchmark prints one line per
+measurement. The types below are written the way stag would generate them.
+'''
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import gencodeutil
+
+import datetime
+import enum
+import json
+import os
+import pickle
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing
+
+
+class Side(enum.Enum):
+    BUY = 0
+    SELL = 1
+
+
+class Trade(gencodeutil.Sequence):
+    symbol: str
+    side: "Side"
+    price: float
+    size: int
+    time: datetime.datetime
+    venue: typing.Optional[str] = None
+    flags: typing.List[str] = []
+
+    def __init__(self,
+                 *,
+                 symbol: str,
+                 side: "Side",
+                 price: float,
+                 size: int,
+                 time: datetime.datetime,
+                 venue: typing.Optional[str] = None,
+                 flags: typing.List[str] = []) -> None:
+        gencodeutil.Sequence.__init__(**locals())
+
+
+_name_mappings = {
+    Side: gencodeutil.NameMapping({
+        'BUY': 'Buy',
+        'SELL': 'Sell'
+    }),
+    Trade: gencodeutil.NameMapping({
+        'symbol': 'Symbol',
+        'side': 'Side',
+        'price': 'Price',
+        'size': 'Size',
+        'time': 'Time',
+        'venue': 'Venue',
+        'flags': 'Flags'
+    }, {
+        'size': 'unsignedInt',
+        'flags': 'token'
+    })
+}
+
+_class_by_name = {klass.__name__: klass for klass in _name_mappings}
+
+
+def to_jsonable(obj: Any) -> Any:
+    return gencodeutil.to_jsonable(obj, _name_mappings)
+
+
+def from_jsonable(return_type: Any, obj: Any) -> Any:
+    return gencodeutil.from_jsonable(return_type, obj, _name_mappings,
+                                     _class_by_name)
+
+
+def make_trades(count: int) -> List[Trade]:
+    """Return the specified 'count' of deterministic 'Trade' objects."""
+    start = datetime.datetime(2020, 3, 1, 9, 30, tzinfo=datetime.timezone.utc)
+    return [
+        Trade(
+            symbol=('IBM', 'AAPL', 'MSFT')[i % 3],
+            side=Side(i % 2),
+            price=100 + (i % 1000) / 100,
+            size=(i % 50 + 1) * 100,
+            time=start + datetime.timedelta(microseconds=i * 1500),
+            venue='XNYS' if i % 4 else None,
+            flags=['odd-lot'] if i % 7 == 0 else []) for i in range(count)
+    ]
+
+
+def best_time(func: Callable[[], Any], repeat: int = 3) -> float:
+    """Return the fastest of the specified 'repeat' number of wall times,
+    in seconds, taken to call the specified 'func'.
+    """
+    times = []
+    for _ in range(repeat):
+        before = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - before)
+    return min(times)
+
+
+def retained_bytes(build: Callable[[], Any]) -> int:
+    """Return how many bytes of memory remain allocated by the object that
+    the specified 'build' returns.
+    """
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = build()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return after - before
+
+
+def report(name: str, value: float, unit: str) -> None:
+    print(f'{name:<48} {value:>14.3f} {unit}')
+
+
+def bench_columnar(count: int = 100000) -> None:
+    trades = make_trades(count)
+    lines = [json.dumps(to_jsonable(trade)) for trade in trades]
+
+    def rows_from_jsonl() -> List[Trade]:
+        return [from_jsonable(Trade, json.loads(line)) for line in lines]
+
+    def columns_from_records() -> gencodeutil.Columns:
+        return gencodeutil.Columns.from_records(Trade, trades, _name_mappings,
+                                                _class_by_name)
+
+    def columns_from_jsonl() -> gencodeutil.Columns:
+        return gencodeutil.Columns.from_jsonl(Trade, lines, _name_mappings,
+                                              _class_by_name)
+
+    columns = columns_from_records()
+    report(f'columnar: rows retained ({count} records)',
+           retained_bytes(rows_from_jsonl) / 2**20, 'MiB')
+    report(f'columnar: columns retained ({count} records)',
+           retained_bytes(columns_from_jsonl) / 2**20, 'MiB')
+    report('columnar: JSON Lines -> rows',
+           count / best_time(rows_from_jsonl), 'records/s')
+    report('columnar: JSON Lines -> columns',
+           count / best_time(columns_from_jsonl), 'records/s')
+    report('columnar: rows -> columns',
+           count / best_time(columns_from_records), 'records/s')
+    report('columnar: columns -> rows',
+           count / best_time(columns.to_records), 'records/s')
+    report('columnar: sum(price) over rows',
+           count / best_time(lambda: sum(trade.price for trade in trades)),
+           'records/s')
+    report('columnar: sum(price) over column',
+           count / best_time(lambda: sum(columns['Price'].values)),
+           'records/s')
+
+
+def bench_record_file(count: int = 100000) -> None:
+    trades = make_trades(count)
+    with tempfile.TemporaryDirectory() as directory:
+        jsonl_path = os.path.join(directory, 'trades.jsonl')
+        records_path = os.path.join(directory, 'trades.rec')
+        with open(jsonl_path, 'w') as file:
+            for trade in trades:
+                file.write(json.dumps(to_jsonable(trade)) + '\n')
+
+        def write_records() -> None:
+            with gencodeutil.RecordFileWriter(records_path, Trade,
+                                              _class_by_name) as writer:
+                for trade in trades:
+                    writer.write(trade)
+
+        def load_jsonl() -> List[Trade]:
+            with open(jsonl_path) as file:
+                return [from_jsonable(Trade, json.loads(line)) for line in file]
+
+        def open_records() -> None:
+            gencodeutil.RecordFile(records_path, Trade, _class_by_name).close()
+
+        indices = [random.randrange(count) for _ in range(1000)]
+
+        def read_random() -> None:
+            with gencodeutil.RecordFile(records_path, Trade,
+                                        _class_by_name) as records:
+                for i in indices:
+                    records[i]
+
+        report('record file: write', count / best_time(write_records),
+               'records/s')
+        report('record file: size / JSON Lines size',
+               os.path.getsize(records_path) / os.path.getsize(jsonl_path),
+               'ratio')
+        report('record file: load whole JSON Lines file',
+               best_time(load_jsonl) * 1000, 'ms')
+        report('record file: open', best_time(open_records) * 1000, 'ms')
+        report('record file: open and read 1000 random records',
+               best_time(read_random) * 1000, 'ms')
+
+        def scan_decoded() -> float:
+            with gencodeutil.RecordFile(records_path, Trade,
+                                        _class_by_name) as records:
+                return sum(trade.price for trade in records)
+
+        def scan_views() -> float:
+            with gencodeutil.RecordFile(records_path, Trade,
+                                        _class_by_name) as records:
+                return sum(records.view(i).price for i in range(count))
+
+        report('record file: sum(price), decoding records',
+               count / best_time(scan_decoded), 'records/s')
+        report('record file: sum(price), viewing records',
+               count / best_time(scan_views), 'records/s')
+
+
+class Samples(gencodeutil.Sequence):
+    channel: str
+    values: typing.List[float] = []
+
+    def __init__(self,
+                 *,
+                 channel: str,
+                 values: typing.List[float] = []) -> None:
+        gencodeutil.Sequence.__init__(**locals())
+
+
+class PackedSamples(gencodeutil.Sequence):
+    channel: str
+    values: gencodeutil.Float64Array = gencodeutil.Float64Array()
+
+    def __init__(self,
+                 *,
+                 channel: str,
+                 values: gencodeutil.Float64Array = gencodeutil.Float64Array()
+                 ) -> None:
+        gencodeutil.Sequence.__init__(**locals())
+
+
+_samples_mappings = {
+    Samples: gencodeutil.NameMapping({
+        'channel': 'channel',
+        'values': 'values'
+    }),
+    PackedSamples: gencodeutil.NameMapping({
+        'channel': 'channel',
+        'values': 'values'
+    })
+}
+
+
+def bench_numeric_arrays(count: int = 1000000) -> None:
+    text = json.dumps({'channel': 'a', 'values': [i / 8 for i in range(count)]})
+
+    def decode_list() -> Samples:
+        return gencodeutil.from_jsonable(Samples, json.loads(text),
+                                         _samples_mappings, _class_by_name)
+
+    def decode_array() -> PackedSamples:
+        return gencodeutil.from_jsonable(PackedSamples, json.loads(text),
+                                         _samples_mappings, _class_by_name)
+
+    packed = decode_array()
+    report(f'numeric arrays: list retained ({count} doubles)',
+           retained_bytes(decode_list) / 2**20, 'MiB')
+    report(f'numeric arrays: array retained ({count} doubles)',
+           retained_bytes(decode_array) / 2**20, 'MiB')
+    report('numeric arrays: decode into list',
+           count / best_time(decode_list), 'values/s')
+    report('numeric arrays: decode into array',
+           count / best_time(decode_array), 'values/s')
+    report('numeric arrays: encode array',
+           count / best_time(lambda: gencodeutil.to_jsonable(
+               packed, _samples_mappings)), 'values/s')
+    report('numeric arrays: binary round trip',
+           count / best_time(lambda: gencodeutil.decode_binary(
+               PackedSamples, gencodeutil.encode_binary(
+                   packed, _class_by_name), _class_by_name)), 'values/s')
+
+
+def bench_decoder_options(count: int = 100000) -> None:
+    jsonables = [to_jsonable(trade) for trade in make_trades(count)]
+    limits = gencodeutil.DecoderOptions(max_depth=8,
+                                        max_list_length=100,
+                                        max_string_length=1000,
+                                        max_elements=1000)
+
+    def decode(options: Any) -> None:
+        for obj in jsonables:
+            gencodeutil.from_jsonable(Trade, obj, _name_mappings,
+                                      _class_by_name, options=options)
+
+    unlimited = best_time(lambda: decode(None), repeat=7)
+    limited = best_time(lambda: decode(limits), repeat=7)
+    report('decoder options: no options', count / unlimited, 'records/s')
+    report('decoder options: all limits', count / limited, 'records/s')
+    report('decoder options: overhead', (limited / unlimited - 1) * 100, '%')
+
+
+def bench_validation(count: int = 100000) -> None:
+    jsonables = [to_jsonable(trade) for trade in make_trades(count)]
+
+    def decode(options: Any) -> None:
+        for obj in jsonables:
+            gencodeutil.from_jsonable(Trade, obj, _name_mappings,
+                                      _class_by_name, options=options)
+
+    baseline = best_time(lambda: decode(None))
+    report('validation: no options', count / baseline, 'records/s')
+    for validation in gencodeutil.DecoderOptions.VALIDATION_LEVELS:
+        options = gencodeutil.DecoderOptions(validation=validation)
+        elapsed = best_time(lambda: decode(options))
+        report(f'validation: {repr(validation)}', count / elapsed,
+               'records/s')
+        report(f'validation: {repr(validation)} speedup', baseline / elapsed,
+               'ratio')
+
+
+class PlainTrade:
+    """'Trade' without 'gencodeutil.Sequence', so that it is pickled the
+    default way, for comparison with 'Sequence.__reduce_ex__'.
+    """
+
+
+def plain_trade(trade: Trade) -> PlainTrade:
+    result = PlainTrade()
+    result.__dict__.update(trade.__dict__)
+    return result
+
+
+def bench_pickle(count: int = 100000) -> None:
+    trades = make_trades(count)
+
+    def dumps(obj: Any) -> bytes:
+        return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+    for name, records in (('default', [plain_trade(t) for t in trades]),
+                          ('compact', trades)):
+        pickled = dumps(records)
+        report(f'pickle: {name} size per record', len(pickled) / count,
+               'bytes')
+        report(f'pickle: {name} dumps',
+               count / best_time(lambda: dumps(records)), 'records/s')
+        report(f'pickle: {name} loads',
+               count / best_time(lambda: pickle.loads(pickled)), 'records/s')
+        # Each record pickled alone, as when sent through a queue
+        some = records[:10000]
+        report(f'pickle: {name} size, one record per pickle',
+               sum(len(dumps(record)) for record in some) / len(some),
+               'bytes')
+        report(f'pickle: {name} round trip, one record per pickle',
+               len(some) / best_time(lambda: [pickle.loads(dumps(record))
+                                              for record in some]),
+               'records/s')
+
+
+class DictChoice:
+    """The previous implementation of 'gencodeutil.Choice', which stored the
+    selection name and the value in the instance's '__dict__', for
+    comparison.
+    """
+    _selection: str
+
+    def __init__(self, **kwarg: Any) -> None:
+        (attr, value), = kwarg.items()
+        setattr(self, attr, value)
+
+    def __setattr__(self, attr: str, value: Any) -> None:
+        if attr not in self.__annotations__:
+            raise AttributeError(attr)
+        super().__setattr__('_selection', attr)
+        super().__setattr__(attr, value)
+
+
+class Quote(gencodeutil.Choice):
+    bid: float
+    ask: float
+    trade: "Trade"
+
+    __slots__ = ()
+    SELECTION_ID_BID = 0
+    SELECTION_ID_ASK = 1
+    SELECTION_ID_TRADE = 2
+
+    def __init__(self, **kwarg: typing.Union[float, "Trade"]) -> None:
+        gencodeutil.Choice.__init__(self, **kwarg)
+
+
+class DictQuote(DictChoice):
+    bid: float
+    ask: float
+    trade: "Trade"
+
+
+_name_mappings[Quote] = _name_mappings[DictQuote] = gencodeutil.NameMapping({
+    'bid': 'Bid',
+    'ask': 'Ask',
+    'trade': 'Trade'
+})
+
+
+def bench_choice(count: int = 100000) -> None:
+    trade = make_trades(1)[0]
+    kwargs = [{'bid': 1.0}, {'ask': 2.0}, {'trade': trade}]
+    kwargs = [kwargs[i % 3] for i in range(count)]
+
+    def if_elif(quote: Any) -> Any:
+        if quote._selection == 'bid':
+            return quote.bid
+        elif quote._selection == 'ask':
+            return quote.ask
+        else:
+            return quote.trade.price
+
+    def if_elif_id(quote: Any) -> Any:
+        if quote._selection_id == Quote.SELECTION_ID_BID:
+            return quote._value
+        elif quote._selection_id == Quote.SELECTION_ID_ASK:
+            return quote._value
+        else:
+            return quote._value.price
+
+    handlers = {
+        Quote.SELECTION_ID_BID: lambda bid: bid,
+        Quote.SELECTION_ID_ASK: lambda ask: ask,
+        Quote.SELECTION_ID_TRADE: lambda trade: trade.price
+    }
+
+    # The 'Choice' branch of 'to_jsonable' for each implementation, so that
+    # both are measured the same way.
+    def dict_to_jsonable(quote: DictQuote) -> Any:
+        py_to_schema = _name_mappings[DictQuote].py_to_schema
+        return {
+            py_to_schema[quote._selection]:
+            to_jsonable(getattr(quote, quote._selection))
+        }
+
+    def compact_to_jsonable(quote: Quote) -> Any:
+        mapping = _name_mappings[Quote]
+        elements = mapping.selection_elements or \
+            gencodeutil._selection_elements(mapping, Quote)
+        return {elements[quote._selection_id]: to_jsonable(quote._value)}
+
+    for name, klass, encode in (('dict', DictQuote, dict_to_jsonable),
+                                ('compact', Quote, compact_to_jsonable)):
+        quotes = [klass(**kwarg) for kwarg in kwargs]
+        report(f'choice: {name} construct',
+               count / best_time(lambda: [klass(**kwarg) for kwarg in kwargs]),
+               'choices/s')
+        report(f'choice: {name} retained',
+               retained_bytes(lambda: [klass(**kwarg) for kwarg in kwargs]) /
+               count, 'bytes/choice')
+        report(f'choice: {name} if/elif on _selection',
+               count / best_time(lambda: [if_elif(q) for q in quotes]),
+               'choices/s')
+        report(f'choice: {name} encode selection',
+               count / best_time(lambda: [encode(q) for q in quotes]),
+               'choices/s')
+    report('choice: compact if/elif on _selection_id',
+           count / best_time(lambda: [if_elif_id(q) for q in quotes]),
+           'choices/s')
+    report('choice: compact dispatch',
+           count / best_time(lambda: [gencodeutil.dispatch(q, handlers)
+                                      for q in quotes]), 'choices/s')
+    report('choice: compact to_jsonable',
+           count / best_time(lambda: [to_jsonable(q) for q in quotes]),
+           'choices/s')
+
+
+def bench_datetime_encoding(count: int = 100000) -> None:
+    trades = make_trades(count)
+    times = [trade.time for trade in trades]
+    report('datetime_encoding: isoformat',
+           count / best_time(lambda: [value.isoformat() for value in times]),
+           'values/s')
+    for precision in gencodeutil.DatetimeEncoder.PRECISIONS:
+        encoder = gencodeutil.DatetimeEncoder(precision)
+        report(f'datetime_encoding: DatetimeEncoder, precision {precision}',
+               count / best_time(lambda: [encoder.encode(value)
+                                          for value in times]), 'values/s')
+    # A trade has one timestamp among five other fields.
+    options = gencodeutil.EncoderOptions(datetime_precision=3)
+    report('datetime_encoding: trades to_jsonable',
+           count / best_time(lambda: [to_jsonable(trade)
+                                      for trade in trades]), 'objects/s')
+    report('datetime_encoding: trades to_jsonable, precision 3',
+           count / best_time(lambda: [
+               gencodeutil.to_jsonable(trade, _name_mappings, options)
+               for trade in trades]), 'objects/s')
+
+
+class EncoderConfig(gencodeutil.Sequence):
+    name: str
+    trace_level: int = 0
+    bde_version_conformance: int = 10500
+    encode_empty_arrays: bool = True
+    encode_date_and_time_types_as_binary: bool = False
+    datetime_fractional_second_precision: int = 3
+    overrides: typing.List[str] = []
+
+    def __init__(self,
+                 *,
+                 name: str,
+                 trace_level: int = 0,
+                 bde_version_conformance: int = 10500,
+                 encode_empty_arrays: bool = True,
+                 encode_date_and_time_types_as_binary: bool = False,
+                 datetime_fractional_second_precision: int = 3,
+                 overrides: typing.List[str] = []) -> None:
+        gencodeutil.Sequence.__init__(**locals())
+
+
+_config_name_mappings = {
+    EncoderConfig: gencodeutil.NameMapping({
+        'name': 'Name',
+        'trace_level': 'TraceLevel',
+        'bde_version_conformance': 'BdeVersionConformance',
+        'encode_empty_arrays': 'EncodeEmptyArrays',
+        'encode_date_and_time_types_as_binary':
+        'EncodeDateAndTimeTypesAsBinary',
+        'datetime_fractional_second_precision':
+        'DatetimeFractionalSecondPrecision',
+        'overrides': 'Overrides'
+    })
+}
+
+
+def bench_elision(count: int = 100000) -> None:
+    # Most fields of most configuration records have their defaults.
+    configs = [
+        EncoderConfig(name=f'service-{i}',
+                      trace_level=i % 5 // 4,
+                      overrides=['verbose'] if i % 10 == 0 else [])
+        for i in range(count)
+    ]
+    for name, options in (
+            ('nothing', None),
+            ('empty arrays', gencodeutil.EncoderOptions(
+                omit_empty_arrays=True)),
+            ('defaults, empty arrays', gencodeutil.EncoderOptions(
+                omit_defaults=True, omit_empty_arrays=True))):
+
+        def encode() -> List[Any]:
+            return [gencodeutil.to_jsonable(config, _config_name_mappings,
+                                            options) for config in configs]
+
+        size = sum(len(json.dumps(obj)) for obj in encode())
+        report(f'elision: omit {name}, size', size / count, 'bytes/object')
+        report(f'elision: omit {name}, to_jsonable',
+               count / best_time(encode), 'objects/s')
+
+
+class Blotter(gencodeutil.Sequence):
+    trades: typing.List["Trade"] = []
+
+    def __init__(self, *, trades: typing.List["Trade"] = []) -> None:
+        gencodeutil.Sequence.__init__(**locals())
+
+
+_name_mappings[Blotter] = gencodeutil.NameMapping({'trades': 'Trades'})
+_class_by_name['Blotter'] = Blotter
+
+
+def stream_loopback(messages: List[Any],
+                    return_type: Any,
+                    payload: Optional[bytes] = None,
+                    **kwargs: Any) -> Tuple[float, float]:
+    """Return the seconds taken to send the specified 'messages' over a
+    local TCP connection with 'encode_stream' and to receive them as
+    instances of the specified 'return_type' with 'decode_stream', and the
+    longest that the event loop was kept from running a timer meanwhile.
+    Optionally specify a 'payload' holding the already framed 'messages' to
+    send it as is, so that encoding does not delay the event loop. Pass the
+    optionally specified 'kwargs' to 'decode_stream', except for 'framing',
+    which is passed to both.
+    """
+    import asyncio
+
+    framing = kwargs.get('framing', 'lines')
+
+    async def run() -> Tuple[float, float]:
+        received = 0
+        done = asyncio.Event()
+        max_lag = 0.0
+
+        async def monitor() -> None:
+            nonlocal max_lag
+            while not done.is_set():
+                before = time.perf_counter()
+                await asyncio.sleep(0.001)
+                max_lag = max(max_lag, time.perf_counter() - before - 0.001)
+
+        async def serve(reader: Any, writer: Any) -> None:
+            nonlocal received
+            async for _ in gencodeutil.decode_stream(return_type, reader,
+                                                     _name_mappings,
+                                                     _class_by_name,
+                                                     **kwargs):
+                received += 1
+            writer.close()
+            done.set()
+
+        server = await asyncio.start_server(serve, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        lag_task = asyncio.create_task(monitor())
+        before = time.perf_counter()
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        if payload is None:
+            await gencodeutil.encode_stream(messages, writer, _name_mappings,
+                                            framing=framing)
+        else:
+            writer.write(payload)
+            await writer.drain()
+        writer.close()
+        await done.wait()
+        elapsed = time.perf_counter() - before
+        await lag_task
+        server.close()
+        assert received == len(messages)
+        return elapsed, max_lag
+
+    return asyncio.run(run())
+
+
+def bench_streams(count: int = 50000, big: int = 20) -> None:
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    trades = make_trades(count)
+    for framing in gencodeutil.STREAM_FRAMINGS:
+        seconds, _ = stream_loopback(trades, Trade, framing=framing)
+        report(f'streams: {framing} small messages', count / seconds,
+               'messages/s')
+    # messages of about 1 MB each, framed ahead of time
+    blotters = [Blotter(trades=trades[:5000]) for _ in range(big)]
+    payload = b''.join(
+        json.dumps(gencodeutil.to_jsonable(blotter, _name_mappings),
+                   separators=(',', ':')).encode() + b'\n'
+        for blotter in blotters)
+    # 'spawn' keeps the workers clear of the event loop's threads and sockets.
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(2, mp_context=context) as processes:
+        for name, kwargs in (('on event loop', {
+                'offload_size': None
+        }), ('thread executor', {}), ('process executor', {
+                'executor': processes
+        })):
+            seconds, lag = stream_loopback(blotters, Blotter, payload,
+                                           **kwargs)
+            report(f'streams: large messages, {name}', big / seconds,
+                   'messages/s')
+            report(f'streams: large messages, {name}, max lag', lag * 1000,
+                   'ms')
+
+
+def bench_jsonl(count: int = 50000) -> None:
+    trades = make_trades(count)
+    directory = tempfile.mkdtemp()
+    try:
+        for extension in ('.gz', '.xz'):
+            path = os.path.join(directory, 'trades.jsonl' + extension)
+
+            def serial_write() -> None:
+                with gencodeutil.open_compressed(path, 'wb') as file:
+                    for trade in trades:
+                        file.write(json.dumps(to_jsonable(trade)).encode() +
+                                   b'\n')
+
+            def pipelined_write() -> None:
+                with gencodeutil.JsonLinesWriter(path,
+                                                 _name_mappings) as writer:
+                    writer.write_all(trades)
+
+            def serial_read() -> None:
+                with gencodeutil.open_compressed(path) as file:
+                    for line in file:
+                        from_jsonable(Trade, json.loads(line))
+
+            def pipelined_read() -> None:
+                for _ in gencodeutil.JsonLinesReader(path, Trade,
+                                                     _name_mappings,
+                                                     _class_by_name):
+                    pass
+
+            for name, func in (('serial write', serial_write),
+                               ('pipelined write', pipelined_write),
+                               ('serial read', serial_read),
+                               ('pipelined read', pipelined_read)):
+                report(f'jsonl{extension}: {name}',
+                       count / best_time(func, 1), 'objects/s')
+
+            reader = gencodeutil.JsonLinesReader(path, Trade, _name_mappings,
+                                                 _class_by_name)
+            for _ in reader:
+                pass
+            for stage in reader.statistics():
+                report(f'jsonl{extension}: {stage.name} stage',
+                       stage.items_per_second(), 'lines/s')
+                report(f'jsonl{extension}: {stage.name} stage, waiting',
+                       stage.wait_seconds, 's')
+    finally:
+        shutil.rmtree(directory)
+
+
+def flatten(obj: Any, prefix: str, row: Dict[str, Any]) -> None:
+    """Add to the specified 'row' the leaves of the specified JSON-compatible
+    'obj', keyed by their period-separated paths after the specified
+    'prefix', the way tables were flattened before 'TableWriter'.
+    """
+    for key, value in obj.items():
+        if isinstance(value, dict):
+            flatten(value, f'{prefix}{key}.', row)
+        elif isinstance(value, list):
+            row[prefix + key] = '|'.join(str(item) for item in value)
+        else:
+            row[prefix + key] = value
+
+
+def bench_tables(count: int = 100000) -> None:
+    import csv
+    import io
+
+    trades = make_trades(count)
+    columns = gencodeutil.TableWriter(io.StringIO(), Trade, _name_mappings,
+                                      _class_by_name).columns
+
+    def ad_hoc() -> str:
+        file = io.StringIO(newline='')
+        writer = csv.DictWriter(file, columns)
+        writer.writeheader()
+        for trade in trades:
+            row: Dict[str, Any] = {}
+            flatten(to_jsonable(trade), '', row)
+            writer.writerow(row)
+        return file.getvalue()
+
+    def table_writer() -> str:
+        file = io.StringIO(newline='')
+        gencodeutil.TableWriter(file, Trade, _name_mappings,
+                                _class_by_name).write_all(trades)
+        return file.getvalue()
+
+    table = table_writer()
+    assert ad_hoc().splitlines()[0] == table.splitlines()[0]
+
+    def table_reader() -> None:
+        for _ in gencodeutil.TableReader(io.StringIO(table, newline=''),
+                                         Trade, _name_mappings,
+                                         _class_by_name):
+            pass
+
+    report('tables: to_jsonable and flatten', count / best_time(ad_hoc),
+           'records/s')
+    report('tables: TableWriter', count / best_time(table_writer),
+           'records/s')
+    report('tables: TableReader', count / best_time(table_reader),
+           'records/s')
+
+
+def import_environment(*paths: str) -> Dict[str, str]:
+    """Return environment variables for a python subprocess that imports
+    modules from the specified 'paths' and caches their bytecode, so that
+    import times measured after the first run exclude compilation.
+    """
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(paths))
+    environment.pop('PYTHONDONTWRITEBYTECODE', None)
+    return environment
+
+
+def enum_module_source(base: str, count: int) -> str:
+    """Return the source of a module defining an enumeration derived from the
+    specified 'base' that has the specified 'count' of values, together with
+    the 'NameMapping' and 'EnumMapping' that stag would generate for it.
+    """
+    members = ''.join(f'    VALUE_{i} = {i}\n' for i in range(count))
+    pairs = ''.join(f"    'VALUE_{i}': 'value-{i}',\n" for i in range(count))
+    return (f'import enum\nimport gencodeutil\n\n'
+            f'class Big({base}):\n{members}\n'
+            f'PY_TO_SCHEMA = {{\n{pairs}}}\n\n'
+            f'NAME_MAPPING = gencodeutil.NameMapping(PY_TO_SCHEMA)\n'
+            f'ENUM_MAPPING = gencodeutil.EnumMapping(Big, PY_TO_SCHEMA)\n')
+
+
+def bench_enums(count: int = 100000, values: int = 5000) -> None:
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as directory:
+        for name, base in (('enum', 'enum.Enum'), ('int-enum', 'enum.IntEnum')):
+            module = f'bigenum_{name.replace("-", "_")}'
+            with open(os.path.join(directory, module + '.py'), 'w') as file:
+                file.write(enum_module_source(base, values))
+            script = ('import time; before = time.perf_counter(); '
+                      f'import {module}; '
+                      'print(time.perf_counter() - before)')
+            environment = import_environment(directory, here)
+            # The first run compiles; take the best of the rest.
+            seconds = min(
+                float(subprocess.run([sys.executable, '-c', script],
+                                     env=environment, check=True,
+                                     capture_output=True, text=True).stdout)
+                for _ in range(4))
+            report(f'enums: {name} import, {values} values', seconds * 1000,
+                   'ms')
+
+            sys.path.insert(0, directory)
+            try:
+                generated = __import__(module)
+            finally:
+                sys.path.remove(directory)
+            members = [generated.Big(i % values) for i in range(count)]
+            for mapping_name, mapping in (
+                    ('NameMapping', generated.NAME_MAPPING),
+                    ('EnumMapping', generated.ENUM_MAPPING)):
+                name_mappings = {generated.Big: mapping}
+                class_by_name = {'Big': generated.Big}
+                encoded = [gencodeutil.to_jsonable(member, name_mappings)
+                           for member in members]
+                report(f'enums: {name} {mapping_name} to_jsonable',
+                       count / best_time(lambda: [
+                           gencodeutil.to_jsonable(member, name_mappings)
+                           for member in members]), 'values/s')
+                report(f'enums: {name} {mapping_name} from_jsonable',
+                       count / best_time(lambda: [
+                           gencodeutil.from_jsonable(generated.Big, value,
+                                                     name_mappings,
+                                                     class_by_name)
+                           for value in encoded]), 'values/s')
+
+
+
+def schema_module_sources(index: int,
+                          runtime: str,
+                          shared: bool,
+                          records: int = 4,
+                          fast: bool = False) -> Dict[str, str]:
+    """Return a 'dict' from module name to source code of the modules that
+    stag would generate for the schema having the specified 'index', where
+    the generated code imports the specified 'runtime' module, which is
+    'shared' by all schemas or else is a private copy. Each schema defines
+    an enumeration, a choice, and the optionally specified number of
+    'records' sequences. Optionally specify 'fast' to generate the modules
+    as stag's '--fast-import' option does.
+    """
+    types = f'schema{index}msg'
+    kind = f'class Kind{index}(enum.Enum):\n    A = 0\n    B = 1\n'
+    metadata = ("    _required = ('id', 'kind')\n"
+                "    _mutable_defaults = ('tags',)\n\n" if fast else '')
+    classes = {}
+    for number in range(records):
+        name = f'Record{index}_{number}'
+        classes[name] = (
+            f'class {name}(gencodeutil.Sequence):\n'
+            f'    id: int\n'
+            f'    kind: "Kind{index}"\n'
+            f'    name: typing.Optional[str] = None\n'
+            f'    tags: typing.List[str] = []\n\n'
+            f'{metadata}'
+            f'    def __init__(self, *, id: int, kind: "Kind{index}",\n'
+            f'                 name: typing.Optional[str] = None,\n'
+            f'                 tags: typing.List[str] = []) -> None:\n'
+            f'        gencodeutil.Sequence.__init__(**locals())\n')
+    classes[f'Either{index}'] = (
+        f'class Either{index}(gencodeutil.Choice):\n'
+        f'    first: "Record{index}_0"\n'
+        f'    second: "Record{index}_1"\n\n'
+        f'    __slots__ = ()\n'
+        f'    SELECTION_ID_FIRST = 0\n'
+        f'    SELECTION_ID_SECOND = 1\n\n'
+        f'    def __init__(self, **kwarg) -> None:\n'
+        f'        gencodeutil.Choice.__init__(self, **kwarg)\n')
+    check = (f'gencodeutil.check_runtime_version('
+             f'{gencodeutil.RUNTIME_VERSION}, "benchmark")\n\n'
+             if shared else '')
+    names = [f'Kind{index}', *classes]
+    if fast:
+        definitions = [kind] + [
+            f'def _define_{name}() -> type:\n' +
+            ''.join(f'    {line}\n' if line else '\n'
+                    for line in source.splitlines()) + f'    return {name}\n'
+            for name, source in classes.items()
+        ] + [
+            '_lazy_classes = {\n' +
+            ''.join(f"    '{name}': _define_{name},\n" for name in classes) +
+            '}\n',
+            'def __getattr__(name: str) -> type:\n'
+            '    return gencodeutil.lazy_class(globals(), name)\n'
+        ]
+        mappings = ''.join(f"    '{name}': gencodeutil.NameMapping({{}}),\n"
+                           for name in names)
+        util = (f'_name_mappings = gencodeutil.LazyNameMappings({types}, {{\n'
+                f'{mappings}}})\n\n'
+                f'_class_by_name = gencodeutil.LazyClassesByName(\n'
+                f'    {types}, _name_mappings.mappings_by_name)\n')
+    else:
+        definitions = [kind, *classes.values()]
+        mappings = ''.join(
+            f'    {types}.{name}: gencodeutil.NameMapping({{}}),\n'
+            for name in names)
+        util = (f'_name_mappings = {{\n{mappings}}}\n\n'
+                f'_class_by_name = {{\n'
+                f'    klass.__name__: klass for klass in _name_mappings\n'
+                f'}}\n')
+    return {
+        types: (f'import {runtime} as gencodeutil\nimport enum\n'
+                f'import typing\n\n{check}' + '\n\n'.join(definitions)),
+        f'{types}util': (f'import {runtime} as gencodeutil\n'
+                         f'import {types}\n\n{util}')
+    }
+
+
+def bench_shared_runtime(schemas: int = 60) -> None:
+    here = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(here, 'gencodeutil.py')) as file:
+        runtime_source = file.read()
+    script = (
+        'import re, sys, time\n'
+        'def rss():\n'
+        '    with open("/proc/self/status") as status:\n'
+        '        return int(re.search(r"VmRSS:\\s+(\\d+)",\n'
+        '                             status.read()).group(1)) * 1024\n'
+        'before, rss_before = time.perf_counter(), rss()\n'
+        f'for i in range({schemas}):\n'
+        '    __import__(f"schema{i}msgutil")\n'
+        'print(time.perf_counter() - before, rss() - rss_before)\n')
+    for name, shared in (('private copies', False),
+                         ('shared runtime', True)):
+        with tempfile.TemporaryDirectory() as directory:
+            for index in range(schemas):
+                runtime = 'gencodeutil' if shared else f'_schema{index}msg'
+                sources = schema_module_sources(index, runtime, shared)
+                if not shared:
+                    sources[runtime] = runtime_source
+                for module, source in sources.items():
+                    with open(os.path.join(directory, module + '.py'),
+                              'w') as file:
+                        file.write(source)
+            environment = import_environment(directory, here)
+            # The first run compiles to bytecode; take the best of the rest.
+            runs = [
+                subprocess.run([sys.executable, '-c', script],
+                               env=environment, check=True,
+                               capture_output=True,
+                               text=True).stdout.split()
+                for _ in range(4)
+            ][1:]
+            report(f'shared_runtime: {name} import, {schemas} schemas',
+                   min(float(seconds) for seconds, _ in runs) * 1000, 'ms')
+            report(f'shared_runtime: {name} RSS, {schemas} schemas',
+                   min(int(rss) for _, rss in runs) / 2**20, 'MiB')
+
+
+
+def bench_fast_import(records: int = 1000) -> None:
+    here = os.path.dirname(os.path.abspath(__file__))
+    # Import the types of one large schema, and then use one of its classes.
+    script = ('import time\n'
+              'before = time.perf_counter()\n'
+              'import schema0msgutil as util\n'
+              'imported = time.perf_counter()\n'
+              'util._class_by_name["Record0_7"](id=1, kind=util.schema0msg.'
+              'Kind0.A)\n'
+              'print(imported - before, time.perf_counter() - imported)\n')
+    for name, fast in (('default', False), ('fast import', True)):
+        with tempfile.TemporaryDirectory() as directory:
+            sources = schema_module_sources(0, 'gencodeutil', False,
+                                            records, fast)
+            for module, source in sources.items():
+                with open(os.path.join(directory, module + '.py'),
+                          'w') as file:
+                    file.write(source)
+            environment = import_environment(directory, here)
+            # The first run compiles; take the best of the rest.
+            runs = [
+                subprocess.run([sys.executable, '-c', script],
+                               env=environment, check=True,
+                               capture_output=True,
+                               text=True).stdout.split()
+                for _ in range(4)
+            ][1:]
+            report(f'fast_import: {name} import, {records + 2} classes',
+                   min(float(seconds) for seconds, _ in runs) * 1000, 'ms')
+            report(f'fast_import: {name} first use of a class',
+                   min(float(seconds) for _, seconds in runs) * 1000, 'ms')
+            # cumulative microseconds that '-X importtime' reports for the
+            # types module, excluding the runtime
+            importtime = min(
+                int(subprocess.run(
+                    [sys.executable, '-X', 'importtime', '-c',
+                     'import gencodeutil; import schema0msg'],
+                    env=environment, check=True, capture_output=True,
+                    text=True).stderr.splitlines()[-1].split('|')[1])
+                for _ in range(3))
+            report(f'fast_import: {name} -X importtime of types module',
+                   importtime / 1000, 'ms')
+
+
+# the types and util modules that stag would generate for 'Trade' with the
+# '--static-codecs' option
+STATIC_TYPES_SOURCE = """import datetime
+import enum
+import gencodeutil
+import typing
+
+
+class Side(enum.Enum):
+    BUY = 0
+    SELL = 1
+
+
+class Trade(gencodeutil.Sequence):
+    symbol: str
+    side: "Side"
+    price: float
+    size: int
+    time: datetime.datetime
+    venue: typing.Optional[str] = None
+    flags: typing.List[str] = []
+
+    def __init__(self,
+                 *,
+                 symbol: str,
+                 side: "Side",
+                 price: float,
+                 size: int,
+                 time: datetime.datetime,
+                 venue: typing.Optional[str] = None,
+                 flags: typing.List[str] = []) -> None:
+        gencodeutil.Sequence.__init__(**locals())
+"""
+
+STATIC_UTIL_SOURCE = """import trademsg as types
+import gencodeutil
+import typing
+import datetime
+
+
+def to_jsonable(obj: typing.Any, options: typing.Any = None) -> typing.Any:
+    return gencodeutil.static_to_jsonable(obj, _encoders, _name_mappings,
+                                          options)
+
+
+def from_jsonable(return_type: typing.Any,
+                  obj: typing.Any,
+                  only: typing.Any = None,
+                  options: typing.Any = None) -> typing.Any:
+    return gencodeutil.static_from_jsonable(return_type, obj, _decoders,
+                                            _name_mappings, _class_by_name,
+                                            only, options)
+
+
+_name_mappings = {
+    types.Side: gencodeutil.EnumMapping(types.Side, {
+        'BUY': 'Buy',
+        'SELL': 'Sell'
+    }),
+    types.Trade: gencodeutil.NameMapping({
+        'symbol': 'Symbol',
+        'side': 'Side',
+        'price': 'Price',
+        'size': 'Size',
+        'time': 'Time',
+        'venue': 'Venue',
+        'flags': 'Flags'
+    }, {
+        'size': 'unsignedInt',
+        'flags': 'token'
+    })
+}
+
+_class_by_name = {klass.__name__: klass for klass in _name_mappings}
+
+_Side_to_schema: typing.Dict[types.Side, str] = {
+    types.Side.BUY: "Buy",
+    types.Side.SELL: "Sell"
+}
+
+_Side_from_schema: typing.Dict[str, types.Side] = {
+    "Buy": types.Side.BUY,
+    "Sell": types.Side.SELL
+}
+
+
+def _Trade_to_jsonable(obj: types.Trade) -> typing.Dict[str, typing.Any]:
+    result: typing.Dict[str, typing.Any] = {}
+    if obj.symbol is not None:
+        result["Symbol"] = obj.symbol
+    if obj.side is not None:
+        result["Side"] = _Side_to_schema[obj.side]
+    if obj.price is not None:
+        result["Price"] = obj.price
+    if obj.size is not None:
+        result["Size"] = obj.size
+    if obj.time is not None:
+        result["Time"] = obj.time.isoformat()
+    if obj.venue is not None:
+        result["Venue"] = obj.venue
+    if obj.flags is not None:
+        result["Flags"] = list(obj.flags)
+    return result
+
+
+def _Trade_from_jsonable(obj: typing.Any) -> types.Trade:
+    kwargs: typing.Dict[str, typing.Any] = {}
+    for elem, value in obj.items():
+        if elem == "Symbol":
+            kwargs["symbol"] = str(value)
+        elif elem == "Side":
+            kwargs["side"] = _Side_from_schema[value]
+        elif elem == "Price":
+            kwargs["price"] = float(value)
+        elif elem == "Size":
+            kwargs["size"] = int(value)
+        elif elem == "Time":
+            kwargs["time"] = gencodeutil.from_jsonable(
+                datetime.datetime, value, _name_mappings, _class_by_name)
+        elif elem == "Venue":
+            kwargs["venue"] = str(value)
+        elif elem == "Flags":
+            kwargs["flags"] = [str(item0) for item0 in value]
+        else:
+            raise KeyError(elem)
+    return types.Trade(**kwargs)
+
+
+_encoders: typing.Dict[typing.Any, typing.Callable[[typing.Any], typing.Any]] = {
+    types.Side: _Side_to_schema.__getitem__,
+    types.Trade: _Trade_to_jsonable
+}
+
+_decoders: typing.Dict[typing.Any, typing.Callable[[typing.Any], typing.Any]] = {
+    types.Side: _Side_from_schema.__getitem__,
+    "Side": _Side_from_schema.__getitem__,
+    types.Trade: _Trade_from_jsonable,
+    "Trade": _Trade_from_jsonable
+}
+"""
+
+
+def bench_static_codecs(count: int = 100000) -> None:
+    here = os.path.dirname(os.path.abspath(__file__))
+    # Convert trades with the generic codecs and with the static codecs of
+    # the util module, which is compiled by mypyc if it is installed.
+    script = (
+        'import datetime, time, gencodeutil, trademsg, trademsgutil\n'
+        'start = datetime.datetime(2020, 3, 1, 9, 30,\n'
+        '                          tzinfo=datetime.timezone.utc)\n'
+        'trades = [trademsg.Trade(\n'
+        '    symbol=("IBM", "AAPL", "MSFT")[i % 3], side=trademsg.Side(i % 2),\n'
+        '    price=100 + (i % 1000) / 100, size=(i % 50 + 1) * 100,\n'
+        '    time=start + datetime.timedelta(microseconds=i * 1500),\n'
+        '    venue="XNYS" if i % 4 else None,\n'
+        '    flags=["odd-lot"] if i % 7 == 0 else [])\n'
+        f'    for i in range({count})]\n'
+        'def best(func):\n'
+        '    times = []\n'
+        '    for _ in range(3):\n'
+        '        before = time.perf_counter()\n'
+        '        func()\n'
+        '        times.append(time.perf_counter() - before)\n'
+        '    return min(times)\n'
+        'mappings = trademsgutil._name_mappings\n'
+        'classes = trademsgutil._class_by_name\n'
+        'encoded = [trademsgutil.to_jsonable(trade) for trade in trades]\n'
+        'print(best(lambda: [gencodeutil.to_jsonable(trade, mappings)\n'
+        '                    for trade in trades]),\n'
+        '      best(lambda: [gencodeutil.from_jsonable(trademsg.Trade, obj,\n'
+        '                                              mappings, classes)\n'
+        '                    for obj in encoded]),\n'
+        '      best(lambda: [trademsgutil.to_jsonable(trade)\n'
+        '                    for trade in trades]),\n'
+        '      best(lambda: [trademsgutil.from_jsonable(trademsg.Trade, obj)\n'
+        '                    for obj in encoded]))\n')
+    mypyc = shutil.which('mypyc')
+    for name, compile in (('interpreted', False), ('mypyc', True)):
+        if compile and mypyc is None:
+            print('static_codecs: mypyc is not installed; skipping compiled')
+            continue
+        with tempfile.TemporaryDirectory() as directory:
+            for module, source in (('trademsg', STATIC_TYPES_SOURCE),
+                                   ('trademsgutil', STATIC_UTIL_SOURCE)):
+                with open(os.path.join(directory, module + '.py'),
+                          'w') as file:
+                    file.write(source)
+            environment = import_environment(directory, here)
+            if compile:
+                subprocess.run([mypyc, 'trademsgutil.py'],
+                               cwd=directory,
+                               env=dict(environment, MYPYPATH=here),
+                               check=True,
+                               capture_output=True)
+            seconds = [
+                float(value) for value in subprocess.run(
+                    [sys.executable, '-c', script],
+                    env=environment,
+                    check=True,
+                    capture_output=True,
+                    text=True).stdout.split()
+            ]
+        if not compile:
+            report('static_codecs: generic to_jsonable', count / seconds[0],
+                   'objects/s')
+            report('static_codecs: generic from_jsonable',
+                   count / seconds[1], 'objects/s')
+        report(f'static_codecs: {name} static to_jsonable',
+               count / seconds[2], 'objects/s')
+        report(f'static_codecs: {name} static from_jsonable',
+               count / seconds[3], 'objects/s')
+
+
+def bench_memory(count: int = 100000) -> None:
+    trades = make_trades(count)
+    some = trades[:10000]
+    report('memory: sys.getsizeof per record',
+           sum(sys.getsizeof(trade) for trade in some) / len(some), 'bytes')
+    # The whole list, so that strings shared between records count once, as
+    # they do for tracemalloc.
+    report('memory: deep_sizeof per record',
+           gencodeutil.deep_sizeof(trades).total_bytes / count, 'bytes')
+    report('memory: tracemalloc per record',
+           retained_bytes(lambda: make_trades(count)) / count, 'bytes')
+    report('memory: deep_sizeof',
+           len(some) / best_time(lambda: [gencodeutil.deep_sizeof(trade)
+                                          for trade in some]), 'records/s')
+    sampler = gencodeutil.MemorySampler(10000)
+    report('memory: MemorySampler.observe, 1 in 10000',
+           count / best_time(lambda: [sampler.observe(trade)
+                                      for trade in trades]), 'records/s')
+
+
+BENCHMARKS: Dict[str, Callable[[], None]] = {
+    'columnar': bench_columnar,
+    'record_file': bench_record_file,
+    'numeric_arrays': bench_numeric_arrays,
+    'decoder_options': bench_decoder_options,
+    'validation': bench_validation,
+    'pickle': bench_pickle,
+    'choice': bench_choice,
+    'enums': bench_enums,
+    'shared_runtime': bench_shared_runtime,
+    'fast_import': bench_fast_import,
+    'static_codecs': bench_static_codecs,
+    'datetime_encoding': bench_datetime_encoding,
+    'elision': bench_elision,
+    'streams': bench_streams,
+    'jsonl': bench_jsonl,
+    'tables': bench_tables,
+    'memory': bench_memory,
+}
+
+
+def main(names: List[str]) -> None:
+    for name in names or list(BENCHMARKS):
+        if name not in BENCHMARKS:
+            raise SystemExit(f'Unknown benchmark {repr(name)}. Known '
+                             f'benchmarks are: {list(BENCHMARKS)}')
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -5,12 +5,49 @@ classes.
 '''
 
 from enum import Enum
-from typing import Any, Dict, Iterator, List, Mapping, Optional, Set, Tuple, \
-    Type, Union
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, \
+    List, Mapping, Optional, Set, Tuple, Type, Union
 
+import abc
+import array
+import collections
+import collections.abc
+import copy
+import copyreg
 import decimal
 import datetime
+import hashlib
+import json
+import mmap
+import operator
+import os
+import random
 import re
+import struct
+import sys
+import threading
+import time
+
+# version of the interface between generated code and this module, which stag
+# records in modules generated to import a shared runtime (see the
+# '--runtime-module' option). Increment it whenever a change to this module
+# would break code generated against the previous version.
+RUNTIME_VERSION = 1
+
+
+def check_runtime_version(required_version: int,
+                          generator_version: str) -> None:
+    """Raise an 'ImportError' unless the specified 'required_version' is the
+    'RUNTIME_VERSION' of this module. The specified 'generator_version' is the
+    '_code_generator_version' of the module doing the check, and is included
+    in the error message.
+    """
+    if required_version != RUNTIME_VERSION:
+        raise ImportError(
+            f'Generated code requires version {required_version} of the '
+            f'stag runtime module, but {__name__} is version '
+            f'{RUNTIME_VERSION}. Regenerate the code, or install the runtime '
+            f'from the stag that generated it: {generator_version!r}')
 
 
 class Sequence:
@@ -19,35 +56,97 @@ class Sequence:
     """
 
     __required: Set[str]
+    __mutable_defaults: Tuple[str, ...]
+    __mutable_kwdefaults: Tuple[Tuple[str, Any], ...]
 
     def __init_subclass__(cls, **kwargs) -> None:
         super().__init_subclass__()
-        attr_set: Set[str] = set()
-        setattr(cls, '__required', attr_set)
-        for key, value in cls.__annotations__.items():
-            type_str = str(value)
-            if type_str.startswith('typing.Union') and \
-                    type(None) not in value.__args__ and \
-                    not hasattr(cls, key):
-                attr_set.add(key)
-            elif not type_str.startswith('typing.List') and \
-                    not type_str.startswith('typing.Optional') and \
-                    not hasattr(cls, key):
-                attr_set.add(key)
+        # Classes generated with stag's '--fast-import' option spell out
+        # these attributes as literals, sparing their computation here.
+        required = cls.__dict__.get('_required')
+        if required is None:
+            required = [
+                attr for attr, annotation in cls.__annotations__.items()
+                if not hasattr(cls, attr) and not _is_optional(annotation)
+                and getattr(annotation, '__origin__', None) not in (list, List)
+            ]
+        mutable_defaults = cls.__dict__.get('_mutable_defaults')
+        if mutable_defaults is None:
+            mutable_defaults = [
+                attr for attr in cls.__annotations__
+                if isinstance(getattr(cls, attr, None), (list, array.array))
+            ]
+        cls.__required = set(required)
+        cls.__mutable_defaults = tuple(mutable_defaults)
+        # The generated '__init__' passes its own keyword defaults through
+        # 'kwargs', so '__init__' copies those that are mutable, lest
+        # instances share them.
+        kwdefaults = getattr(cls.__init__, '__kwdefaults__', None) or {}
+        cls.__mutable_kwdefaults = tuple(
+            (attr, value) for attr, value in kwdefaults.items()
+            if isinstance(value, (list, array.array)))
 
     def __init__(self, **kwargs: Any) -> None:
         for req in self.__required:
             if req not in kwargs:
                 raise KeyError(f'Required attribute "{req}" missing')
-        # copy list defaults
-        for attr in self.__annotations__.keys():
-            if hasattr(self, attr):
-                value = getattr(self, attr)
-                if isinstance(value, List):
-                    setattr(self, attr, list(value))
+        # copy list (and array) defaults
+        for attr in self.__mutable_defaults:
+            setattr(self, attr, copy.copy(getattr(self, attr)))
+        for attr, default in self.__mutable_kwdefaults:
+            if kwargs.get(attr) is default:
+                kwargs[attr] = copy.copy(default)
         for attr, value in kwargs.items():
             setattr(self, attr, value)
 
+    @classmethod
+    def _trusted(cls, attr_values: Dict[str, Any]) -> Any:
+        """Return an instance of this class having the specified
+        'attr_values', without checking that the required attributes are
+        among them. Attributes not in 'attr_values' have their defaults.
+        """
+        self = cls.__new__(cls)
+        for attr in cls.__mutable_defaults:
+            if attr not in attr_values:
+                setattr(self, attr, copy.copy(getattr(cls, attr)))
+        self.__dict__.update(attr_values)
+        return self
+
+    def __reduce_ex__(self, protocol: Any) -> Tuple[Any, ...]:
+        """Return the attribute values as a tuple in annotation order, with
+        enumerators replaced by their values, so that pickles are compact
+        and unpickling does not invoke '__init__'. See '__setstate__'.
+        """
+        klass = type(self)
+        plan = _pickle_plans.get(klass) or _pickle_plan(klass)
+        values = plan.get_values(self)
+        if plan.enums:
+            values = list(values)
+            for index, enum_class, is_list in plan.enums:
+                value = values[index]
+                if type(value) is enum_class:
+                    values[index] = value._value_
+                else:
+                    values[index] = _enum_to_pickle(value, is_list)
+            values = tuple(values)
+        return copyreg.__newobj__, (klass, ), values
+
+    def __setstate__(self, values: Tuple[Any, ...]) -> None:
+        """Assign the specified attribute 'values' as returned by
+        '__reduce_ex__'.
+        """
+        plan = _pickle_plans.get(type(self)) or _pickle_plan(type(self))
+        attributes = self.__dict__
+        attributes.update(zip(plan.attrs, values))
+        for index, enum_class, is_list in plan.enums:
+            attr = plan.attrs[index]
+            value = attributes[attr]
+            if type(value) is int:
+                attributes[attr] = enum_class._value2member_map_[value]
+            else:
+                attributes[attr] = _enum_from_pickle(value, enum_class,
+                                                     is_list)
+
     def __iter__(self) -> Iterator[Any]:
         """Iterate over the attribute values in order."""
         for attr in self.__annotations__:
@@ -69,8 +168,28 @@ class Choice:
     Provides a keyword-only constructor and __setattr__ that restrict
     attributes to those annotated in the derived class and that keep
     track of which selection is made in the read-only '_selection' property.
+
+    An instance stores only the selection ID, which is the index of the
+    selected attribute in annotation order, and the selected value. The
+    selection ID is the '_selection_id' attribute, and generated classes name
+    each one, e.g. 'SELECTION_ID_FOO_BAR' for the attribute 'foo_bar'. See
+    'dispatch'.
     """
-    _selection: str
+    __slots__ = ('_selection_id', '_value')
+    _selection_id: int
+    _value: Any
+
+    # attribute names in annotation order, and the inverse mapping, set for
+    # each derived class by '__init_subclass__'
+    _attrs: Tuple[str, ...] = ()
+    _selection_ids: Dict[str, int] = {}
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__()
+        cls._attrs = tuple(cls.__annotations__)
+        cls._selection_ids = {attr: i for i, attr in enumerate(cls._attrs)}
+        for selection_id, attr in enumerate(cls._attrs):
+            setattr(cls, attr, _alternative_property(selection_id, attr))
 
     def __init__(self, **kwarg: Any) -> None:
         if len(kwarg) != 1:
@@ -78,23 +197,169 @@ class Choice:
                              f'arguments when it supports only one.')
 
         (attr, value), = kwarg.items()
-        if attr not in self.__annotations__:
+        selection_id = self._selection_ids.get(attr)
+        if selection_id is None:
             raise ValueError(f'Choice initialized with keyword argument '
                              f'{repr(attr)}, which is not a valid attribute '
                              f'within the {type(self).__name__} type. Valid '
                              f'attributes are: {_attr_list(self)}')
 
-        setattr(self, attr, value)
+        object.__setattr__(self, '_selection_id', selection_id)
+        object.__setattr__(self, '_value', value)
+
+    @classmethod
+    def _select(cls, selection_id: int, value: Any) -> Any:
+        """Return an instance of this class having the specified
+        'selection_id' and 'value', without checking either.
+        """
+        self = cls.__new__(cls)
+        object.__setattr__(self, '_selection_id', selection_id)
+        object.__setattr__(self, '_value', value)
+        return self
+
+    @property
+    def _selection(self) -> str:
+        """Return the name of the selected attribute."""
+        return self._attrs[self._selection_id]
 
     def __setattr__(self, attr: str, value: Any) -> None:
-        if attr not in self.__annotations__:
+        selection_id = self._selection_ids.get(attr)
+        if selection_id is None:
             raise AttributeError(f'Assignment to unsupported attribute '
                                  f'{type(self).__name__} within the '
                                  f'{type(self).__name__} type. Valid '
                                  f'attributes are: {_attr_list(self)}')
 
-        super().__setattr__('_selection', attr)
-        super().__setattr__(attr, value)
+        object.__setattr__(self, '_selection_id', selection_id)
+        object.__setattr__(self, '_value', value)
+
+    def __reduce_ex__(self, protocol: Any) -> Tuple[Any, ...]:
+        """Return the selection ID and the selected value, so that pickles
+        are compact and unpickling does not invoke '__init__'. See
+        'Sequence.__reduce_ex__'.
+        """
+        klass = type(self)
+        plan = _pickle_plans.get(klass) or _pickle_plan(klass)
+        index = self._selection_id
+        value = self._value
+        if index in plan.enum_by_index:
+            value = _enum_to_pickle(value, plan.enum_by_index[index][1])
+        return copyreg.__newobj__, (klass, ), (index, value)
+
+    def __setstate__(self, state: Tuple[int, Any]) -> None:
+        """Make the selection described by the specified 'state' as returned
+        by '__reduce_ex__'.
+        """
+        plan = _pickle_plans.get(type(self)) or _pickle_plan(type(self))
+        index, value = state
+        if index in plan.enum_by_index:
+            value = _enum_from_pickle(value, *plan.enum_by_index[index])
+        object.__setattr__(self, '_selection_id', index)
+        object.__setattr__(self, '_value', value)
+
+
+def _alternative_property(selection_id: int, attr: str) -> property:
+    """Return the property of the 'Choice' attribute having the specified
+    'selection_id' and 'attr' name, which has a value only while selected.
+    """
+
+    def get(self: Choice) -> Any:
+        if self._selection_id != selection_id:
+            raise AttributeError(f'{type(self).__name__} has no selection '
+                                 f'{repr(attr)}.')
+        return self._value
+
+    # Assignment is handled by 'Choice.__setattr__'.
+    return property(get)
+
+
+def dispatch(choice: Any, handlers: Any, default: Optional[Callable[[Any],
+                                                                    Any]] = None
+             ) -> Any:
+    """Return the result of invoking the handler of the selection of the
+    specified 'choice' with the selected value. The specified 'handlers' maps
+    selection IDs to handlers, and is either a 'dict' such as
+    '{Shape.SELECTION_ID_CIRCLE: on_circle, ...}' or a 'list' indexed by
+    selection ID. Optionally specify a 'default' handler for selections not
+    in 'handlers'; otherwise raise a 'KeyError' for them.
+    """
+    selection_id = choice._selection_id
+    try:
+        handler = handlers[selection_id]
+    except (KeyError, IndexError):
+        if default is None:
+            raise KeyError(f'No handler for the {repr(choice._selection)} '
+                           f'selection of {type(choice).__name__}.')
+        handler = default
+    return handler(choice._value)
+
+
+class _PicklePlan:
+    """How the attributes of a generated class are pickled. See
+    '_pickle_plan'.
+    """
+
+    def __init__(self, klass: type) -> None:
+        self.attrs = tuple(klass.__annotations__)
+        # 'attrgetter' needs at least one attribute, and of one attribute
+        # does not return a tuple.
+        self.get_values: Callable[[Any], Tuple[Any, ...]]
+        if not self.attrs:
+            self.get_values = lambda obj: ()
+        elif len(self.attrs) == 1:
+            getter = operator.attrgetter(self.attrs[0])
+            self.get_values = lambda obj: (getter(obj),)
+        else:
+            self.get_values = operator.attrgetter(*self.attrs)
+        # (index, enum class, whether the attribute is a list) of each
+        # attribute whose values are enumerators
+        self.enums: List[Tuple[int, type, bool]] = []
+        # Forward references are looked up in the class's module, rather
+        # than by 'typing.get_type_hints', so that classes the module defines
+        # lazily are found (see 'lazy_class').
+        module = sys.modules[klass.__module__]
+        for i, attr in enumerate(self.attrs):
+            annotation = klass.__annotations__[attr]
+            annotation = _optional_inner(annotation) or annotation
+            elem_type = _list_element(annotation)
+            item_type = annotation if elem_type is None else \
+                _optional_inner(elem_type) or elem_type
+            if isinstance(item_type, str):
+                item_type = getattr(module, item_type)
+            elif hasattr(item_type, '__forward_arg__'):
+                item_type = getattr(module, item_type.__forward_arg__)
+            if isinstance(item_type, type) and issubclass(item_type, Enum):
+                self.enums.append((i, item_type, elem_type is not None))
+        self.enum_by_index = {
+            index: (enum_class, is_list)
+            for index, enum_class, is_list in self.enums
+        }
+
+
+_pickle_plans: Dict[type, _PicklePlan] = {}
+
+
+def _pickle_plan(klass: type) -> _PicklePlan:
+    """Return the pickling plan of the specified generated 'klass', creating
+    it the first time.
+    """
+    plan = _pickle_plans.get(klass)
+    if plan is None:
+        plan = _pickle_plans[klass] = _PicklePlan(klass)
+    return plan
+
+
+def _enum_to_pickle(value: Any, is_list: bool) -> Any:
+    # Note that 'value' might instead be 'None' or 'NOT_DECODED'.
+    if is_list and isinstance(value, list):
+        return [_enum_to_pickle(item, False) for item in value]
+    return value.value if isinstance(value, Enum) else value
+
+
+def _enum_from_pickle(value: Any, enum_class: Any, is_list: bool) -> Any:
+    if is_list and isinstance(value, list):
+        return [_enum_from_pickle(item, enum_class, False) for item in value]
+    return enum_class(value) if isinstance(value, int) else value
 
 
 class NameMapping:
@@ -102,10 +367,19 @@ class NameMapping:
     inverse mapping. A key in the py_to_schema map is a python attribute
     name, e.g. "foo_bar", and the value is the schema name, e.g. "fooBar". A
     key in the schema_to_py map is a schema name, e.g. "fooBar", and the
-    value is the python name, e.g. "foo_bar"."""
+    value is the python name, e.g. "foo_bar". The optional schema_types map
+    has the XSD type of each attribute whose values are more restricted than
+    its python type, e.g. {"count": "unsignedByte"}. See 'DecoderOptions'."""
 
-    def __init__(self, py_to_schema: Mapping[str, str]) -> None:
+    # schema names of the attributes of a 'Choice' indexed by selection ID,
+    # computed when first used by '_selection_elements'
+    selection_elements: Optional[Tuple[str, ...]] = None
+
+    def __init__(self,
+                 py_to_schema: Mapping[str, str],
+                 schema_types: Optional[Mapping[str, str]] = None) -> None:
         self.py_to_schema = py_to_schema
+        self.schema_types = schema_types or {}
         self.schema_to_py = {
             value: name
             for name, value in py_to_schema.items()
@@ -114,36 +388,530 @@ class NameMapping:
         assert len(self.schema_to_py) == len(self.py_to_schema)
 
 
-def to_jsonable(obj: Any, name_mappings: Mapping[type, NameMapping]) -> Any:
+def _selection_elements(mapping: NameMapping,
+                        klass: Any) -> Tuple[str, ...]:
+    """Return the 'selection_elements' of the specified 'mapping' of the
+    specified 'Choice' class 'klass', computing them the first time.
+    """
+    elements = mapping.selection_elements
+    if elements is None:
+        elements = tuple(mapping.py_to_schema[attr] for attr in klass._attrs)
+        mapping.selection_elements = elements
+    return elements
+
+
+class EnumMapping(NameMapping):
+    """'NameMapping' of a generated enumeration class, which also maps the
+    class's members directly to and from their schema names, e.g. from
+    'Color.RED' to "red" and back. All of the mappings except 'py_to_schema'
+    are computed when first used, so that enumerations having thousands of
+    values cost little at import.
+    """
+
+    def __init__(self, enum_class: Any,
+                 py_to_schema: Mapping[str, str]) -> None:
+        # 'NameMapping.__init__' is not invoked, because it computes
+        # 'schema_to_py' eagerly.
+        self.enum_class = enum_class
+        self.py_to_schema = py_to_schema
+        self.schema_types: Mapping[str, str] = {}
+        self._schema_to_py: Optional[Dict[str, str]] = None
+        self._member_to_schema: Optional[Dict[Any, str]] = None
+        self._schema_to_member: Optional[Dict[str, Any]] = None
+
+    @property
+    def schema_to_py(self) -> Dict[str, str]:  # type: ignore
+        if self._schema_to_py is None:
+            self._schema_to_py = {
+                value: name
+                for name, value in self.py_to_schema.items()
+            }
+        return self._schema_to_py
+
+    @property
+    def member_to_schema(self) -> Dict[Any, str]:
+        """Return a 'dict' from each member of the enumeration to its schema
+        name.
+        """
+        if self._member_to_schema is None:
+            members = self.enum_class.__members__
+            self._member_to_schema = {
+                members[name]: value
+                for name, value in self.py_to_schema.items()
+            }
+        return self._member_to_schema
+
+    @property
+    def schema_to_member(self) -> Dict[str, Any]:
+        """Return a 'dict' from the schema name of each member of the
+        enumeration to the member.
+        """
+        if self._schema_to_member is None:
+            self._schema_to_member = {
+                value: member
+                for member, value in self.member_to_schema.items()
+            }
+        return self._schema_to_member
+
+
+_lazy_class_lock = threading.Lock()
+
+
+def lazy_class(namespace: Dict[str, Any], name: str) -> type:
+    """Return the class having the specified 'name' in the generated types
+    module whose globals are the specified 'namespace', building the class
+    the first time by calling its builder in the module's '_lazy_classes'.
+    Raise 'AttributeError' if the module defines no such class. This is the
+    module '__getattr__' of types modules generated with stag's
+    '--fast-import' option.
+    """
+    build = namespace['_lazy_classes'].get(name)
+    if build is None:
+        raise AttributeError(
+            f'module {namespace["__name__"]!r} has no attribute {name!r}')
+    with _lazy_class_lock:
+        klass = namespace.get(name)
+        if klass is None:
+            klass = build()
+            # The class is defined within its builder, but pickling requires
+            # that it be found at module scope by its qualified name.
+            klass.__qualname__ = name
+            namespace[name] = klass
+    return klass
+
+
+class LazyNameMappings(dict):
+    """'dict' from generated class to its 'NameMapping' that is given the
+    mappings by class name, and that adds a class only when it is first
+    looked up. This way, the util module of a types module generated with
+    stag's '--fast-import' option does not build every class at import.
+    Note that iteration visits only the classes looked up so far.
+    """
+
+    def __init__(self, types_module: Any,
+                 mappings_by_name: Mapping[str, NameMapping]) -> None:
+        super().__init__()
+        self.types_module = types_module
+        self.mappings_by_name = mappings_by_name
+
+    def __missing__(self, klass: Any) -> NameMapping:
+        name = getattr(klass, '__name__', None)
+        mapping = self.mappings_by_name.get(name)  # type: ignore
+        if mapping is None or \
+                getattr(self.types_module, name, None) is not klass:
+            raise KeyError(klass)
+        self[klass] = mapping
+        return mapping
+
+    def get(self, klass: Any, default: Any = None) -> Any:
+        try:
+            return self[klass]
+        except KeyError:
+            return default
+
+
+class LazyClassesByName(dict):
+    """'dict' from the name of a generated class to the class, for the
+    specified names of classes in a types module generated with stag's
+    '--fast-import' option, that adds a class only when it is first looked
+    up. Note that iteration visits only the classes looked up so far.
+    """
+
+    def __init__(self, types_module: Any, names: Iterable[str]) -> None:
+        super().__init__()
+        self.types_module = types_module
+        self.names = frozenset(names)
+
+    def __missing__(self, name: str) -> type:
+        if name not in self.names:
+            raise KeyError(name)
+        klass = self[name] = getattr(self.types_module, name)
+        return klass
+
+    def get(self, name: str, default: Any = None) -> Any:
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+
+class NumericArray(array.array):
+    """Base class of the 'array.array' types that stag generates, when
+    invoked with '--numeric-arrays', for arrays of fixed-width numbers and
+    booleans. Each derived class fixes the 'typecode' matching the width of
+    its schema type, so that constructing an instance from a list converts
+    and range-checks all of the items at once.
+    """
+    _typecode = ''
+
+    def __new__(cls, initializer: Any = ()) -> 'NumericArray':
+        return super().__new__(cls, cls._typecode, initializer)  # type: ignore
+
+    def __reduce_ex__(self, protocol: Any) -> Tuple[Any, ...]:
+        # 'array.array' pickles as a plain 'array.array', so this
+        # reconstructs the subclass from the raw bytes instead.
+        return _unpickle_numeric_array, (type(self), self.tobytes(),
+                                         sys.byteorder)
+
+    def __copy__(self) -> 'NumericArray':
+        return type(self)(self)
+
+    def __deepcopy__(self, memo: Any) -> 'NumericArray':
+        return type(self)(self)
+
+
+class Int8Array(NumericArray):
+    """array of 'xs:byte'"""
+    _typecode = 'b'
+
+
+class UInt8Array(NumericArray):
+    """array of 'xs:unsignedByte'"""
+    _typecode = 'B'
+
+
+class Int16Array(NumericArray):
+    """array of 'xs:short'"""
+    _typecode = 'h'
+
+
+class UInt16Array(NumericArray):
+    """array of 'xs:unsignedShort'"""
+    _typecode = 'H'
+
+
+class Int32Array(NumericArray):
+    """array of 'xs:int'"""
+    _typecode = 'i'
+
+
+class UInt32Array(NumericArray):
+    """array of 'xs:unsignedInt'"""
+    _typecode = 'I'
+
+
+class Int64Array(NumericArray):
+    """array of 'xs:long'"""
+    _typecode = 'q'
+
+
+class UInt64Array(NumericArray):
+    """array of 'xs:unsignedLong'"""
+    _typecode = 'Q'
+
+
+class Float32Array(NumericArray):
+    """array of 'xs:float'"""
+    _typecode = 'f'
+
+
+class Float64Array(NumericArray):
+    """array of 'xs:double'"""
+    _typecode = 'd'
+
+
+class BoolArray(NumericArray):
+    """array of 'xs:boolean', stored as bytes that are zero or one"""
+    _typecode = 'B'
+
+
+def _unpickle_numeric_array(klass: Any, data: bytes,
+                            byteorder: str) -> NumericArray:
+    """Return an instance of the specified 'NumericArray' subclass 'klass'
+    whose items are the specified raw 'data' written on a machine having the
+    specified 'byteorder'.
+    """
+    result = klass()
+    result.frombytes(data)
+    if byteorder != sys.byteorder:
+        result.byteswap()
+    return result
+
+
+def _numeric_array(return_type: Any, obj: Any) -> NumericArray:
+    """Return an instance of the specified 'NumericArray' class
+    'return_type' containing the items of the specified list 'obj'. Raise a
+    'ValueError' if any of the items is not a number or is out of range.
+    """
+    if return_type is BoolArray:
+        if not all(isinstance(item, bool) for item in obj):
+            raise ValueError(f'Unable to parse a {return_type.__name__} '
+                             f'from a list containing non-booleans.')
+    elif return_type._typecode in 'fd':
+        # Integers are valid JSON representations of floating point numbers.
+        obj = [float(item) for item in obj]
+    try:
+        return return_type(obj)
+    except (OverflowError, TypeError) as error:
+        raise ValueError(f'Unable to parse a {return_type.__name__}: '
+                         f'{error}') from error
+
+
+_TWO_DIGITS = [f'{i:02}' for i in range(100)]
+_THREE_DIGITS = [f'{i:03}' for i in range(1000)]
+
+
+def _format_utcoffset(offset: datetime.timedelta) -> str:
+    """Return the specified UTC 'offset' formatted as 'isoformat' formats
+    it, e.g. "+05:30" or "-00:00:30".
+    """
+    sign = '-' if offset < datetime.timedelta(0) else '+'
+    offset = abs(offset)
+    minutes, seconds = divmod(offset.seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    result = f'{sign}{hours:02}:{minutes:02}'
+    if seconds or offset.microseconds:
+        result += f':{seconds:02}'
+    if offset.microseconds:
+        result += f'.{offset.microseconds:06}'
+    return result
+
+
+class DatetimeEncoder:
+    """ISO-8601 formatter of 'datetime.date', 'datetime.time' and
+    'datetime.datetime' values, with a fixed number of decimal places of
+    seconds. The 'precision' is 0, 3 or 6 decimal places, truncating, or
+    'None' to format as 'isoformat' does, with either six decimal places or,
+    if there are no microseconds, none.
+
+    Timestamps in a payload usually share a few dates and time zones, so the
+    formatted dates and UTC offsets are cached, and the time of day is
+    formatted from tables of digits. Each cache holds at most
+    'MAX_CACHE_SIZE' entries, and is cleared when full.
+    """
+
+    PRECISIONS = (None, 0, 3, 6)
+    MAX_CACHE_SIZE = 4096
+
+    __slots__ = ('precision', '_dates', '_zones')
+
+    def __init__(self, precision: Optional[int] = None) -> None:
+        if precision not in self.PRECISIONS:
+            raise ValueError(f'precision must be one of {self.PRECISIONS}, '
+                             f'not {repr(precision)}.')
+        self.precision = precision
+        # date ordinal -> "YYYY-MM-DD"
+        self._dates: Dict[int, str] = {}
+        # fixed 'datetime.timezone', or UTC offset of another 'tzinfo', ->
+        # e.g. "+00:00"
+        self._zones: Dict[Any, str] = {}
+
+    def encode(self, value: Union[datetime.date, datetime.time]) -> str:
+        """Return the specified 'value' formatted as ISO-8601."""
+        if isinstance(value, datetime.datetime):
+            date = self._dates.get(value.toordinal()) or self._date(value)
+            return f'{date}T{self._time(value)}'
+        elif isinstance(value, datetime.date):
+            return self._dates.get(value.toordinal()) or self._date(value)
+        return self._time(value)
+
+    def _date(self, value: datetime.date) -> str:
+        """Return the date of the specified 'value' formatted as ISO-8601,
+        and cache it.
+        """
+        if len(self._dates) >= self.MAX_CACHE_SIZE:
+            self._dates.clear()
+        date = self._dates[value.toordinal()] = '%04d-%02d-%02d' % (
+            value.year, value.month, value.day)
+        return date
+
+    def _time(self, value: Union[datetime.time, datetime.datetime]) -> str:
+        """Return the time of day and the UTC offset, if any, of the
+        specified 'value' formatted as ISO-8601.
+        """
+        microsecond = value.microsecond
+        precision = self.precision
+        if precision == 3:
+            fraction = '.' + _THREE_DIGITS[microsecond // 1000]
+        elif precision == 0 or (precision is None and not microsecond):
+            fraction = ''
+        else:
+            fraction = (f'.{_THREE_DIGITS[microsecond // 1000]}'
+                        f'{_THREE_DIGITS[microsecond % 1000]}')
+
+        tzinfo = value.tzinfo
+        if tzinfo is None:
+            zone = ''
+        else:
+            # The offset of a 'datetime.timezone' is fixed, which spares
+            # calling 'utcoffset'.
+            key = tzinfo if type(tzinfo) is datetime.timezone else \
+                value.utcoffset()
+            zone = self._zones.get(key)
+            if zone is None:
+                zone = self._zone(key, value)
+
+        return (f'{_TWO_DIGITS[value.hour]}:{_TWO_DIGITS[value.minute]}:'
+                f'{_TWO_DIGITS[value.second]}{fraction}{zone}')
+
+    def _zone(self, key: Any, value: Union[datetime.time,
+                                           datetime.datetime]) -> str:
+        """Return the UTC offset of the specified 'value' formatted as
+        ISO-8601, and cache it under the specified 'key'.
+        """
+        offset = value.utcoffset()
+        if offset is None:
+            # e.g. a 'datetime.time' in a time zone having daylight saving
+            return ''
+        if len(self._zones) >= self.MAX_CACHE_SIZE:
+            self._zones.clear()
+        zone = self._zones[key] = _format_utcoffset(offset)
+        return zone
+
+
+class EncoderOptions:
+    """How 'to_jsonable' formats values, and which it omits.
+
+    'datetime_precision' is the number of decimal places of seconds in each
+    encoded 'datetime.datetime' and 'datetime.time', like the
+    'DatetimeFractionalSecondPrecision' element of BDE's
+    'balber::BerEncoderOptions'. It is 0, 3 or 6, or 'None' (the default) to
+    format as 'isoformat' does. See 'DatetimeEncoder'.
+
+    If 'omit_defaults' is true, then sequence attributes equal to their
+    schema default, e.g. 'BdeVersionConformance' of 10500, are omitted. If
+    'omit_empty_arrays' is true, then empty arrays are omitted, which is the
+    opposite of the 'EncodeEmptyArrays' element of
+    'balber::BerEncoderOptions'. 'from_jsonable' restores omitted attributes
+    to their defaults, so either way the decoded object equals the encoded
+    one. Attributes whose value is 'None' are always omitted.
+    """
+
+    def __init__(self,
+                 *,
+                 datetime_precision: Optional[int] = None,
+                 omit_defaults: bool = False,
+                 omit_empty_arrays: bool = False) -> None:
+        self.datetime_encoder = DatetimeEncoder(datetime_precision)
+        self.datetime_precision = datetime_precision
+        self.omit_defaults = omit_defaults
+        self.omit_empty_arrays = omit_empty_arrays
+
+
+_DEFAULT_ENCODER_OPTIONS = EncoderOptions()
+
+
+class _ElisionPlan:
+    """Which attributes of a generated sequence class 'to_jsonable' can omit.
+    See '_elision_plan'.
+    """
+
+    def __init__(self, klass: type) -> None:
+        # attribute -> schema default, for attributes that have one
+        self.defaults: Dict[str, Any] = {}
+        # attributes whose values are lists or numeric arrays
+        self.arrays: Set[str] = set()
+        for attr in klass.__annotations__:
+            default = getattr(klass, attr, None)
+            if isinstance(default, (list, array.array)):
+                self.arrays.add(attr)
+            elif default is not None:
+                self.defaults[attr] = default
+
+
+_elision_plans: Dict[type, _ElisionPlan] = {}
+
+
+def _elision_plan(klass: type) -> _ElisionPlan:
+    """Return the elision plan of the specified generated sequence 'klass',
+    creating it the first time.
+    """
+    plan = _elision_plans.get(klass)
+    if plan is None:
+        plan = _elision_plans[klass] = _ElisionPlan(klass)
+    return plan
+
+
+def _elided_to_jsonable(obj: Sequence,
+                        name_mappings: Mapping[type, NameMapping],
+                        options: EncoderOptions) -> Dict[str, Any]:
+    """Return 'to_jsonable' of the specified sequence 'obj', omitting the
+    attributes that the specified 'options' select.
+    """
+    klass = type(obj)
+    plan = _elision_plans.get(klass) or _elision_plan(klass)
+    defaults = plan.defaults if options.omit_defaults else {}
+    arrays = plan.arrays if options.omit_empty_arrays else ()
+    result = {}
+    for attr, elem in name_mappings[klass].py_to_schema.items():
+        value = getattr(obj, attr)
+        if value is None or (attr in arrays and not len(value)) or \
+                (attr in defaults and value == defaults[attr]):
+            continue
+        result[elem] = to_jsonable(value, name_mappings, options)
+    return result
+
+
+def to_jsonable(obj: Any,
+                name_mappings: Mapping[type, NameMapping],
+                options: Optional[EncoderOptions] = None) -> Any:
+    """Return a composition of python objects (such as 'dict', 'list' and
+    'str') based on the specified 'obj' such that the result is suitable for
+    serialization to JSON. Optionally specify 'options' to select how
+    values are formatted (see 'EncoderOptions').
+    """
     # TODO Need to handle blobs (and possibly other XSD types)
-    if isinstance(obj, str) or isinstance(obj, int) or isinstance(obj, float):
+    # Check 'Enum' before 'int', because of 'enum.IntEnum'.
+    if isinstance(obj, Enum):
+        mapping = name_mappings[type(obj)]
+        if isinstance(mapping, EnumMapping):
+            return mapping.member_to_schema[obj]
+        return mapping.py_to_schema[obj.name]
+    elif isinstance(obj, str) or isinstance(obj, int) or \
+            isinstance(obj, float):
         return obj
-    elif (isinstance(obj, datetime.datetime) or isinstance(obj, datetime.date)
-          or isinstance(obj, datetime.time)):
-        return obj.isoformat()
+    elif isinstance(obj, (datetime.date, datetime.time)):
+        return (options or
+                _DEFAULT_ENCODER_OPTIONS).datetime_encoder.encode(obj)
     elif isinstance(obj, datetime.timedelta):
         raise NotImplementedError('Time intervals are not supported.')
-    elif isinstance(obj, Enum):
-        return name_mappings[type(obj)].py_to_schema[obj.name]
     elif isinstance(obj, list):
-        return [to_jsonable(item, name_mappings) for item in obj]
+        return [to_jsonable(item, name_mappings, options) for item in obj]
+    elif isinstance(obj, array.array):
+        if isinstance(obj, BoolArray):
+            return [item != 0 for item in obj]
+        return obj.tolist()
     elif isinstance(obj, Choice):
+        mapping = name_mappings[type(obj)]
+        elements = mapping.selection_elements or \
+            _selection_elements(mapping, type(obj))
         return {
-            name_mappings[type(obj)].py_to_schema[obj._selection]: \
-                to_jsonable(getattr(obj, obj._selection), name_mappings)
+            elements[obj._selection_id]: \
+                to_jsonable(obj._value, name_mappings, options)
         }
     else:
         if not isinstance(obj, Sequence):
             raise ValueError(
                 f'Unable to to_jsonable object with unsupported type {type(obj)}.'
             )
+        if options is not None and (options.omit_defaults
+                                    or options.omit_empty_arrays):
+            return _elided_to_jsonable(obj, name_mappings, options)
         return {
-            elem: to_jsonable(getattr(obj, attr), name_mappings) \
+            elem: to_jsonable(getattr(obj, attr), name_mappings, options) \
             for attr, elem in name_mappings[type(obj)].py_to_schema.items() \
             if getattr(obj, attr) is not None
         }
 
 
+def static_to_jsonable(obj: Any,
+                       encoders: Mapping[Any, Callable[[Any], Any]],
+                       name_mappings: Mapping[type, NameMapping],
+                       options: Optional[EncoderOptions] = None) -> Any:
+    """Return 'to_jsonable(obj, name_mappings, options)' computed by the
+    function in the specified 'encoders' for the type of the specified
+    'obj', if there is one and 'options' is not specified. Util modules
+    generated with stag's '--static-codecs' option define 'encoders', which
+    convert each generated class without reflection. Errors raised by the
+    function propagate to the caller.
+    """
+    if options is None:
+        encode = encoders.get(type(obj))
+        if encode is not None:
+            return encode(obj)
+    return to_jsonable(obj, name_mappings, options)
+
+
 def _parse_interval(hours: str, minutes: Optional[str],
                     seconds: Optional[str]) -> Tuple[int, int, int, int, int]:
     """Return (hours, minutes, seconds, milliseconds, microseconds) from
@@ -237,29 +1005,455 @@ def _expect_isinstance(obj: Any, klass: type, return_type: Any) -> None:
             f'Unable to parse a {return_type} from a {type(obj)}.')
 
 
-def from_jsonable(return_type: Any, obj: Any,
+def _is_optional(annotation: Any) -> bool:
+    """Return whether the specified 'annotation' is a 'typing.Optional[T]'."""
+    return getattr(annotation, '__origin__', None) is Union and \
+        type(None) in annotation.__args__
+
+
+def _optional_inner(annotation: Any) -> Any:
+    """Return the 'T' in the specified 'annotation' if it is a
+    'typing.Optional[T]', or return 'None' otherwise.
+    """
+    # 'typing.Union[..., None]' comes from 'typing.Optional[...]'.
+    if getattr(annotation, '__origin__', None) is not Union:
+        return None
+    type_args = annotation.__args__
+    assert len(type_args) == 2
+    assert type(None) in type_args
+    return [t for t in type_args if t is not type(None)][0]
+
+
+def _list_element(annotation: Any) -> Any:
+    """Return the 'T' in the specified 'annotation' if it is a
+    'typing.List[T]', or return 'None' otherwise.
+    """
+    # The origin of 'typing.List[T]' is 'typing.List' in python 3.6, but is
+    # 'list' in later versions.
+    if getattr(annotation, '__origin__', None) not in (list, List):
+        return None
+    elem_type, = annotation.__args__
+    return elem_type
+
+
+def _resolve_type(annotation: Any, class_by_name: Mapping[str, type]) -> Any:
+    """Return the class named by the specified 'annotation' if it is a forward
+    reference, or return 'annotation' otherwise. A forward reference is
+    either a 'str' (as in a top level annotation) or a 'typing.ForwardRef'
+    (as in the argument of 'typing.Optional["Foo"]').
+    """
+    if isinstance(annotation, str):
+        return class_by_name[annotation]
+    forward_arg = getattr(annotation, '__forward_arg__', None)
+    if forward_arg is not None:
+        return class_by_name[forward_arg]
+    return annotation
+
+
+class DecodeError(ValueError):
+    """Error raised by 'from_jsonable' when a payload exceeds one of the
+    limits of a 'DecoderOptions', or contains an unknown element that the
+    options do not allow to be skipped. The 'path' attribute is the location
+    within the payload, spelled like "Items[3].Price", at which decoding
+    stopped.
+    """
+
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+        self.message = message
+        self.path: List[Union[str, int]] = []
+
+    def __str__(self) -> str:
+        path = ''.join(f'[{part}]' if isinstance(part, int) else f'.{part}'
+                       for part in self.path).lstrip('.')
+        return f'{path or "<root>"}: {self.message}'
+
+
+class DecoderOptions:
+    """Limits enforced by 'from_jsonable' while decoding a payload, so that
+    malformed or hostile input fails fast rather than consuming unbounded CPU
+    and memory. The limits are:
+
+    - 'max_depth', the deepest nesting of sequences, choices and arrays,
+    - 'max_list_length', the most items in any one array,
+    - 'max_string_length', the longest string,
+    - 'max_elements', the most values decoded from the whole payload.
+
+    A limit of 'None' is no limit. The defaults of 'max_depth' and
+    'max_list_length' are those of the 'MaxDepth' and 'MaxSequenceSize'
+    elements of BDE's 'balber::BerDecoderOptions'.
+
+    If 'skip_unknown_elements' is true, then elements that are not part of
+    the schema are ignored without being decoded. Otherwise they are an
+    error.
+
+    'validation' is one of the following levels:
+
+    - "none" trusts the payload entirely, e.g. because this process produced
+      it. Values are neither type checked nor coerced, required elements are
+      not checked, and no limit is enforced.
+    - "types" checks and coerces values as 'from_jsonable' does without
+      options, e.g. a float element may be decoded from "1.5".
+    - "strict" additionally rejects values that would need coercion, and
+      values outside of the restrictions of their XSD type (see the
+      'schema_types' of 'NameMapping'), e.g. 256 for an "unsignedByte".
+    - "sample" decodes the specified 'sample_percent' of payloads, chosen at
+      random, as "strict", and the rest as "none".
+    """
+
+    VALIDATION_LEVELS = ('none', 'types', 'strict', 'sample')
+
+    def __init__(self,
+                 *,
+                 max_depth: Optional[int] = 32,
+                 max_list_length: Optional[int] = 8 * 1024 * 1024,
+                 max_string_length: Optional[int] = None,
+                 max_elements: Optional[int] = None,
+                 skip_unknown_elements: bool = True,
+                 validation: str = 'types',
+                 sample_percent: float = 1) -> None:
+        if validation not in self.VALIDATION_LEVELS:
+            raise ValueError(f'validation must be one of '
+                             f'{self.VALIDATION_LEVELS}, not '
+                             f'{repr(validation)}.')
+        if not 0 <= sample_percent <= 100:
+            raise ValueError(f'sample_percent must be between 0 and 100, not '
+                             f'{sample_percent}.')
+        for name, limit in (('max_depth', max_depth),
+                            ('max_list_length', max_list_length),
+                            ('max_string_length', max_string_length),
+                            ('max_elements', max_elements)):
+            if limit is not None and limit < 0:
+                raise ValueError(f'{name} must not be negative, not {limit}.')
+
+        self.max_depth = max_depth
+        self.max_list_length = max_list_length
+        self.max_string_length = max_string_length
+        self.max_elements = max_elements
+        self.skip_unknown_elements = skip_unknown_elements
+        self.validation = validation
+        self.sample_percent = sample_percent
+
+
+class _DecodeBudget:
+    """What remains of the limits of a 'DecoderOptions' during one call to
+    'from_jsonable'.
+    """
+
+    __slots__ = ('options', 'strict', 'depth', 'elements', 'max_depth',
+                 'max_list_length', 'max_string_length')
+
+    def __init__(self, options: DecoderOptions, strict: bool) -> None:
+        infinity = sys.maxsize
+        self.options = options
+        self.strict = strict
+        self.depth = 0
+        self.elements = _or(options.max_elements, infinity)
+        self.max_depth = _or(options.max_depth, infinity)
+        self.max_list_length = _or(options.max_list_length, infinity)
+        self.max_string_length = _or(options.max_string_length, infinity)
+
+    def enter(self, container: Any) -> None:
+        """Account for descending into the specified 'container', a 'list' or
+        'dict', and for each of the values that it contains, or raise a
+        'DecodeError' if that would exceed a limit.
+        """
+        self.elements -= len(container)
+        if self.elements < 0:
+            raise DecodeError(f'Payload has more than '
+                              f'{self.options.max_elements} elements.')
+        if isinstance(container, list) and \
+                len(container) > self.max_list_length:
+            raise DecodeError(f'Array of length {len(container)} is longer '
+                              f'than {self.max_list_length}.')
+        self.depth += 1
+        if self.depth > self.max_depth:
+            raise DecodeError(f'Payload is nested more than {self.max_depth} '
+                              'deep.')
+
+    def check_string(self, obj: Any) -> None:
+        """Raise a 'DecodeError' if the specified 'obj' is a string longer
+        than allowed.
+        """
+        if isinstance(obj, str) and len(obj) > self.max_string_length:
+            raise DecodeError(f'String of length {len(obj)} is longer than '
+                              f'{self.max_string_length}.')
+
+
+def _or(value: Optional[int], default: int) -> int:
+    return default if value is None else value
+
+
+def _check_strict(return_type: Any, obj: Any) -> None:
+    """Raise a 'DecodeError' unless the specified 'obj' is already a value of
+    the specified 'return_type', which is 'str', 'int', 'float' or 'bool'. An
+    'int' is a 'float' as far as JSON is concerned.
+    """
+    if return_type is bool or isinstance(obj, bool):
+        valid = return_type is bool and isinstance(obj, bool)
+    elif return_type is float:
+        valid = isinstance(obj, (int, float))
+    else:
+        valid = isinstance(obj, return_type)
+    if not valid:
+        raise DecodeError(f'Expected a {return_type.__name__} but got a '
+                          f'{type(obj).__name__}: {repr(obj)}')
+
+
+# inclusive bounds of the XSD integer types narrower than 'xs:integer'
+_XSD_INTEGER_RANGES = {
+    'byte': (-2**7, 2**7 - 1),
+    'short': (-2**15, 2**15 - 1),
+    'int': (-2**31, 2**31 - 1),
+    'long': (-2**63, 2**63 - 1),
+    'unsignedByte': (0, 2**8 - 1),
+    'unsignedShort': (0, 2**16 - 1),
+    'unsignedInt': (0, 2**32 - 1),
+    'unsignedLong': (0, 2**64 - 1),
+    'negativeInteger': (None, -1),
+    'nonPositiveInteger': (None, 0),
+    'nonNegativeInteger': (0, None),
+    'positiveInteger': (1, None)
+}
+
+
+def _check_facets(schema_type: str, value: Any) -> None:
+    """Raise a 'DecodeError' if the specified 'value' is not within the
+    restrictions of the XSD type having the specified 'schema_type' name, or
+    if any item of 'value' is not, if it is a list.
+    """
+    if value is None or isinstance(value, NumericArray):
+        # The width of a 'NumericArray' is that of its XSD type already.
+        return
+    if isinstance(value, list):
+        for item in value:
+            _check_facets(schema_type, item)
+        return
+
+    if schema_type in _XSD_INTEGER_RANGES:
+        low, high = _XSD_INTEGER_RANGES[schema_type]
+        if (low is not None and value < low) or \
+                (high is not None and value > high):
+            raise DecodeError(f'{value} is out of range for xs:{schema_type}.')
+    elif schema_type in ('normalizedString', 'token'):
+        if any(char in value for char in '\t\n\r'):
+            raise DecodeError(f'xs:{schema_type} may not contain tabs or line '
+                              f'breaks: {repr(value)}')
+        if schema_type == 'token' and \
+                (value != value.strip(' ') or '  ' in value):
+            raise DecodeError(f'xs:token may not contain leading, trailing, '
+                              f'or consecutive spaces: {repr(value)}')
+
+
+# decoder of each generated class for the "none" validation level. See
+# '_trusted_decoder'.
+_trusted_decoders: Dict[type, Callable[[Any], Any]] = {}
+_trusted_decoders_lock = threading.Lock()
+
+
+def _trusted_decoder(annotation: Any, name_mappings: Mapping[type,
+                                                             NameMapping],
+                     class_by_name: Mapping[str, type],
+                     pending: Dict[type, Callable[[Any], Any]]
+                     ) -> Callable[[Any], Any]:
+    """Return a function that constructs an instance of the type having the
+    specified 'annotation' from a jsonable object without checking or
+    coercing anything (see the "none" validation level of
+    'DecoderOptions'). Look up and store the decoders of generated classes
+    in '_trusted_decoders', and store those being compiled in the specified
+    'pending' so that recursive types refer to themselves.
+    """
+    klass = _resolve_type(annotation, class_by_name)
+    inner_type = _optional_inner(klass)
+    if inner_type is not None:
+        return _trusted_decoder(inner_type, name_mappings, class_by_name,
+                                pending)
+    elem_type = _list_element(klass)
+    if elem_type is not None:
+        decode = _trusted_decoder(elem_type, name_mappings, class_by_name,
+                                  pending)
+        return lambda obj: [decode(elem) for elem in obj]
+    if klass in (str, int, float, bool):
+        return _identity
+    if not issubclass(klass, (Sequence, Choice)):
+        # Enumerations, arrays and dates are decoded as usual.
+        return lambda obj: _from_jsonable(klass, obj, name_mappings,
+                                          class_by_name, None)
+
+    decoder = _trusted_decoders.get(klass) or pending.get(klass)
+    if decoder is not None:
+        return decoder
+    # schema element name -> (attribute name, decoder)
+    fields: Dict[str, Tuple[str, Callable[[Any], Any]]] = {}
+    if issubclass(klass, Sequence):
+
+        def decoder(obj: Any) -> Any:
+            attr_values = {}
+            for elem, value in obj.items():
+                attr, decode = fields[elem]
+                attr_values[attr] = decode(value)
+            return klass._trusted(attr_values)
+    else:
+
+        def decoder(obj: Any) -> Any:
+            (elem, value), = obj.items()
+            attr, decode = fields[elem]
+            return klass(**{attr: decode(value)})
+
+    pending[klass] = decoder
+    py_to_schema = name_mappings[klass].py_to_schema
+    for attr, attr_type in klass.__annotations__.items():
+        fields[py_to_schema[attr]] = (attr,
+                                      _trusted_decoder(attr_type,
+                                                       name_mappings,
+                                                       class_by_name,
+                                                       pending))
+    return decoder
+
+
+def _identity(obj: Any) -> Any:
+    return obj
+
+
+def _trusted_from_jsonable(return_type: Any, obj: Any,
+                           name_mappings: Mapping[type, NameMapping],
+                           class_by_name: Mapping[str, type]) -> Any:
+    """Return an instance of the specified 'return_type' constructed from the
+    specified 'obj' without checking or coercing anything.
+    """
+    klass = _resolve_type(return_type, class_by_name)
+    decoder = _trusted_decoders.get(klass)
+    if decoder is None:
+        pending: Dict[type, Callable[[Any], Any]] = {}
+        decoder = _trusted_decoder(klass, name_mappings, class_by_name,
+                                   pending)
+        with _trusted_decoders_lock:
+            _trusted_decoders.update(pending)
+    return decoder(obj)
+
+
+def from_jsonable(return_type: Any,
+                  obj: Any,
                   name_mappings: Mapping[type, NameMapping],
-                  class_by_name: Mapping[str, type]) -> Any:
+                  class_by_name: Mapping[str, type],
+                  only: Optional[Any] = None,
+                  options: Optional[DecoderOptions] = None) -> Any:
+    """Return an instance of the specified 'return_type' constructed from the
+    specified 'obj'. Optionally specify 'only', a list of schema paths (see
+    'Projection') or a compiled 'Projection', to decode only the selected
+    fields and leave the others as 'NOT_DECODED'. Optionally specify
+    'options' to limit the size of 'obj' and to select how thoroughly it is
+    validated (see 'DecoderOptions'); if a limit is exceeded or a strict check
+    fails, then raise a 'DecodeError'. 'only' and 'options' cannot be
+    combined.
+    """
+    if only is not None:
+        if options is not None:
+            raise ValueError('Decoder options are not supported together '
+                             'with a projection.')
+        if not isinstance(only, Projection):
+            only = Projection.compile(return_type, only, name_mappings,
+                                      class_by_name)
+        return only.decode(obj)
+
+    budget = None
+    if options is not None:
+        validation = options.validation
+        if validation == 'sample':
+            sampled = random.uniform(0, 100) < options.sample_percent
+            validation = 'strict' if sampled else 'none'
+        if validation == 'none':
+            return _trusted_from_jsonable(return_type, obj, name_mappings,
+                                          class_by_name)
+        # The elements within containers are counted by 'enter', so count
+        # the root here.
+        budget = _DecodeBudget(options, validation == 'strict')
+        budget.elements -= 1
+    return _from_jsonable(return_type, obj, name_mappings, class_by_name,
+                          budget)
+
+
+def static_from_jsonable(return_type: Any,
+                         obj: Any,
+                         decoders: Mapping[Any, Callable[[Any], Any]],
+                         name_mappings: Mapping[type, NameMapping],
+                         class_by_name: Mapping[str, type],
+                         only: Optional[Any] = None,
+                         options: Optional[DecoderOptions] = None) -> Any:
+    """Return 'from_jsonable' of the specified arguments computed by the
+    function in the specified 'decoders' for the specified 'return_type' (a
+    class or its name), if there is one and neither 'only' nor 'options' is
+    specified. Util modules generated with stag's '--static-codecs' option
+    define 'decoders'. The function raises the same exceptions that
+    'from_jsonable' would for the same payload, e.g. 'KeyError' for an
+    unknown element, and they propagate to the caller.
+    """
+    if only is None and options is None:
+        decode = decoders.get(return_type)
+        if decode is not None:
+            return decode(obj)
+    return from_jsonable(return_type, obj, name_mappings, class_by_name, only,
+                         options)
+
+
+def _from_jsonable(return_type: Any, obj: Any,
+                   name_mappings: Mapping[type, NameMapping],
+                   class_by_name: Mapping[str, type],
+                   budget: Optional[_DecodeBudget]) -> Any:
     # Note that while this function is annotated as returning any type, it in
     # fact returns a value having the specified 'return_type'.
     # TODO Need to handle blobs (and possibly other XSD types)
+    return_type = _resolve_type(return_type, class_by_name)
 
     # This case needs to be checked first, because if 'return_type' is a
     # 'typing.Union' (e.g. 'typing.Optional'), then it's not really a type,
-    # and so the 'issubclass' checks will fail below. Strangely this is not
-    # true for 'typing.List', which behaves like a type.
-    if repr(return_type.__class__) == 'typing.Union':
-        # 'typing.Union[..., None]' comes from 'typing.Optional[...]'.
-        type_args = return_type.__args__
-        assert len(type_args) == 2
-        assert type(None) in type_args
-        inner_type = [t for t in type_args if t is not type(None)][0]
-        return from_jsonable(inner_type, obj, name_mappings, class_by_name)
+    # and so the 'issubclass' checks will fail below. The same is true of
+    # 'typing.List' in python versions after 3.6.
+    inner_type = _optional_inner(return_type)
+    if inner_type is not None:
+        return _from_jsonable(inner_type, obj, name_mappings, class_by_name,
+                              budget)
+
+    elem_type = _list_element(return_type)
+    if elem_type is not None:
+        if budget is None:
+            return [_from_jsonable(elem_type, elem, name_mappings,
+                                   class_by_name, None) for elem in obj]
+        budget.enter(obj)
+        result = []
+        for i, elem in enumerate(obj):
+            try:
+                result.append(
+                    _from_jsonable(elem_type, elem, name_mappings,
+                                   class_by_name, budget))
+            except DecodeError as error:
+                error.path.insert(0, i)
+                raise
+    elif issubclass(return_type, Enum):
+        # This is checked before 'int', because of 'enum.IntEnum'.
+        _expect_isinstance(obj, str, return_type)
+        if budget is not None:
+            budget.check_string(obj)
+        mapping = name_mappings[return_type]
+        if isinstance(mapping, EnumMapping):
+            return mapping.schema_to_member[obj]
+        return return_type[mapping.schema_to_py[obj]]
+    elif issubclass(return_type, NumericArray):
+        if budget is None:
+            return _numeric_array(return_type, obj)
+        budget.enter(obj)
+        result = _numeric_array(return_type, obj)
     elif issubclass(return_type, (str, int, float)):
+        if budget is not None:
+            budget.check_string(obj)
+            if budget.strict:
+                _check_strict(return_type, obj)
         return return_type(obj)
     elif issubclass(return_type,
                     (datetime.datetime, datetime.date, datetime.time)):
         _expect_isinstance(obj, str, return_type)
+        if budget is not None:
+            budget.check_string(obj)
         result = _parse_iso8601(obj)
         if not isinstance(result, return_type):
             raise ValueError(f'Expected a {return_type} but parsed a '
@@ -267,32 +1461,2833 @@ def from_jsonable(return_type: Any, obj: Any,
         return result
     elif issubclass(return_type, datetime.timedelta):
         raise NotImplementedError('Time intervals are not supported.')
-    elif issubclass(return_type, Enum):
-        _expect_isinstance(obj, str, return_type)
-        return return_type[name_mappings[return_type].schema_to_py[obj]]
-    elif issubclass(return_type, list):
-        elem_type, = return_type.__args__
-        return [from_jsonable(elem_type, elem, name_mappings, class_by_name) \
-                for elem in obj]
     else:
         # Assume that 'return_type' is derived from either 'Sequence' or
         # 'Choice', so that we can just invoke its constructor with keyword
         # arguments mapped from the keys and values of 'obj'. We know the types
         # of the attributes within 'return_type' by examining its
-        # '__annotations__'.
+        # '__annotations__'. If the element annotation spelled its type as a
+        # str, then it's a forward declared type, which 'from_jsonable' will
+        # look up in 'class_by_name'.
+        if budget is not None:
+            budget.enter(obj)
         schema_to_py = name_mappings[return_type].schema_to_py
+        schema_types = name_mappings[return_type].schema_types
+        attr_values = {}
+        for elem, value in obj.items():
+            if budget is not None and elem not in schema_to_py:
+                if budget.options.skip_unknown_elements:
+                    continue
+                error = DecodeError(f'{return_type.__name__} has no element '
+                                    f'{repr(elem)}.')
+                error.path.append(elem)
+                raise error
+            attr = schema_to_py[elem]
+            elem_type = return_type.__annotations__[attr]
+            try:
+                attr_values[attr] = _from_jsonable(elem_type, value,
+                                                   name_mappings,
+                                                   class_by_name, budget)
+                if budget is not None and budget.strict and \
+                        attr in schema_types:
+                    _check_facets(schema_types[attr], attr_values[attr])
+            except DecodeError as error:
+                error.path.insert(0, elem)
+                raise
+
+        if budget is not None and issubclass(return_type, Choice) and \
+                len(attr_values) != 1:
+            # e.g. the only element was unknown, and so skipped
+            raise DecodeError(f'{return_type.__name__} needs exactly one '
+                              f'known element, but got {sorted(obj)}.')
+        result = return_type(**attr_values)
+
+    if budget is not None:
+        budget.depth -= 1
+    return result
+
+
+class _NotDecoded:
+    """Type of the 'NOT_DECODED' sentinel."""
+
+    def __repr__(self) -> str:
+        return 'NOT_DECODED'
+
+    def __bool__(self) -> bool:
+        return False
+
+    def __reduce__(self) -> str:
+        # Unpickle as the same 'NOT_DECODED' object.
+        return 'NOT_DECODED'
+
+
+# 'NOT_DECODED' is the value of every attribute that a 'Projection' left out
+# when it decoded an object. It is distinct from 'None' and from any default.
+NOT_DECODED: Any = _NotDecoded()
+
+
+class Projection:
+    """Decoder that builds only the fields selected by a list of schema
+    paths. A path is a period-separated list of element names as spelled in
+    the schema, relative to the decoded type, where an element that is an
+    array is suffixed with "[]" in order to select fields within each of its
+    items, e.g. "Header.Timestamp" or "Items[].Price". Selecting an element
+    without selecting any of its fields selects the entire element. The
+    attributes of fields not selected are 'NOT_DECODED'.
+
+    Paths are validated against the generated classes and their name
+    mappings once, when the projection is compiled.
+    """
+
+    # Compiled projections, least recently used first, keyed by (return
+    # class, paths, id of name mappings, id of classes by name). Each
+    # projection refers to its mappings, so their ids are not reused while it
+    # is cached. See 'compile'.
+    _cache: 'collections.OrderedDict[Tuple[Any, ...], Projection]' = \
+        collections.OrderedDict()
+    _cache_lock = threading.Lock()
+    max_cached = 256
+
+    def __init__(self, return_type: Any, paths: List[str],
+                 name_mappings: Mapping[type, NameMapping],
+                 class_by_name: Mapping[str, type]) -> None:
+        self.return_type = return_type
+        self.paths = tuple(paths)
+        self._name_mappings = name_mappings
+        self._class_by_name = class_by_name
+        # element name -> subtree, where a subtree of 'None' means that the
+        # entire element is selected.
+        self._tree: Dict[str, Any] = {}
+        for path in self.paths:
+            self._add_path(path)
+
+    @classmethod
+    def compile(cls, return_type: Any, paths: List[str],
+                name_mappings: Mapping[type, NameMapping],
+                class_by_name: Mapping[str, type]) -> 'Projection':
+        """Return a projection of the specified 'paths' within the specified
+        'return_type', reusing a previously compiled projection if there is
+        one. At most 'max_cached' projections are kept, and the least
+        recently used is discarded first.
+        """
+        # A class name is resolved first, since different modules may each
+        # have a class of that name.
+        return_type = _resolve_type(return_type, class_by_name)
+        key = (return_type, tuple(paths), id(name_mappings),
+               id(class_by_name))
+        with cls._cache_lock:
+            projection = cls._cache.get(key)
+            if projection is not None:
+                cls._cache.move_to_end(key)
+                return projection
+
+        # Compile without holding the lock. If two threads compile the same
+        # projection, the later one is kept, which is harmless.
+        projection = cls(return_type, paths, name_mappings, class_by_name)
+        with cls._cache_lock:
+            cls._cache[key] = projection
+            while len(cls._cache) > cls.max_cached:
+                cls._cache.popitem(last=False)
+        return projection
+
+    def decode(self, obj: Any) -> Any:
+        """Return an instance of this projection's return type constructed
+        from the selected parts of the specified 'obj'.
+        """
+        return self._decode(self.return_type, obj, self._tree)
+
+    def _add_path(self, path: str) -> None:
+        klass = self._class(self.return_type, path)
+        tree = self._tree
+        parts = path.split('.')
+        for i, part in enumerate(parts):
+            is_last = i == len(parts) - 1
+            each = part.endswith('[]')
+            elem = part[:-2] if each else part
+            mapping = self._name_mappings.get(klass)
+            if mapping is None or elem not in mapping.schema_to_py:
+                raise ValueError(f'Invalid projection path {repr(path)}: '
+                                 f'{klass.__name__} has no element '
+                                 f'{repr(elem)}.')
+            attr = mapping.schema_to_py[elem]
+            annotation = _resolve_type(klass.__annotations__[attr],
+                                       self._class_by_name)
+            annotation = _optional_inner(annotation) or annotation
+            elem_type = _list_element(annotation)
+            if each and elem_type is None:
+                raise ValueError(f'Invalid projection path {repr(path)}: '
+                                 f'{klass.__name__}.{elem} is not an array.')
+            if elem_type is not None and not each and not is_last:
+                raise ValueError(f'Invalid projection path {repr(path)}: '
+                                 f'{klass.__name__}.{elem} is an array, so '
+                                 f'it must be spelled {repr(elem + "[]")}.')
+
+            if is_last:
+                # The whole element is selected, regardless of any narrower
+                # selection made by another path.
+                tree[elem] = None
+                return
+            if elem in tree and tree[elem] is None:
+                # A broader path already selected the whole element.
+                return
+
+            tree = tree.setdefault(elem, {})
+            klass = self._class(elem_type or annotation, path)
+
+    def _class(self, annotation: Any, path: str) -> Any:
+        """Return the generated 'Sequence' or 'Choice' class named by the
+        specified 'annotation', or raise a 'ValueError' mentioning the
+        specified 'path' if it names any other type.
+        """
+        klass = _resolve_type(annotation, self._class_by_name)
+        klass = _resolve_type(_optional_inner(klass) or klass,
+                              self._class_by_name)
+        if not (isinstance(klass, type) and
+                issubclass(klass, (Sequence, Choice))):
+            raise ValueError(f'Invalid projection path {repr(path)}: '
+                             f'{klass} has no elements.')
+        return klass
+
+    def _decode(self, annotation: Any, obj: Any, tree: Dict[str, Any]) -> Any:
+        klass = _resolve_type(annotation, self._class_by_name)
+        inner_type = _optional_inner(klass)
+        if inner_type is not None:
+            return self._decode(inner_type, obj, tree)
+        elem_type = _list_element(klass)
+        if elem_type is not None:
+            return [self._decode(elem_type, elem, tree) for elem in obj]
+
+        schema_to_py = self._name_mappings[klass].schema_to_py
         attr_values = {}
         for elem, value in obj.items():
             attr = schema_to_py[elem]
-            elem_annotation = return_type.__annotations__[attr]
-            # If the element annotation spelled its type as a str, then it's a
-            # forward declared type. Look up the actual class in class_by_name.
-            if isinstance(elem_annotation, str):
-                elem_type = class_by_name[elem_annotation]
+            if elem not in tree:
+                # Skip the unselected subtree without building it.
+                continue
+            subtree = tree[elem]
+            elem_type = klass.__annotations__[attr]
+            if subtree is None:
+                attr_values[attr] = from_jsonable(elem_type, value,
+                                                  self._name_mappings,
+                                                  self._class_by_name)
             else:
-                elem_type = elem_annotation
+                attr_values[attr] = self._decode(elem_type, value, subtree)
+
+        if issubclass(klass, Choice):
+            if not attr_values:
+                # The selection was not projected, but which selection it is
+                # is still known.
+                (elem, _), = obj.items()
+                attr_values[schema_to_py[elem]] = NOT_DECODED
+        else:
+            py_to_schema = self._name_mappings[klass].py_to_schema
+            for attr in klass.__annotations__:
+                if py_to_schema[attr] not in tree:
+                    attr_values[attr] = NOT_DECODED
+
+        return klass(**attr_values)
+
+
+class DecodeCacheStatistics:
+    """Snapshot of the counters and occupancy of a 'DecodeCache'."""
+
+    def __init__(self, hits: int, misses: int, evictions: int, entries: int,
+                 size_bytes: int) -> None:
+        self.hits = hits
+        self.misses = misses
+        self.evictions = evictions
+        self.entries = entries
+        self.size_bytes = size_bytes
+
+    def __repr__(self) -> str:
+        return (f'DecodeCacheStatistics(hits={self.hits}, '
+                f'misses={self.misses}, evictions={self.evictions}, '
+                f'entries={self.entries}, size_bytes={self.size_bytes})')
+
+
+class DecodeCache:
+    """Bounded, thread-safe cache of objects decoded from JSON payloads.
+    Entries are keyed by the requested return type, the 'from_jsonable'
+    function that decoded them, and a digest of the payload's bytes, so that
+    a payload repeated byte-for-byte is neither parsed nor converted again,
+    and so that util modules or decoder options sharing one cache do not see
+    each other's objects. Entries are evicted least recently used first
+    whenever the cache holds more than 'max_entries' entries or more than
+    'max_bytes' bytes of payload.
+
+    Generated classes are mutable, so by default each lookup returns a copy
+    of the cached instance. The copy rebuilds every sequence, choice, and
+    array in the instance, but shares its strings, numbers, dates, and
+    enumerators, which are immutable. It costs about a tenth as much as
+    decoding the payload again, whereas 'copy.deepcopy' costs nearly as
+    much. If 'copy_on_access' is false, then every lookup of the same
+    payload returns the same instance, which callers must then treat as
+    read-only.
+    """
+
+    def __init__(self,
+                 max_entries: int = 1024,
+                 max_bytes: int = 16 * 1024 * 1024,
+                 copy_on_access: bool = True) -> None:
+        if max_entries < 1:
+            raise ValueError(f'max_entries must be positive, not '
+                             f'{max_entries}.')
+        if max_bytes < 1:
+            raise ValueError(f'max_bytes must be positive, not {max_bytes}.')
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.copy_on_access = copy_on_access
+        self._lock = threading.Lock()
+        # (return_type, from_jsonable, digest) -> (instance, payload size)
+        self._entries: \
+            'collections.OrderedDict[Tuple[Any, Any, bytes], ' \
+            'Tuple[Any, int]]' = collections.OrderedDict()
+        self._size_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def decode(self, return_type: Any, payload: Union[bytes, str],
+               from_jsonable: Callable[[Any, Any], Any]) -> Any:
+        """Return an instance of the specified 'return_type' decoded from the
+        specified JSON 'payload'. On a cache miss, parse 'payload' and convert
+        the result using the specified 'from_jsonable', which is typically the
+        'from_jsonable' function of a generated utilities module. Entries are
+        found only by the same 'from_jsonable', so pass the same function
+        object each time, rather than, e.g., a new 'functools.partial'.
+        """
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        key = (return_type, from_jsonable,
+               hashlib.blake2b(payload, digest_size=16).digest())
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+            else:
+                self._misses += 1
+
+        if entry is not None:
+            return self._share(entry[0])
+
+        # Decode without holding the lock, so that other threads can use the
+        # cache meanwhile. If two threads miss on the same payload, the later
+        # insertion wins, which is harmless.
+        result = from_jsonable(return_type, json.loads(payload))
+        size = len(payload)
+        if size <= self.max_bytes:
+            with self._lock:
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self._size_bytes -= previous[1]
+                self._entries[key] = (result, size)
+                self._size_bytes += size
+                self._evict()
+
+        return self._share(result)
+
+    def statistics(self) -> DecodeCacheStatistics:
+        """Return a consistent snapshot of this cache's counters."""
+        with self._lock:
+            return DecodeCacheStatistics(self._hits, self._misses,
+                                         self._evictions, len(self._entries),
+                                         self._size_bytes)
+
+    def clear(self) -> None:
+        """Remove all entries from this cache. Counters are not reset."""
+        with self._lock:
+            self._entries.clear()
+            self._size_bytes = 0
+
+    def _share(self, instance: Any) -> Any:
+        return _copy_decoded(instance) if self.copy_on_access else instance
+
+    def _evict(self) -> None:
+        # The caller must hold 'self._lock'.
+        while len(self._entries) > self.max_entries or \
+                self._size_bytes > self.max_bytes:
+            _, (_, size) = self._entries.popitem(last=False)
+            self._size_bytes -= size
+            self._evictions += 1
+
+
+def _copy_decoded(value: Any) -> Any:
+    """Return a copy of the specified 'value', as returned by
+    'from_jsonable', that shares nothing mutable with it. Decoded values are
+    trees, so unlike 'copy.deepcopy' this keeps no memo of the objects
+    already copied, and it shares immutable leaves instead of visiting them.
+    """
+    klass = type(value)
+    if klass is list:
+        return [_copy_decoded(item) for item in value]
+    elif isinstance(value, Sequence):
+        result = klass.__new__(klass)
+        result.__dict__.update({
+            attr: _copy_decoded(attr_value)
+            for attr, attr_value in value.__dict__.items()
+        })
+        return result
+    elif isinstance(value, Choice):
+        return klass._select(value._selection_id, _copy_decoded(value._value))
+    elif isinstance(value, array.array):
+        return copy.copy(value)
+    return value
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+_MICROSECOND = datetime.timedelta(microseconds=1)
+_NAIVE = -2**31  # UTC offset recorded for values without a time zone
+
+# array.array type codes of 'ValueColumn' values, by kind
+_VALUE_TYPECODES = {
+    'int': 'q',
+    'uint': 'Q',  # unsigned XSD types, e.g. 'xs:unsignedLong'
+    'float': 'd',
+    'bool': 'b',
+    'date': 'i',  # days since 1970-01-01
+    'time': 'q',  # microseconds since midnight
+    'datetime': 'q'  # microseconds of wall time since 1970-01-01T00:00
+}
+
+
+def _leaf_kind(klass: Any) -> Optional[str]:
+    """Return the name of the column kind used to store values of the
+    specified basic 'klass', or return 'None' if 'klass' is not basic.
+    """
+    # Check 'bool' before 'int', and 'datetime' before 'date', because of
+    # subclassing.
+    for kind, basic in (('bool', bool), ('int', int), ('float', float),
+                        ('str', str), ('bytes', bytes),
+                        ('datetime', datetime.datetime),
+                        ('date', datetime.date), ('time', datetime.time)):
+        if issubclass(klass, basic):
+            return kind
+    return None
+
+
+class ValueColumn:
+    """Column of fixed-width values stored in an 'array.array'. Integers,
+    floats, and booleans are stored as themselves. Integers are 8 bytes wide,
+    signed or, for unsigned XSD types, unsigned; if an integer is too wide
+    even so, e.g. an unbounded 'xs:integer', then 'values' becomes a 'list'. Dates are stored as days
+    since 1970-01-01, times as microseconds since midnight, and datetimes as
+    microseconds of wall time since 1970-01-01T00:00. Time zones, if any, are
+    stored separately in 'utcoffsets' as seconds east of UTC. 'mask' is a
+    'bytearray' having zero at the index of each missing value, or is 'None'
+    if no value is missing.
+    """
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self.values = array.array(_VALUE_TYPECODES[kind])
+        self.mask: Optional[bytearray] = None
+        self.utcoffsets: Optional[array.array] = None
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def append(self, value: Any) -> None:
+        if value is None:
+            if self.mask is None:
+                self.mask = bytearray(b'\x01') * len(self.values)
+            self.mask.append(0)
+            self.values.append(0)
+            if self.utcoffsets is not None:
+                self.utcoffsets.append(_NAIVE)
+            return
+
+        if self.mask is not None:
+            self.mask.append(1)
+        kind = self.kind
+        if kind == 'datetime':
+            self._append_offset(value)
+            value = (value.replace(tzinfo=None) - _EPOCH) // _MICROSECOND
+        elif kind == 'date':
+            value = value.toordinal() - _EPOCH_ORDINAL
+        elif kind == 'time':
+            self._append_offset(value)
+            value = ((value.hour * 60 + value.minute) * 60 + value.second) * \
+                1000000 + value.microsecond
+        try:
+            self.values.append(value)
+        except OverflowError:
+            if kind not in ('int', 'uint'):
+                raise
+            self.values = list(self.values)
+            self.values.append(value)
+
+    def get(self, index: int) -> Any:
+        if self.mask is not None and not self.mask[index]:
+            return None
+        value = self.values[index]
+        kind = self.kind
+        if kind == 'bool':
+            return bool(value)
+        elif kind == 'datetime':
+            result = _EPOCH + datetime.timedelta(microseconds=value)
+            return result.replace(tzinfo=self._tzinfo(index))
+        elif kind == 'date':
+            return datetime.date.fromordinal(value + _EPOCH_ORDINAL)
+        elif kind == 'time':
+            seconds, microsecond = divmod(value, 1000000)
+            minutes, second = divmod(seconds, 60)
+            hour, minute = divmod(minutes, 60)
+            return datetime.time(hour, minute, second, microsecond,
+                                 self._tzinfo(index))
+        return value
+
+    def to_numpy(self) -> Any:
+        """Return a NumPy array sharing this column's values. Missing values
+        appear as zero. Integers too wide for the column are in an array of
+        python objects, which is a copy. This requires NumPy to be
+        installed.
+        """
+        import numpy
+        if isinstance(self.values, list):
+            return numpy.array(self.values, dtype=object)
+        return numpy.frombuffer(self.values, dtype=self.values.typecode)
+
+    def _append_offset(self, value: Any) -> None:
+        offset = value.utcoffset()
+        if offset is None:
+            if self.utcoffsets is not None:
+                self.utcoffsets.append(_NAIVE)
+            return
+        if self.utcoffsets is None:
+            self.utcoffsets = array.array('i', [_NAIVE]) * len(self.values)
+        self.utcoffsets.append(int(offset.total_seconds()))
+
+    def _tzinfo(self, index: int) -> Optional[datetime.tzinfo]:
+        if self.utcoffsets is None or self.utcoffsets[index] == _NAIVE:
+            return None
+        offset = self.utcoffsets[index]
+        if offset == 0:
+            return datetime.timezone.utc
+        return datetime.timezone(datetime.timedelta(seconds=offset))
+
+
+class BufferColumn:
+    """Column of variable-length strings or bytes. The value at index 'i' is
+    'data[offsets[i]:offsets[i + 1]]', where strings are encoded as UTF-8.
+    'mask' is as in 'ValueColumn'.
+    """
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self.offsets = array.array('q', [0])
+        self.data = bytearray()
+        self.mask: Optional[bytearray] = None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def append(self, value: Any) -> None:
+        if value is None:
+            if self.mask is None:
+                self.mask = bytearray(b'\x01') * len(self)
+            self.mask.append(0)
+        else:
+            if self.mask is not None:
+                self.mask.append(1)
+            self.data += value.encode('utf-8') if self.kind == 'str' \
+                else value
+        self.offsets.append(len(self.data))
+
+    def get(self, index: int) -> Any:
+        if self.mask is not None and not self.mask[index]:
+            return None
+        value = bytes(self.data[self.offsets[index]:self.offsets[index + 1]])
+        return value.decode('utf-8') if self.kind == 'str' else value
+
+
+class CategoryColumn:
+    """Column of enumeration values, stored as indices into 'categories'.
+    A missing value has the code -1.
+    """
+
+    def __init__(self, enum_class: Any) -> None:
+        self.categories = list(enum_class)
+        self.codes = array.array('i')
+        self._code_by_member = {
+            member: code
+            for code, member in enumerate(self.categories)
+        }
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def append(self, value: Any) -> None:
+        self.codes.append(-1 if value is None else self._code_by_member[value])
+
+    def get(self, index: int) -> Any:
+        code = self.codes[index]
+        return None if code == -1 else self.categories[code]
+
+
+class SelectionColumn:
+    """Column of which alternative of a 'Choice' is selected, stored as
+    indices into 'alternatives' (attribute names). -1 means no choice at all.
+    The value of each alternative is stored in its own columns.
+    """
+
+    def __init__(self, alternatives: List[str]) -> None:
+        self.alternatives = alternatives
+        self.codes = array.array('b' if len(alternatives) < 128 else 'i')
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+class PresenceColumn:
+    """Column recording whether an optional nested 'Sequence' is present. The
+    nested sequence's own fields are stored in their own columns.
+    """
+
+    def __init__(self) -> None:
+        self.mask = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.mask)
+
+
+class ListColumn:
+    """Column of arrays. The items of the array at index 'i' are at indices
+    'offsets[i]' up to 'offsets[i + 1]' of 'values', which is either a column
+    (for arrays of basic types or enumerations) or a 'Columns' (for arrays of
+    sequences). 'mask' is as in 'ValueColumn'.
+    """
+
+    def __init__(self, values: Any) -> None:
+        self.offsets = array.array('q', [0])
+        self.values = values
+        self.mask: Optional[bytearray] = None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+class _ColumnLayout:
+    """Flattening of a 'Sequence' class into columns, computed once per class
+    by 'Columns'. 'nodes' is a list of tuples, one per attribute, whose first
+    member names the kind of node:
+
+        ('value',  attr, elem, path, kind)
+        ('enum',   attr, elem, path, enum_class, {schema name: member})
+        ('list',   attr, elem, path, item, container)
+        ('struct', attr, elem, path, klass, optional, child nodes, defaults)
+        ('choice', attr, elem, path, klass, [(alt, alt elem, node)])
+
+    where 'item' is a node without 'attr' or 'elem' describing the items of
+    an array, 'container' is the 'NumericArray' class of the array or 'None'
+    for a list, and 'defaults' maps element names to the JSON-compatible form
+    of the default values of the corresponding attributes.
+    """
+
+    def __init__(self, klass: Any, name_mappings: Mapping[type, NameMapping],
+                 class_by_name: Mapping[str, type]) -> None:
+        self.klass = klass
+        self._name_mappings = name_mappings
+        self._class_by_name = class_by_name
+        self.nodes = self._sequence_nodes(klass, '', set())
+        self.defaults = self._jsonable_defaults(klass)
+
+    def _sequence_nodes(self, klass: Any, prefix: str, active: Set[Any]
+                        ) -> List[Tuple[Any, ...]]:
+        if klass in active:
+            raise ValueError(f'{klass.__name__} is recursive, so it cannot '
+                             f'be flattened into columns.')
+        active = active | {klass}
+        mapping = self._name_mappings[klass]
+        py_to_schema = mapping.py_to_schema
+        return [
+            self._node(klass.__annotations__[attr], attr, py_to_schema[attr],
+                       prefix + py_to_schema[attr], active,
+                       mapping.schema_types.get(attr))
+            for attr in klass.__annotations__
+        ]
+
+    def _node(self,
+              annotation: Any,
+              attr: Optional[str],
+              elem: Optional[str],
+              path: str,
+              active: Set[Any],
+              schema_type: Optional[str] = None) -> Tuple[Any, ...]:
+        klass = _resolve_type(annotation, self._class_by_name)
+        optional = False
+        inner_type = _optional_inner(klass)
+        if inner_type is not None:
+            optional = True
+            klass = _resolve_type(inner_type, self._class_by_name)
+
+        item_type = _list_element(klass)
+        if item_type is not None:
+            item_type = _resolve_type(item_type, self._class_by_name)
+            if isinstance(item_type, type) and issubclass(item_type, Sequence):
+                item = ('columns', Columns.layout(
+                    item_type, self._name_mappings, self._class_by_name))
+            else:
+                item = self._node(item_type, None, None, path, active,
+                                  schema_type)
+                if item[0] not in ('value', 'enum'):
+                    raise ValueError(f'Arrays of {item_type.__name__} cannot '
+                                     f'be stored in columns.')
+            return ('list', attr, elem, path, item, None)
+        elif issubclass(klass, NumericArray):
+            if klass is BoolArray:
+                kind = 'bool'
+            elif klass._typecode in 'fd':
+                kind = 'float'
+            elif klass._typecode in 'BHILQ':
+                kind = 'uint'
+            else:
+                kind = 'int'
+            return ('list', attr, elem, path,
+                    ('value', None, None, path, kind), klass)
+        elif issubclass(klass, Enum):
+            schema_to_py = self._name_mappings[klass].schema_to_py
+            return ('enum', attr, elem, path, klass, {
+                schema_name: klass[name]
+                for schema_name, name in schema_to_py.items()
+            })
+        elif issubclass(klass, Choice):
+            mapping = self._name_mappings[klass]
+            py_to_schema = mapping.py_to_schema
+            alternatives = [(alt, py_to_schema[alt],
+                             self._node(klass.__annotations__[alt], alt,
+                                        py_to_schema[alt],
+                                        f'{path}.{py_to_schema[alt]}',
+                                        active | {klass},
+                                        mapping.schema_types.get(alt)))
+                            for alt in klass.__annotations__]
+            return ('choice', attr, elem, path, klass, alternatives)
+        elif issubclass(klass, Sequence):
+            return ('struct', attr, elem, path, klass, optional,
+                    self._sequence_nodes(klass, path + '.', active),
+                    self._jsonable_defaults(klass))
+
+        kind = _leaf_kind(klass)
+        if kind is None:
+            raise ValueError(f'Values of type {klass} cannot be stored in '
+                             f'columns.')
+        if kind == 'int' and schema_type is not None and \
+                schema_type.startswith('unsigned'):
+            kind = 'uint'
+        return ('value', attr, elem, path, kind)
+
+    def _jsonable_defaults(self, klass: Any) -> Dict[str, Any]:
+        py_to_schema = self._name_mappings[klass].py_to_schema
+        return {
+            py_to_schema[attr]: to_jsonable(
+                getattr(klass, attr), self._name_mappings)
+            for attr in klass.__annotations__
+            if getattr(klass, attr, None) is not None
+        }
+
+    def make_columns(self) -> Dict[str, Any]:
+        columns: Dict[str, Any] = collections.OrderedDict()
+        for node in self.nodes:
+            _make_columns(node, columns)
+        return columns
+
+
+def _make_columns(node: Tuple[Any, ...], columns: Dict[str, Any]) -> Any:
+    """Add to the specified 'columns' the columns needed to store the
+    specified layout 'node', and return the column stored at the node's path.
+    """
+    what, path = node[0], node[3]
+    if what == 'value':
+        kind = node[4]
+        column = BufferColumn(kind) if kind in ('str', 'bytes') \
+            else ValueColumn(kind)
+    elif what == 'enum':
+        column = CategoryColumn(node[4])
+    elif what == 'list':
+        item = node[4]
+        if item[0] == 'columns':
+            column = ListColumn(Columns(item[1]))
+        else:
+            column = ListColumn(_make_columns(item, {}))
+    elif what == 'struct':
+        for child in node[6]:
+            _make_columns(child, columns)
+        if not node[5]:
+            return None
+        column = PresenceColumn()
+    else:
+        column = SelectionColumn([alt for alt, _, _ in node[5]])
+        for _, _, child in node[5]:
+            _make_columns(child, columns)
+    columns[path] = column
+    return column
+
+
+def _append_node(node: Tuple[Any, ...], columns: Dict[str, Any], value: Any,
+                 jsonable: bool) -> None:
+    """Append the specified 'value' to the 'columns' of the specified layout
+    'node'. If 'jsonable' is true, then 'value' is a composition of python
+    objects as would result from JSON deserialization, rather than an
+    instance of a generated class. 'value' is 'None' when it is missing.
+    """
+    what, path = node[0], node[3]
+    if what == 'value':
+        kind = node[4]
+        if jsonable and value is not None and kind in ('date', 'time',
+                                                       'datetime'):
+            value = _parse_iso8601(value)
+        columns[path].append(value)
+    elif what == 'enum':
+        if jsonable and value is not None:
+            value = node[5][value]
+        columns[path].append(value)
+    elif what == 'list':
+        column = columns[path]
+        if value is None:
+            if column.mask is None:
+                column.mask = bytearray(b'\x01') * len(column)
+            column.mask.append(0)
+            value = []
+        elif column.mask is not None:
+            column.mask.append(1)
+        item = node[4]
+        values = column.values
+        if item[0] == 'columns':
+            for elem in value:
+                values._append(elem, jsonable)
+        else:
+            item_columns = {path: values}
+            for elem in value:
+                _append_node(item, item_columns, elem, jsonable)
+        column.offsets.append(column.offsets[-1] + len(value))
+    elif what == 'struct':
+        if node[5]:
+            columns[path].mask.append(value is not None)
+        for child in node[6]:
+            if value is None:
+                child_value = None
+            elif jsonable:
+                child_value = value.get(child[2], node[7].get(child[2]))
+            else:
+                child_value = getattr(value, child[1])
+            _append_node(child, columns, child_value, jsonable)
+    else:
+        selected = None
+        if value is not None:
+            selected = next(iter(value)) if jsonable else value._selection_id
+        code = -1
+        for i, (alt, alt_elem, child) in enumerate(node[5]):
+            if (alt_elem if jsonable else i) == selected:
+                code = i
+                child_value = value[alt_elem] if jsonable else value._value
+            else:
+                child_value = None
+            _append_node(child, columns, child_value, jsonable)
+        columns[path].codes.append(code)
+
+
+def _get_node(node: Tuple[Any, ...], columns: Dict[str, Any],
+              index: int) -> Any:
+    """Return the value of the specified layout 'node' at the specified
+    'index' within the specified 'columns'.
+    """
+    what, path = node[0], node[3]
+    if what in ('value', 'enum'):
+        return columns[path].get(index)
+    elif what == 'list':
+        column = columns[path]
+        if column.mask is not None and not column.mask[index]:
+            return None
+        item = node[4]
+        values = column.values
+        indices = range(column.offsets[index], column.offsets[index + 1])
+        if item[0] == 'columns':
+            return [values.record(i) for i in indices]
+        item_columns = {path: values}
+        result = [_get_node(item, item_columns, i) for i in indices]
+        return result if node[5] is None else node[5](result)
+    elif what == 'struct':
+        if node[5] and not columns[path].mask[index]:
+            return None
+        klass = node[4]
+        attr_values = {}
+        for child in node[6]:
+            attr_values[child[1]] = _get_node(child, columns, index)
+        return klass(**attr_values)
+    else:
+        code = columns[path].codes[index]
+        if code == -1:
+            return None
+        alt, _, child = node[5][code]
+        return node[4](**{alt: _get_node(child, columns, index)})
+
+
+class Columns:
+    """Struct-of-arrays representation of a list of instances of a generated
+    'Sequence' class. Each field is stored in its own column, named by the
+    field's schema path, where fields of nested sequences are flattened to
+    period-separated names such as "Header.Timestamp", and each alternative
+    of a choice has its own column named like "Shape.Circle". The columns are
+    instances of 'ValueColumn', 'BufferColumn', 'CategoryColumn',
+    'SelectionColumn', 'PresenceColumn', and 'ListColumn'.
+    """
+
+    # layouts of generated classes, computed once per class and mappings
+    _layouts: Dict[Tuple[Any, int, int], _ColumnLayout] = {}
+    _layouts_lock = threading.Lock()
+
+    def __init__(self, layout: _ColumnLayout) -> None:
+        self.record_type = layout.klass
+        self.columns = layout.make_columns()
+        self._root = ('struct', None, None, '', layout.klass, False,
+                      layout.nodes, layout.defaults)
+        self._length = 0
+
+    @classmethod
+    def layout(cls, record_type: Any,
+               name_mappings: Mapping[type, NameMapping],
+               class_by_name: Mapping[str, type]) -> _ColumnLayout:
+        """Return the layout of the specified 'record_type' (a class or its
+        name) under the specified mappings, computing it the first time.
+        """
+        record_type = _resolve_type(record_type, class_by_name)
+        # The layout refers to the mappings, so their IDs are not reused
+        # while it is cached.
+        key = (record_type, id(name_mappings), id(class_by_name))
+        layout = cls._layouts.get(key)
+        if layout is None:
+            # Compute the layout without holding the lock, because layouts of
+            # arrays of sequences are computed recursively. If two threads
+            # compute the same layout, the first one stored is kept.
+            layout = _ColumnLayout(record_type, name_mappings, class_by_name)
+            with cls._layouts_lock:
+                layout = cls._layouts.setdefault(key, layout)
+        return layout
+
+    @classmethod
+    def from_records(cls, record_type: Any, records: Iterable[Any],
+                     name_mappings: Mapping[type, NameMapping],
+                     class_by_name: Mapping[str, type]) -> 'Columns':
+        """Return the columns of the specified 'records', which are instances
+        of the specified 'record_type'.
+        """
+        result = cls(cls.layout(record_type, name_mappings, class_by_name))
+        for record in records:
+            result._append(record, False)
+        return result
+
+    @classmethod
+    def from_jsonl(cls, record_type: Any, lines: Iterable[Union[str, bytes]],
+                   name_mappings: Mapping[type, NameMapping],
+                   class_by_name: Mapping[str, type]) -> 'Columns':
+        """Return the columns of the records of the specified 'record_type'
+        encoded as JSON, one per line, in the specified 'lines'. The records
+        are stored directly into the columns without instantiating
+        'record_type'. Blank lines are ignored.
+        """
+        result = cls(cls.layout(record_type, name_mappings, class_by_name))
+        for line in lines:
+            if line.strip():
+                result._append(json.loads(line), True)
+        return result
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, path: str) -> Any:
+        """Return the column at the specified schema 'path'."""
+        return self.columns[path]
+
+    def keys(self) -> List[str]:
+        """Return the schema paths of the columns in order."""
+        return list(self.columns)
+
+    def record(self, index: int) -> Any:
+        """Return a new instance of this object's record type built from the
+        values at the specified 'index' within the columns.
+        """
+        if not -self._length <= index < self._length:
+            raise IndexError(f'Record index {index} out of range.')
+        return _get_node(self._root, self.columns, index % self._length)
+
+    def to_records(self) -> List[Any]:
+        """Return a list of new instances of this object's record type built
+        from the columns.
+        """
+        return [self.record(i) for i in range(self._length)]
+
+    def _append(self, record: Any, jsonable: bool) -> None:
+        _append_node(self._root, self.columns, record, jsonable)
+        self._length += 1
+
+
+_UINT32 = struct.Struct('<I')
+
+
+class EncodeError(ValueError):
+    """Error raised by 'encode_binary' and 'RecordFileWriter' when a value
+    cannot be encoded in the binary record format, e.g. a 'str' where an
+    'int' is expected. The 'path' attribute is the location of the value
+    within the encoded object, spelled like "items[3].price" using python
+    attribute names.
+    """
+
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+        self.message = message
+        self.path: List[Union[str, int]] = []
+
+    __str__ = DecodeError.__str__
+
+
+# errors raised by '_BinaryType.encode' for a value of the wrong type or out
+# of range, which the encoders of arrays, sequences, and choices convert into
+# an 'EncodeError' having the value's path
+_INVALID_VALUE_ERRORS = (struct.error, TypeError, AttributeError)
+
+
+def _encode_error(error: Exception, part: Union[str, int]) -> EncodeError:
+    """Return an 'EncodeError' describing the specified 'error', raised while
+    encoding the value at the specified path 'part'.
+    """
+    result = EncodeError(str(error))
+    result.path.append(part)
+    return result
+
+
+class _BinaryType(abc.ABC):
+    """Encoding of values of one type in the binary record format used by
+    'encode_binary' and 'RecordFile'. All integers are little-endian.
+
+    - 'int' is a variable-length integer: the value zigzag-mapped to a
+      non-negative integer (0, -1, 1, -2, ... become 0, 1, 2, 3, ...), then
+      written seven bits per byte, least significant first, with the high
+      bit set in every byte but the last. Any integer can be encoded, e.g.
+      an 'xs:unsignedLong' of 2**64 - 1, or an 'xs:integer' wider still.
+    - 'float' is an 8-byte double, 'bool' a byte, and an enumeration the
+      4-byte signed integer value of the member.
+    - 'str' and 'bytes' are a 4-byte length followed by the (UTF-8) bytes.
+    - 'date' is 4 bytes of days since 1970-01-01, and 'time' and 'datetime'
+      are 8 bytes of microseconds (since midnight or 1970-01-01T00:00 wall
+      time, respectively) followed by 4 bytes of UTC offset in seconds,
+      which is -2**31 for values without a time zone.
+    - A sequence having N attributes starts with N 4-byte offsets, relative
+      to the start of the sequence, of the attributes' values, in annotation
+      order. The offset of an attribute whose value is 'None' is zero.
+    - A choice is the 4-byte index of its selection in annotation order
+      followed by the value of the selection.
+    - An array is a 4-byte count of its items followed by the items if they
+      have a fixed size, or otherwise by a 4-byte offset, relative to the
+      start of the array, of each item and then the items. A 'NumericArray'
+      is a 4-byte count followed by the array's little-endian machine
+      representation.
+
+    'size' is the number of bytes in every encoded value if that is fixed, or
+    'None' otherwise.
+    """
+    size: Optional[int] = None
+
+    @abc.abstractmethod
+    def encode(self, value: Any, out: bytearray) -> None:
+        """Append the encoding of the specified 'value' to 'out'."""
+
+    @abc.abstractmethod
+    def decode(self, buffer: Any, offset: int) -> Any:
+        """Return the value encoded at the specified 'offset' in the
+        specified 'buffer'.
+        """
+
+
+class _BinaryScalar(_BinaryType):
+    def __init__(self, format: str) -> None:
+        self.struct = struct.Struct(format)
+        self.size = self.struct.size
+
+    def encode(self, value: Any, out: bytearray) -> None:
+        out += self.struct.pack(value)
+
+    def decode(self, buffer: Any, offset: int) -> Any:
+        return self.struct.unpack_from(buffer, offset)[0]
+
+
+class _BinaryInteger(_BinaryType):
+    def encode(self, value: Any, out: bytearray) -> None:
+        value = operator.index(value)
+        value = value << 1 if value >= 0 else (~value << 1) | 1
+        while value > 0x7F:
+            out.append(value & 0x7F | 0x80)
+            value >>= 7
+        out.append(value)
+
+    def decode(self, buffer: Any, offset: int) -> Any:
+        value = shift = 0
+        while True:
+            byte = buffer[offset]
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            offset += 1
+            shift += 7
+        return ~(value >> 1) if value & 1 else value >> 1
+
+
+class _BinaryEnum(_BinaryScalar):
+    def __init__(self, enum_class: Any) -> None:
+        super().__init__('<i')
+        self.enum_class = enum_class
+
+    def encode(self, value: Any, out: bytearray) -> None:
+        out += self.struct.pack(value.value)
+
+    def decode(self, buffer: Any, offset: int) -> Any:
+        return self.enum_class(self.struct.unpack_from(buffer, offset)[0])
+
+
+class _BinaryDate(_BinaryScalar):
+    def __init__(self) -> None:
+        super().__init__('<i')
+
+    def encode(self, value: Any, out: bytearray) -> None:
+        out += self.struct.pack(value.toordinal() - _EPOCH_ORDINAL)
+
+    def decode(self, buffer: Any, offset: int) -> Any:
+        days, = self.struct.unpack_from(buffer, offset)
+        return datetime.date.fromordinal(days + _EPOCH_ORDINAL)
+
+
+def _utcoffset_seconds(value: Any) -> int:
+    offset = value.utcoffset()
+    return _NAIVE if offset is None else int(offset.total_seconds())
+
+
+def _timezone(seconds: int) -> Optional[datetime.tzinfo]:
+    if seconds == _NAIVE:
+        return None
+    elif seconds == 0:
+        return datetime.timezone.utc
+    return datetime.timezone(datetime.timedelta(seconds=seconds))
+
+
+class _BinaryTime(_BinaryScalar):
+    def __init__(self) -> None:
+        super().__init__('<qi')
+
+    def encode(self, value: Any, out: bytearray) -> None:
+        micros = ((value.hour * 60 + value.minute) * 60 + value.second) * \
+            1000000 + value.microsecond
+        out += self.struct.pack(micros, _utcoffset_seconds(value))
+
+    def decode(self, buffer: Any, offset: int) -> Any:
+        micros, seconds = self.struct.unpack_from(buffer, offset)
+        seconds_total, microsecond = divmod(micros, 1000000)
+        minutes, second = divmod(seconds_total, 60)
+        hour, minute = divmod(minutes, 60)
+        return datetime.time(hour, minute, second, microsecond,
+                             _timezone(seconds))
+
+
+class _BinaryDatetime(_BinaryScalar):
+    def __init__(self) -> None:
+        super().__init__('<qi')
+
+    def encode(self, value: Any, out: bytearray) -> None:
+        micros = (value.replace(tzinfo=None) - _EPOCH) // _MICROSECOND
+        out += self.struct.pack(micros, _utcoffset_seconds(value))
+
+    def decode(self, buffer: Any, offset: int) -> Any:
+        micros, seconds = self.struct.unpack_from(buffer, offset)
+        result = _EPOCH + datetime.timedelta(microseconds=micros)
+        return result.replace(tzinfo=_timezone(seconds))
+
+
+class _BinaryText(_BinaryType):
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+
+    def encode(self, value: Any, out: bytearray) -> None:
+        data = value.encode('utf-8') if self.kind == 'str' else value
+        out += _UINT32.pack(len(data))
+        out += data
+
+    def decode(self, buffer: Any, offset: int) -> Any:
+        length, = _UINT32.unpack_from(buffer, offset)
+        data = bytes(buffer[offset + 4:offset + 4 + length])
+        return data.decode('utf-8') if self.kind == 'str' else data
+
+
+class _BinaryList(_BinaryType):
+    def __init__(self, item: _BinaryType) -> None:
+        self.item = item
+
+    def encode(self, value: Any, out: bytearray) -> None:
+        start = len(out)
+        out += _UINT32.pack(len(value))
+        item = self.item
+        if item.size is not None:
+            for i, elem in enumerate(value):
+                try:
+                    item.encode(elem, out)
+                except EncodeError as error:
+                    error.path.insert(0, i)
+                    raise
+                except _INVALID_VALUE_ERRORS as error:
+                    raise _encode_error(error, i) from error
+            return
+
+        table = len(out)
+        out += bytes(4 * len(value))
+        for i, elem in enumerate(value):
+            _UINT32.pack_into(out, table + 4 * i, len(out) - start)
+            try:
+                item.encode(elem, out)
+            except EncodeError as error:
+                error.path.insert(0, i)
+                raise
+            except _INVALID_VALUE_ERRORS as error:
+                raise _encode_error(error, i) from error
+
+    def decode(self, buffer: Any, offset: int) -> Any:
+        count, = _UINT32.unpack_from(buffer, offset)
+        item = self.item
+        if item.size is not None:
+            return [
+                item.decode(buffer, offset + 4 + i * item.size)
+                for i in range(count)
+            ]
+        return [
+            item.decode(buffer,
+                        offset + _UINT32.unpack_from(buffer, offset + 4 +
+                                                     4 * i)[0])
+            for i in range(count)
+        ]
+
+
+class _BinaryNumericArray(_BinaryType):
+    def __init__(self, klass: Any) -> None:
+        self.klass = klass
+
+    def encode(self, value: Any, out: bytearray) -> None:
+        out += _UINT32.pack(len(value))
+        if sys.byteorder != 'little':
+            value = copy.copy(value)
+            value.byteswap()
+        out += value.tobytes()
+
+    def decode(self, buffer: Any, offset: int) -> Any:
+        count, = _UINT32.unpack_from(buffer, offset)
+        result = self.klass()
+        start = offset + 4
+        result.frombytes(buffer[start:start + count * result.itemsize])
+        if sys.byteorder != 'little':
+            result.byteswap()
+        return result
+
+
+class _BinarySequence(_BinaryType):
+    def __init__(self, klass: Any) -> None:
+        self.klass = klass
+        # list of (attribute name, _BinaryType), filled in by '_binary_type'
+        self.fields: List[Tuple[str, _BinaryType]] = []
+
+    def encode(self, value: Any, out: bytearray) -> None:
+        start = len(out)
+        out += bytes(4 * len(self.fields))
+        for i, (attr, field_type) in enumerate(self.fields):
+            field = getattr(value, attr)
+            if field is None:
+                continue
+            _UINT32.pack_into(out, start + 4 * i, len(out) - start)
+            try:
+                field_type.encode(field, out)
+            except EncodeError as error:
+                error.path.insert(0, attr)
+                raise
+            except _INVALID_VALUE_ERRORS as error:
+                raise _encode_error(error, attr) from error
+
+    def decode(self, buffer: Any, offset: int) -> Any:
+        attr_values = {}
+        for i, (attr, field_type) in enumerate(self.fields):
+            field_offset, = _UINT32.unpack_from(buffer, offset + 4 * i)
+            attr_values[attr] = None if field_offset == 0 else \
+                field_type.decode(buffer, offset + field_offset)
+        return self.klass(**attr_values)
+
+
+class _BinaryChoice(_BinaryType):
+    def __init__(self, klass: Any) -> None:
+        self.klass = klass
+        # list of (attribute name, _BinaryType) in selection ID order, filled
+        # in by '_binary_type'
+        self.fields: List[Tuple[str, _BinaryType]] = []
+
+    def encode(self, value: Any, out: bytearray) -> None:
+        index = value._selection_id
+        out += _UINT32.pack(index)
+        attr, field_type = self.fields[index]
+        try:
+            field_type.encode(value._value, out)
+        except EncodeError as error:
+            error.path.insert(0, attr)
+            raise
+        except _INVALID_VALUE_ERRORS as error:
+            raise _encode_error(error, attr) from error
+
+    def decode(self, buffer: Any, offset: int) -> Any:
+        index, = _UINT32.unpack_from(buffer, offset)
+        return self.klass._select(
+            index, self.fields[index][1].decode(buffer, offset + 4))
+
+
+# '_BinaryType' of each generated class, computed once per class. See
+# '_binary_type'.
+_binary_types: Dict[Any, _BinaryType] = {}
+_binary_types_lock = threading.Lock()
+
+_BINARY_SCALARS = {
+    'bool': lambda: _BinaryScalar('<?'),
+    'int': _BinaryInteger,
+    'float': lambda: _BinaryScalar('<d'),
+    'str': lambda: _BinaryText('str'),
+    'bytes': lambda: _BinaryText('bytes'),
+    'date': _BinaryDate,
+    'time': _BinaryTime,
+    'datetime': _BinaryDatetime
+}
+
+
+def _build_binary_type(annotation: Any, class_by_name: Mapping[str, type],
+                       pending: Dict[Any, _BinaryType]) -> _BinaryType:
+    """Return the '_BinaryType' of the specified 'annotation', which is
+    either a generated class, a basic type, or a 'typing.Optional' or
+    'typing.List' thereof. Forward references are resolved using the
+    specified 'class_by_name'. Look up the types of classes in
+    '_binary_types', and store those being built in the specified 'pending'
+    so that recursive types refer to themselves.
+    """
+    klass = _resolve_type(annotation, class_by_name)
+    inner_type = _optional_inner(klass)
+    if inner_type is not None:
+        # Absence is encoded by the containing sequence.
+        return _build_binary_type(inner_type, class_by_name, pending)
+    item_type = _list_element(klass)
+    if item_type is not None:
+        return _BinaryList(
+            _build_binary_type(item_type, class_by_name, pending))
+
+    result = _binary_types.get(klass) or pending.get(klass)
+    if result is not None:
+        return result
+
+    if issubclass(klass, NumericArray):
+        result = _BinaryNumericArray(klass)
+    elif issubclass(klass, Enum):
+        result = _BinaryEnum(klass)
+    elif issubclass(klass, (Sequence, Choice)):
+        compound = _BinarySequence(klass) if issubclass(klass, Sequence) \
+            else _BinaryChoice(klass)
+        pending[klass] = compound
+        compound.fields = [(attr,
+                            _build_binary_type(klass.__annotations__[attr],
+                                               class_by_name, pending))
+                           for attr in klass.__annotations__]
+        return compound
+    else:
+        kind = _leaf_kind(klass)
+        if kind is None:
+            raise ValueError(f'Values of type {klass} have no binary '
+                             f'encoding.')
+        result = _BINARY_SCALARS[kind]()
+
+    pending[klass] = result
+    return result
+
+
+def _binary_type(annotation: Any,
+                 class_by_name: Mapping[str, type]) -> _BinaryType:
+    """Return the '_BinaryType' of the specified 'annotation' (see
+    '_build_binary_type'). Types are published to '_binary_types' only once
+    they are complete, so that other threads never see a compound type whose
+    fields are not yet assigned.
+    """
+    klass = _resolve_type(annotation, class_by_name)
+    result = _binary_types.get(klass)
+    if result is None:
+        pending: Dict[Any, _BinaryType] = {}
+        result = _build_binary_type(klass, class_by_name, pending)
+        with _binary_types_lock:
+            _binary_types.update(pending)
+    return result
+
+
+def encode_binary(obj: Any, class_by_name: Mapping[str, type]) -> bytes:
+    """Return the binary encoding of the specified 'obj', which must be an
+    instance of a generated 'Sequence' or 'Choice' class. See '_BinaryType'
+    for a description of the format.
+    """
+    out = bytearray()
+    _binary_type(type(obj), class_by_name).encode(obj, out)
+    return bytes(out)
+
+
+def decode_binary(return_type: Any, buffer: Any,
+                  class_by_name: Mapping[str, type],
+                  offset: int = 0) -> Any:
+    """Return an instance of the specified 'return_type' decoded from the
+    binary encoding at the optionally specified 'offset' within the
+    specified 'buffer', which may be any object supporting the buffer
+    protocol, such as 'bytes', 'memoryview', or 'mmap.mmap'.
+    """
+    return _binary_type(return_type, class_by_name).decode(buffer, offset)
+
+
+class SequenceView:
+    """Read-only view of a binary-encoded 'Sequence' (see 'encode_binary')
+    whose attributes are decoded from the underlying buffer each time they
+    are accessed, without decoding anything else. Attributes that are
+    sequences or choices are themselves views, and arrays are 'ListView's.
+    Use 'materialize' to decode an instance of the generated class. Classes
+    derived from this one are created for each generated class by 'view'.
+    """
+    __slots__ = ('_buffer', '_offset')
+    _binary: Any
+
+    def __init__(self, buffer: Any, offset: int = 0) -> None:
+        self._buffer = buffer
+        self._offset = offset
+
+    def materialize(self) -> Any:
+        """Return an instance of the generated class decoded from the
+        buffer.
+        """
+        return self._binary.decode(self._buffer, self._offset)
+
+    def __repr__(self) -> str:
+        return f'<{type(self).__name__} at offset {self._offset}>'
+
+
+class ChoiceView(SequenceView):
+    """Read-only view of a binary-encoded 'Choice'. '_selection' is the name
+    of the selected attribute. Accessing any other attribute raises an
+    'AttributeError'.
+    """
+    __slots__ = ()
+
+    @property
+    def _selection(self) -> str:
+        return self._binary.fields[self._selection_id][0]
+
+    @property
+    def _selection_id(self) -> int:
+        index, = _UINT32.unpack_from(self._buffer, self._offset)
+        return index
+
+    @property
+    def _value(self) -> Any:
+        return _view_value(self._binary.fields[self._selection_id][1],
+                           self._buffer, self._offset + 4)
+
+
+class ListView(collections.abc.Sequence):
+    """Read-only view of a binary-encoded array whose items are decoded (or,
+    if they are sequences or choices, viewed) only when accessed.
+    """
+    __slots__ = ('_buffer', '_offset', '_binary', '_count')
+
+    def __init__(self, binary: Any, buffer: Any, offset: int) -> None:
+        self._binary = binary
+        self._buffer = buffer
+        self._offset = offset
+        self._count, = _UINT32.unpack_from(buffer, offset)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(f'Array index {index} out of range.')
+        item = self._binary.item
+        if item.size is not None:
+            return _view_value(item, self._buffer,
+                               self._offset + 4 + index * item.size)
+        item_offset, = _UINT32.unpack_from(self._buffer,
+                                           self._offset + 4 + 4 * index)
+        return _view_value(item, self._buffer, self._offset + item_offset)
+
+    def materialize(self) -> List[Any]:
+        """Return a list of the decoded items."""
+        return self._binary.decode(self._buffer, self._offset)
+
+    def __repr__(self) -> str:
+        return f'<ListView of {self._count} items at offset {self._offset}>'
+
+
+def _view_value(binary: _BinaryType, buffer: Any, offset: int) -> Any:
+    """Return a view of, or for scalars the value of, the specified 'binary'
+    type encoded at the specified 'offset' in the specified 'buffer'.
+    """
+    if isinstance(binary, (_BinarySequence, _BinaryChoice)):
+        return _view_class(binary)(buffer, offset)
+    elif isinstance(binary, _BinaryList):
+        return ListView(binary, buffer, offset)
+    return binary.decode(buffer, offset)
+
+
+def _sequence_view_property(index: int, binary: _BinaryType) -> property:
+    def get(self: SequenceView) -> Any:
+        field_offset, = _UINT32.unpack_from(self._buffer,
+                                            self._offset + 4 * index)
+        if field_offset == 0:
+            return None
+        return _view_value(binary, self._buffer, self._offset + field_offset)
+
+    return property(get)
+
+
+def _choice_view_property(index: int, attr: str,
+                          binary: _BinaryType) -> property:
+    def get(self: SequenceView) -> Any:
+        selected, = _UINT32.unpack_from(self._buffer, self._offset)
+        if selected != index:
+            raise AttributeError(f'{attr} is not the selection of this '
+                                 f'{type(self).__name__}.')
+        return _view_value(binary, self._buffer, self._offset + 4)
+
+    return property(get)
+
+
+# view class of each '_BinarySequence' and '_BinaryChoice'
+_view_classes: Dict[_BinaryType, type] = {}
+
+
+def _view_class(binary: Any) -> type:
+    """Return the view class of the specified '_BinarySequence' or
+    '_BinaryChoice', creating it if necessary.
+    """
+    klass = _view_classes.get(binary)
+    if klass is not None:
+        return klass
+
+    namespace: Dict[str, Any] = {'__slots__': (), '_binary': binary}
+    if isinstance(binary, _BinaryChoice):
+        base: type = ChoiceView
+        for index, (attr, field_type) in enumerate(binary.fields):
+            namespace[attr] = _choice_view_property(index, attr, field_type)
+    else:
+        base = SequenceView
+        for index, (attr, field_type) in enumerate(binary.fields):
+            namespace[attr] = _sequence_view_property(index, field_type)
+
+    klass = type(binary.klass.__name__ + 'View', (base, ), namespace)
+    _view_classes[binary] = klass
+    return klass
+
+
+def view(return_type: Any, buffer: Any,
+         class_by_name: Mapping[str, type],
+         offset: int = 0) -> Any:
+    """Return a read-only view of the binary-encoded instance of the
+    specified 'return_type', which must be a generated 'Sequence' or
+    'Choice' class, at the optionally specified 'offset' within the specified
+    'buffer'. See 'SequenceView'.
+    """
+    binary = _binary_type(return_type, class_by_name)
+    if not isinstance(binary, (_BinarySequence, _BinaryChoice)):
+        raise ValueError(f'Only sequences and choices can be viewed, not '
+                         f'{return_type}.')
+    return _view_class(binary)(buffer, offset)
+
+
+# fixed part of the header of a record file: magic, format version, length of
+# the record type name, record count, and absolute offset of the index
+_RECORD_FILE_HEADER = struct.Struct('<8sIIQQ')
+_RECORD_FILE_MAGIC = b'STAGREC\x00'
+_RECORD_FILE_VERSION = 2
+_UINT64 = struct.Struct('<Q')
+
+
+def _record_file_header(path: str) -> Tuple[str, int, int, int]:
+    """Return (type name, record count, index offset, header size) read from
+    the header of the record file at the specified 'path'.
+    """
+    with open(path, 'rb') as file:
+        fixed = file.read(_RECORD_FILE_HEADER.size)
+        if len(fixed) != _RECORD_FILE_HEADER.size:
+            raise ValueError(f'{path} is not a record file.')
+        magic, version, name_length, count, index_offset = \
+            _RECORD_FILE_HEADER.unpack(fixed)
+        if magic != _RECORD_FILE_MAGIC:
+            raise ValueError(f'{path} is not a record file.')
+        if version != _RECORD_FILE_VERSION:
+            raise ValueError(f'{path} has record file format version '
+                             f'{version}, but only version '
+                             f'{_RECORD_FILE_VERSION} is supported.')
+        name = file.read(name_length).decode('utf-8')
+    return name, count, index_offset, _RECORD_FILE_HEADER.size + name_length
+
+
+def _check_record_type(path: str, name: str, record_type: Any) -> None:
+    if name != record_type.__name__:
+        raise ValueError(f'{path} contains {name} records, not '
+                         f'{record_type.__name__} records.')
+
+
+class RecordFileWriter:
+    """Writer of a file of binary-encoded records of one generated type,
+    which a 'RecordFile' can read by index without reading the whole file.
+    The file starts with a header containing the record count and the offset
+    of an index of record offsets, which follows the records. If 'append' is
+    true and the file exists, then records are added to it. The index and
+    header are written when the writer is closed. When appending, the new
+    records overwrite the old index, which is read into memory first, so
+    that appending many times does not leave a dead index behind each time.
+    A failure before closing an appending writer therefore leaves the file
+    unreadable.
+    """
+
+    def __init__(self,
+                 path: str,
+                 record_type: Any,
+                 class_by_name: Mapping[str, type],
+                 append: bool = False) -> None:
+        self.path = path
+        self.record_type = record_type
+        self._binary = _binary_type(record_type, class_by_name)
+        self._offsets = array.array('Q')
+        if append and os.path.exists(path):
+            name, count, index_offset, _ = _record_file_header(path)
+            _check_record_type(path, name, record_type)
+            self._file = open(path, 'r+b')
+            self._file.seek(index_offset)
+            self._offsets.frombytes(self._file.read(8 * count))
+            if sys.byteorder != 'little':
+                self._offsets.byteswap()
+            self._file.seek(index_offset)
+            self._file.truncate()
+        else:
+            name_bytes = record_type.__name__.encode('utf-8')
+            self._file = open(path, 'wb')
+            self._file.write(
+                _RECORD_FILE_HEADER.pack(_RECORD_FILE_MAGIC,
+                                         _RECORD_FILE_VERSION,
+                                         len(name_bytes), 0, 0))
+            self._file.write(name_bytes)
+
+    def write(self, record: Any) -> None:
+        """Append the specified 'record' to the file."""
+        if not isinstance(record, self.record_type):
+            raise ValueError(f'Expected a {self.record_type.__name__} but '
+                             f'got a {type(record)}.')
+        out = bytearray()
+        self._binary.encode(record, out)
+        self._offsets.append(self._file.tell())
+        self._file.write(out)
+
+    def close(self) -> None:
+        """Write the index and header, and close the file."""
+        if self._file.closed:
+            return
+        index_offset = self._file.tell()
+        offsets = array.array('Q', self._offsets)
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        self._file.write(offsets.tobytes())
+        self._file.flush()
+        self._file.seek(_RECORD_FILE_HEADER.size - 16)
+        self._file.write(
+            struct.pack('<QQ', len(self._offsets), index_offset))
+        self._file.close()
+
+    def __enter__(self) -> 'RecordFileWriter':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+class RecordFile:
+    """Read-only, random access view of a file written by a
+    'RecordFileWriter'. The file is memory-mapped, so that opening it takes
+    constant time and indexing reads only the pages containing the index
+    entry and the record. Indexing with an integer decodes one record, and
+    indexing with a slice decodes a list of records.
+    """
+
+    def __init__(self, path: str, record_type: Any,
+                 class_by_name: Mapping[str, type]) -> None:
+        name, count, index_offset, _ = _record_file_header(path)
+        _check_record_type(path, name, record_type)
+        self.path = path
+        self.record_type = record_type
+        self._binary = _binary_type(record_type, class_by_name)
+        self._count = count
+        self._index_offset = index_offset
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return [self._decode(i) for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(f'Record index {index} out of range.')
+        return self._decode(index)
+
+    def __iter__(self) -> Iterator[Any]:
+        for i in range(self._count):
+            yield self._decode(i)
+
+    def view(self, index: int) -> Any:
+        """Return a read-only view of the record at the specified 'index'
+        without decoding it. See 'SequenceView'.
+        """
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(f'Record index {index} out of range.')
+        return _view_class(self._binary)(self._mmap,
+                                         self._record_offset(index))
+
+    def buffer(self, index: int) -> memoryview:
+        """Return a 'memoryview', starting at the encoded record at the
+        specified 'index', of the rest of the file. The view must be released
+        before this object is closed.
+        """
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(f'Record index {index} out of range.')
+        return memoryview(self._mmap)[self._record_offset(index):]
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def __enter__(self) -> 'RecordFile':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def _record_offset(self, index: int) -> int:
+        return _UINT64.unpack_from(self._mmap,
+                                   self._index_offset + 8 * index)[0]
+
+    def _decode(self, index: int) -> Any:
+        return self._binary.decode(self._mmap, self._record_offset(index))
+
+
+# framings of the messages in a stream (see 'decode_stream'): one JSON value
+# per line (JSON Lines), or each JSON value preceded by its length in bytes
+# as a four byte big-endian unsigned integer
+STREAM_FRAMINGS = ('lines', 'length-prefixed')
+_LENGTH_PREFIX = struct.Struct('>I')
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _check_framing(framing: str) -> None:
+    if framing not in STREAM_FRAMINGS:
+        raise ValueError(f'framing must be one of {STREAM_FRAMINGS}, not '
+                         f'{repr(framing)}.')
+
+
+async def _read_frames(reader: Any, framing: str,
+                       max_message_size: int) -> AsyncIterator[bytes]:
+    """Yield each message read from the specified 'asyncio.StreamReader'
+    having the specified 'framing'. Raise a 'DecodeError' if a message is
+    larger than the specified 'max_message_size', or if the stream ends
+    within a length-prefixed message.
+    """
+    import asyncio
+
+    if framing == 'length-prefixed':
+        while True:
+            try:
+                prefix = await reader.readexactly(_LENGTH_PREFIX.size)
+            except asyncio.IncompleteReadError as error:
+                if error.partial:
+                    raise DecodeError('Stream ended within a message '
+                                      'length.') from error
+                return
+            size, = _LENGTH_PREFIX.unpack(prefix)
+            if size > max_message_size:
+                raise DecodeError(f'Message of {size} bytes is larger than '
+                                  f'{max_message_size}.')
+            try:
+                yield await reader.readexactly(size)
+            except asyncio.IncompleteReadError as error:
+                raise DecodeError(f'Stream ended within a message of {size} '
+                                  f'bytes.') from error
+
+    # Otherwise, the framing is 'lines'. Read chunks rather than lines,
+    # because 'StreamReader.readline' fails on lines longer than the reader's
+    # buffer limit. 'pending' is the start of a line split across chunks.
+    pending: List[bytes] = []
+    pending_size = 0
+    while True:
+        chunk = await reader.read(_STREAM_CHUNK_SIZE)
+        if not chunk:
+            line = b''.join(pending)
+            if line.strip():
+                yield line
+            return
+        lines = chunk.split(b'\n')
+        if len(lines) > 1:
+            pending.append(lines[0])
+            lines[0] = b''.join(pending)
+            pending = []
+            pending_size = 0
+            for line in lines[:-1]:
+                if len(line) > max_message_size:
+                    raise DecodeError(f'Message of {len(line)} bytes is '
+                                      f'larger than {max_message_size}.')
+                if line.strip():
+                    yield line
+        pending.append(lines[-1])
+        pending_size += len(lines[-1])
+        if pending_size > max_message_size:
+            raise DecodeError(f'Message is larger than {max_message_size} '
+                              f'bytes.')
+
+
+def _decode_message(return_type: Any, message: bytes,
+                    name_mappings: Mapping[type, NameMapping],
+                    class_by_name: Mapping[str, type],
+                    options: Optional[DecoderOptions]) -> Any:
+    return from_jsonable(return_type, json.loads(message), name_mappings,
+                         class_by_name, None, options)
+
+
+async def decode_stream(return_type: Any,
+                        reader: Any,
+                        name_mappings: Mapping[type, NameMapping],
+                        class_by_name: Mapping[str, type],
+                        *,
+                        framing: str = 'lines',
+                        options: Optional[DecoderOptions] = None,
+                        max_message_size: int = 64 * 1024 * 1024,
+                        offload_size: Optional[int] = 256 * 1024,
+                        executor: Any = None) -> AsyncIterator[Any]:
+    """Yield an instance of the specified 'return_type' decoded from each
+    JSON message read from the specified 'asyncio.StreamReader', e.g.
+
+        async for order in decode_stream(Order, reader, ...):
+            ...
+
+    'framing' is one of 'STREAM_FRAMINGS'. The next message is read only
+    when the previous instance has been consumed, so that a slow consumer
+    pauses the reader's transport. 'options' are as for 'from_jsonable'. A
+    message larger than 'max_message_size' bytes raises a 'DecodeError'.
+
+    Messages of at least 'offload_size' bytes are decoded by the specified
+    'concurrent.futures.Executor' (or the event loop's default executor, if
+    'executor' is 'None'), so that they do not stall the event loop. Specify
+    'None' for 'offload_size' to decode every message on the event loop. A
+    process executor requires 'return_type', 'name_mappings' and
+    'class_by_name' to be picklable, which they are not in modules generated
+    with stag's '--fast-import' option.
+    """
+    import asyncio
+
+    _check_framing(framing)
+    loop = asyncio.get_running_loop()
+    async for message in _read_frames(reader, framing, max_message_size):
+        if offload_size is not None and len(message) >= offload_size:
+            yield await loop.run_in_executor(executor, _decode_message,
+                                             return_type, message,
+                                             name_mappings, class_by_name,
+                                             options)
+        else:
+            yield _decode_message(return_type, message, name_mappings,
+                                  class_by_name, options)
+
+
+async def encode_stream(objects: Any,
+                        writer: Any,
+                        name_mappings: Mapping[type, NameMapping],
+                        *,
+                        framing: str = 'lines',
+                        options: Optional[EncoderOptions] = None) -> int:
+    """Write each of the specified 'objects', an iterable or asynchronous
+    iterable of instances of generated classes, to the specified
+    'asyncio.StreamWriter' as a JSON message having the specified 'framing'
+    (see 'decode_stream'), and return how many were written. Wait for the
+    writer to drain after each message, so that a slow peer pauses the
+    encoding. 'options' are as for 'to_jsonable'.
+    """
+    _check_framing(framing)
+    lines = framing == 'lines'
+    count = 0
+
+    async def write(obj: Any) -> None:
+        message = json.dumps(to_jsonable(obj, name_mappings, options),
+                             separators=(',', ':')).encode('utf-8')
+        if lines:
+            writer.writelines((message, b'\n'))
+        else:
+            writer.writelines((_LENGTH_PREFIX.pack(len(message)), message))
+        await writer.drain()
+
+    if hasattr(objects, '__aiter__'):
+        async for obj in objects:
+            await write(obj)
+            count += 1
+    else:
+        for obj in objects:
+            await write(obj)
+            count += 1
+    return count
+
+
+def open_compressed(path: str, mode: str = 'rb') -> Any:
+    """Return a binary file object open in the specified 'mode' on the file
+    at the specified 'path', which is compressed with gzip, bzip2 or xz if
+    its name ends with '.gz', '.bz2', or '.xz' or '.lzma', respectively, and
+    is otherwise uncompressed.
+    """
+    _, extension = os.path.splitext(path)
+    if extension == '.gz':
+        import gzip
+        return gzip.open(path, mode)
+    if extension == '.bz2':
+        import bz2
+        return bz2.open(path, mode)
+    if extension in ('.xz', '.lzma'):
+        import lzma
+        return lzma.open(path, mode)
+    return open(path, mode)
+
+
+class PipelineStage:
+    """Counters of one stage of a 'JsonLinesReader' or 'JsonLinesWriter'.
+    'seconds' is the time spent doing the stage's work, and 'wait_seconds'
+    is the time the stage's thread spent blocked on a queue between stages.
+    A stage whose neighbors wait on it while it rarely waits is the
+    bottleneck.
+    """
+
+    def __init__(self,
+                 name: str,
+                 items: int = 0,
+                 size_bytes: int = 0,
+                 seconds: float = 0.0,
+                 wait_seconds: float = 0.0) -> None:
+        self.name = name
+        self.items = items
+        self.size_bytes = size_bytes
+        self.seconds = seconds
+        self.wait_seconds = wait_seconds
+
+    def items_per_second(self) -> float:
+        return self.items / self.seconds if self.seconds else 0.0
+
+    def bytes_per_second(self) -> float:
+        return self.size_bytes / self.seconds if self.seconds else 0.0
+
+    def _copy(self) -> 'PipelineStage':
+        return PipelineStage(self.name, self.items, self.size_bytes,
+                             self.seconds, self.wait_seconds)
+
+    def __repr__(self) -> str:
+        return (f'PipelineStage(name={repr(self.name)}, items={self.items}, '
+                f'size_bytes={self.size_bytes}, seconds={self.seconds:.6f}, '
+                f'wait_seconds={self.wait_seconds:.6f})')
+
+
+_PIPELINE_END = object()  # marks the end of the chunks in a pipeline queue
+
+
+class _PipelineQueue:
+    """Bounded queue of chunks between a pipeline's two threads. Either side
+    can abandon the queue, after which the other side's 'put' returns false
+    and its 'get' returns '_PIPELINE_END'.
+    """
+
+    def __init__(self, max_chunks: int) -> None:
+        import queue
+
+        self._queue: Any = queue.Queue(max_chunks)
+        self._full = queue.Full
+        self._empty = queue.Empty
+        self.abandoned = threading.Event()
+
+    def put(self, chunk: Any) -> bool:
+        while not self.abandoned.is_set():
+            try:
+                self._queue.put(chunk, timeout=0.1)
+                return True
+            except self._full:
+                pass
+        return False
+
+    def get(self) -> Any:
+        while not self.abandoned.is_set():
+            try:
+                return self._queue.get(timeout=0.1)
+            except self._empty:
+                pass
+        return _PIPELINE_END
+
+
+class JsonLinesReader:
+    """Iterable of the instances of a generated type decoded from a JSON
+    Lines file, which is decompressed according to its extension (see
+    'open_compressed'). Decompression and line splitting run on a background
+    thread, which hands chunks of at most 'queue_size' lines through a queue
+    of at most 'max_chunks' chunks to the iterating thread, where the lines
+    are parsed and decoded. The codecs of 'gzip', 'bz2' and 'lzma' release
+    the GIL, so decompression overlaps with decoding. 'options' are as for
+    'from_jsonable'.
+
+    Each iteration reads the file from the beginning. 'statistics' returns
+    the counters of the "read", "parse" and "decode" stages, accumulated
+    over all iterations.
+    """
+
+    def __init__(self,
+                 path: str,
+                 return_type: Any,
+                 name_mappings: Mapping[type, NameMapping],
+                 class_by_name: Mapping[str, type],
+                 *,
+                 options: Optional[DecoderOptions] = None,
+                 read_size: int = 1024 * 1024,
+                 queue_size: int = 1000,
+                 max_chunks: int = 8) -> None:
+        self.path = path
+        self.return_type = return_type
+        self.name_mappings = name_mappings
+        self.class_by_name = class_by_name
+        self.options = options
+        self.read_size = read_size
+        self.queue_size = queue_size
+        self.max_chunks = max_chunks
+        # The counters are updated without a lock, each by only one thread.
+        self._read = PipelineStage('read')
+        self._parse = PipelineStage('parse')
+        self._decode = PipelineStage('decode')
+
+    def statistics(self) -> List[PipelineStage]:
+        """Return a snapshot of the counters of each stage, in order."""
+        return [stage._copy() for stage in (self._read, self._parse,
+                                            self._decode)]
+
+    def __iter__(self) -> Iterator[Any]:
+        chunks = _PipelineQueue(self.max_chunks)
+        errors: List[BaseException] = []
+        thread = threading.Thread(target=self._produce,
+                                  args=(chunks, errors),
+                                  name=f'JsonLinesReader({self.path})',
+                                  daemon=True)
+        thread.start()
+        clock = time.perf_counter
+        parse = self._parse
+        decode = self._decode
+        try:
+            while True:
+                before = clock()
+                lines = chunks.get()
+                parse.wait_seconds += clock() - before
+                if lines is _PIPELINE_END:
+                    break
+                before = clock()
+                parsed = [json.loads(line) for line in lines]
+                middle = clock()
+                objects = [
+                    from_jsonable(self.return_type, obj, self.name_mappings,
+                                  self.class_by_name, None, self.options)
+                    for obj in parsed
+                ]
+                after = clock()
+                parse.items += len(lines)
+                parse.size_bytes += sum(len(line) for line in lines)
+                parse.seconds += middle - before
+                decode.items += len(objects)
+                decode.seconds += after - middle
+                yield from objects
+        finally:
+            chunks.abandoned.set()
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def _produce(self, chunks: _PipelineQueue,
+                 errors: List[BaseException]) -> None:
+        clock = time.perf_counter
+        stage = self._read
+        try:
+            with open_compressed(self.path, 'rb') as file:
+                # 'pending' is the start of a line split across reads.
+                pending = b''
+                lines: List[bytes] = []
+                while True:
+                    before = clock()
+                    data = file.read(self.read_size)
+                    if data:
+                        split = data.split(b'\n')
+                        split[0] = pending + split[0]
+                        pending = split.pop()
+                    else:
+                        split = [pending]
+                    for line in split:
+                        if line.strip():
+                            lines.append(line)
+                    stage.size_bytes += len(data)
+                    stage.seconds += clock() - before
+                    while len(lines) >= self.queue_size or \
+                            (lines and not data):
+                        chunk = lines[:self.queue_size]
+                        del lines[:self.queue_size]
+                        stage.items += len(chunk)
+                        before = clock()
+                        sent = chunks.put(chunk)
+                        stage.wait_seconds += clock() - before
+                        if not sent:
+                            return
+                    if not data:
+                        break
+        except BaseException as error:
+            errors.append(error)
+        chunks.put(_PIPELINE_END)
+
+
+class JsonLinesWriter:
+    """Writer of instances of generated types to a JSON Lines file, which is
+    compressed according to its extension (see 'open_compressed'). The
+    calling thread encodes each object, and a background thread compresses
+    and writes chunks of at most 'queue_size' lines, taken from a queue of
+    at most 'max_chunks' chunks. 'options' are as for 'to_jsonable'. The
+    file is complete only once the writer is closed. 'statistics' returns
+    the counters of the "encode" and "write" stages.
+    """
+
+    def __init__(self,
+                 path: str,
+                 name_mappings: Mapping[type, NameMapping],
+                 *,
+                 options: Optional[EncoderOptions] = None,
+                 queue_size: int = 1000,
+                 max_chunks: int = 8) -> None:
+        self.path = path
+        self.name_mappings = name_mappings
+        self.options = options
+        self.queue_size = queue_size
+        # The counters are updated without a lock, each by only one thread.
+        self._encode = PipelineStage('encode')
+        self._write = PipelineStage('write')
+        self._lines: List[bytes] = []
+        self._errors: List[BaseException] = []
+        self._chunks = _PipelineQueue(max_chunks)
+        self._file = open_compressed(path, 'wb')
+        self._thread = threading.Thread(target=self._consume,
+                                        name=f'JsonLinesWriter({path})',
+                                        daemon=True)
+        self._thread.start()
+
+    def write(self, obj: Any) -> None:
+        """Append the specified 'obj' to the file as one line."""
+        before = time.perf_counter()
+        line = json.dumps(to_jsonable(obj, self.name_mappings, self.options),
+                          separators=(',', ':')).encode('utf-8') + b'\n'
+        self._encode.seconds += time.perf_counter() - before
+        self._encode.items += 1
+        self._encode.size_bytes += len(line)
+        self._lines.append(line)
+        if len(self._lines) >= self.queue_size:
+            self._send()
+
+    def write_all(self, objects: Iterable[Any]) -> int:
+        """Append each of the specified 'objects' to the file, and return how
+        many were written.
+        """
+        count = 0
+        for obj in objects:
+            self.write(obj)
+            count += 1
+        return count
+
+    def statistics(self) -> List[PipelineStage]:
+        """Return a snapshot of the counters of each stage, in order."""
+        return [self._encode._copy(), self._write._copy()]
+
+    def close(self) -> None:
+        """Write the remaining lines and close the file. Raise the first
+        error, if any, encountered while writing.
+        """
+        if self._thread.is_alive():
+            if self._lines:
+                self._send()
+            self._chunks.put(_PIPELINE_END)
+            self._thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def __enter__(self) -> 'JsonLinesWriter':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def _send(self) -> None:
+        chunk = self._lines
+        self._lines = []
+        before = time.perf_counter()
+        sent = self._chunks.put(chunk)
+        self._encode.wait_seconds += time.perf_counter() - before
+        if not sent:
+            raise self._errors[0]
+
+    def _consume(self) -> None:
+        clock = time.perf_counter
+        stage = self._write
+        try:
+            with self._file:
+                while True:
+                    before = clock()
+                    chunk = self._chunks.get()
+                    stage.wait_seconds += clock() - before
+                    if chunk is _PIPELINE_END:
+                        break
+                    before = clock()
+                    data = b''.join(chunk)
+                    self._file.write(data)
+                    stage.seconds += clock() - before
+                    stage.items += len(chunk)
+                    stage.size_bytes += len(data)
+        except BaseException as error:
+            self._errors.append(error)
+            self._chunks.abandoned.set()
+
+
+class _TableLayout:
+    """Flattening of a 'Sequence' class into the columns of a table,
+    computed once per class, 'explode' path and 'separator' by 'TableWriter'
+    and 'TableReader' from the class's '_ColumnLayout'. There is a column
+    per basic value, named by its schema path as in 'Columns', where:
+
+    - an optional sequence has a column at its own path that is "true" if
+      the sequence is present,
+    - a choice has a column at its own path containing the element name of
+      the selected alternative, followed by the columns of every alternative,
+    - an array of basic values or enumerations is one column of the items
+      joined by 'separator', and an array of sequences is one column of the
+      array as JSON, except that
+    - the array at the 'explode' path, if any, has a row per item, in the
+      item's own columns (named like "Items[].Price", or "Flags[]" for basic
+      values), and then the first column, "#", numbers the records so that
+      the rows of each record can be recognized.
+
+    A missing value is an empty cell. Empty strings are therefore read as
+    'None' where the attribute is optional.
+    """
+
+    def __init__(self, record_type: Any,
+                 name_mappings: Mapping[type, NameMapping],
+                 class_by_name: Mapping[str, type], explode: Optional[str],
+                 separator: str) -> None:
+        layout = Columns.layout(record_type, name_mappings, class_by_name)
+        self.klass = record_type
+        self.nodes = layout.nodes
+        self.name_mappings = name_mappings
+        self.class_by_name = class_by_name
+        self.explode = explode
+        self.separator = separator
+        self.columns: List[str] = [] if explode is None else ['#']
+        self.explode_node: Optional[Tuple[Any, ...]] = None
+        self.explode_start = 0
+        self.explode_width = 0
+        # column count, and whether optional, of nodes by 'id'
+        self._widths: Dict[int, int] = {}
+        self._optional: Set[int] = set()
+        self._add_sequence(record_type, self.nodes, '', True)
+        if explode is not None and self.explode_node is None:
+            raise ValueError(f'{explode} is not the path of an array outside '
+                             f'of any array or choice in '
+                             f'{record_type.__name__}.')
+
+    def _add_sequence(self, klass: Any, nodes: List[Tuple[Any, ...]],
+                      prefix: str, explodable: bool) -> None:
+        for node in nodes:
+            annotation = _resolve_type(klass.__annotations__[node[1]],
+                                       self.class_by_name)
+            if _optional_inner(annotation) is not None:
+                self._optional.add(id(node))
+            self._add_node(node, prefix + node[2], explodable)
+
+    def _add_node(self, node: Tuple[Any, ...], path: str,
+                  explodable: bool) -> None:
+        start = len(self.columns)
+        what = node[0]
+        if what == 'struct':
+            if node[5]:
+                self.columns.append(path)
+            self._add_sequence(node[4], node[6], path + '.', explodable)
+        elif what == 'choice':
+            self.columns.append(path)
+            for _, alt_elem, child in node[5]:
+                self._add_node(child, f'{path}.{alt_elem}', False)
+        elif what == 'list' and explodable and path == self.explode:
+            self.explode_node = node
+            self.explode_start = start
+            item = node[4]
+            if item[0] == 'columns':
+                self._add_sequence(item[1].klass, item[1].nodes, path + '[].',
+                                   False)
+            else:
+                self._add_node(item, path + '[]', False)
+            self.explode_width = len(self.columns) - start
+        else:
+            self.columns.append(path)
+        self._widths[id(node)] = len(self.columns) - start
+
+    def rows(self, record: Any, number: int,
+             options: Optional[EncoderOptions]) -> List[List[str]]:
+        """Return the rows of the specified 'record', which is numbered by
+        the specified 'number' if an array is exploded.
+        """
+        cells: List[str] = [] if self.explode is None else [str(number)]
+        exploded: List[Any] = []
+        self._sequence_cells(self.nodes, record, cells, exploded, options)
+        if not exploded or not exploded[0]:
+            return [cells]
+        start, width = self.explode_start, self.explode_width
+        item = self.explode_node[4]  # type: ignore
+        rows = []
+        for value in exploded[0]:
+            row = list(cells)
+            item_cells: List[str] = []
+            if item[0] == 'columns':
+                self._sequence_cells(item[1].nodes, value, item_cells, [],
+                                     options)
+            else:
+                self._cells(item, value, item_cells, [], options)
+            row[start:start + width] = item_cells
+            rows.append(row)
+        return rows
+
+    def _sequence_cells(self, nodes: List[Tuple[Any, ...]], value: Any,
+                        cells: List[str], exploded: List[Any],
+                        options: Optional[EncoderOptions]) -> None:
+        for node in nodes:
+            self._cells(node, getattr(value, node[1]), cells, exploded,
+                        options)
+
+    def _cells(self, node: Tuple[Any, ...], value: Any, cells: List[str],
+               exploded: List[Any], options: Optional[EncoderOptions]) -> None:
+        """Append to the specified 'cells' those of the specified 'value' of
+        the specified layout 'node'. If 'node' is exploded, then append
+        empty cells and append 'value' to the specified 'exploded'.
+        """
+        what = node[0]
+        if value is None:
+            cells.extend([''] * self._widths[id(node)])
+        elif what in ('value', 'enum'):
+            cells.append(self._format(node, value, options))
+        elif what == 'list':
+            if node is self.explode_node:
+                exploded.append(value)
+                cells.extend([''] * self.explode_width)
+            else:
+                cells.append(self._join(node, value, options))
+        elif what == 'struct':
+            if node[5]:
+                cells.append('true')
+            self._sequence_cells(node[6], value, cells, exploded, options)
+        else:
+            selected = value._selection_id
+            cells.append(node[5][selected][1])
+            for i, (_, _, child) in enumerate(node[5]):
+                self._cells(child, value._value if i == selected else None,
+                            cells, exploded, options)
+
+    def _format(self, node: Tuple[Any, ...], value: Any,
+                options: Optional[EncoderOptions]) -> str:
+        if node[0] == 'value':
+            kind = node[4]
+            if kind == 'bool':
+                return 'true' if value else 'false'
+            elif kind in ('str', 'int', 'uint'):
+                return str(value)
+            elif kind == 'float':
+                return repr(value)
+            elif kind == 'bytes':
+                return value.hex()
+        return to_jsonable(value, self.name_mappings, options)
+
+    def _join(self, node: Tuple[Any, ...], value: Any,
+              options: Optional[EncoderOptions]) -> str:
+        item = node[4]
+        if item[0] == 'columns':
+            if not value:
+                return ''
+            return json.dumps(to_jsonable(value, self.name_mappings, options),
+                              separators=(',', ':'))
+        parts = [self._format(item, part, options) for part in value]
+        for part in parts:
+            if not part or self.separator in part:
+                raise ValueError(f'The {node[3]} item {repr(part)} cannot be '
+                                 f'joined by {repr(self.separator)}.')
+        return self.separator.join(parts)
+
+    def record(self, rows: List[List[str]]) -> Any:
+        """Return an instance of this layout's class read from the specified
+        'rows', which are all of the rows of one record.
+        """
+        row = rows[0]
+        cells = iter(row if self.explode is None else row[1:])
+        return self._sequence(self.klass, self.nodes, cells, rows)
+
+    def _sequence(self, klass: Any, nodes: List[Tuple[Any, ...]],
+                  cells: Iterator[str], rows: List[List[str]]) -> Any:
+        return klass(**{
+            node[1]: self._value(node, cells, rows)
+            for node in nodes
+        })
+
+    def _skip(self, cells: Iterator[str], count: int) -> None:
+        for _ in range(count):
+            next(cells)
+
+    def _value(self, node: Tuple[Any, ...], cells: Iterator[str],
+               rows: List[List[str]]) -> Any:
+        """Return the value of the specified layout 'node' read from the
+        specified 'cells', and from the specified 'rows' if 'node' is
+        exploded.
+        """
+        what = node[0]
+        if what == 'value':
+            return self._parse(node, next(cells))
+        elif what == 'enum':
+            cell = next(cells)
+            return node[5][cell] if cell else None
+        elif what == 'list':
+            if node is self.explode_node:
+                self._skip(cells, self.explode_width)
+                return self._exploded(node, rows)
+            return self._split(node, next(cells))
+        elif what == 'struct':
+            if node[5] and not next(cells):
+                self._skip(cells, self._widths[id(node)] - 1)
+                return None
+            return self._sequence(node[4], node[6], cells, rows)
+
+        selected = next(cells)
+        result = None
+        for alt, alt_elem, child in node[5]:
+            if alt_elem == selected:
+                result = node[4](**{alt: self._value(child, cells, rows)})
+            else:
+                self._skip(cells, self._widths[id(child)])
+        return result
+
+    def _parse(self, node: Tuple[Any, ...], cell: str) -> Any:
+        kind = node[4]
+        if not cell and (kind != 'str' or id(node) in self._optional):
+            return None
+        elif kind == 'bool':
+            return cell in ('true', '1')
+        elif kind in ('int', 'uint'):
+            return int(cell)
+        elif kind == 'float':
+            return float(cell)
+        elif kind == 'str':
+            return cell
+        elif kind == 'bytes':
+            return bytes.fromhex(cell)
+        return _parse_iso8601(cell)
+
+    def _split(self, node: Tuple[Any, ...], cell: str) -> Any:
+        item = node[4]
+        if item[0] == 'columns':
+            if not cell:
+                return []
+            return [
+                from_jsonable(item[1].klass, obj, self.name_mappings,
+                              self.class_by_name) for obj in json.loads(cell)
+            ]
+        items = [
+            self._value(item, iter((part, )), [])
+            for part in cell.split(self.separator)
+        ] if cell else []
+        return items if node[5] is None else node[5](items)
+
+    def _exploded(self, node: Tuple[Any, ...], rows: List[List[str]]) -> Any:
+        start, width = self.explode_start, self.explode_width
+        item = node[4]
+        items = []
+        if len(rows) > 1 or any(rows[0][start:start + width]):
+            for row in rows:
+                cells = iter(row[start:start + width])
+                if item[0] == 'columns':
+                    items.append(
+                        self._sequence(item[1].klass, item[1].nodes, cells,
+                                       rows))
+                else:
+                    items.append(self._value(item, cells, rows))
+        return items if node[5] is None else node[5](items)
+
+
+_table_layouts: Dict[Tuple[Any, Optional[str], str], _TableLayout] = {}
+
+
+def _table_layout(record_type: Any, name_mappings: Mapping[type, NameMapping],
+                  class_by_name: Mapping[str, type], explode: Optional[str],
+                  separator: str) -> _TableLayout:
+    key = (record_type, explode, separator)
+    layout = _table_layouts.get(key)
+    if layout is None:
+        layout = _TableLayout(record_type, name_mappings, class_by_name,
+                              explode, separator)
+        _table_layouts[key] = layout
+    return layout
+
+
+class TableWriter:
+    """Writer of instances of a generated 'Sequence' class as the rows of a
+    CSV table, or of a TSV table if 'dialect' is "excel-tab". The columns,
+    which are named in the first row, are the flattened schema paths of the
+    record type's attributes (see 'Columns'). Arrays are joined into one cell
+    by 'separator', except that the array at the 'explode' schema path, if
+    specified, has one row per item. Each record is written as soon as it is
+    given, so that any number of records can be written in constant memory.
+    'file' is a text file opened with "newline=''". 'options' are as for
+    'to_jsonable'.
+    """
+
+    def __init__(self,
+                 file: Any,
+                 record_type: Any,
+                 name_mappings: Mapping[type, NameMapping],
+                 class_by_name: Mapping[str, type],
+                 *,
+                 dialect: Any = 'excel',
+                 explode: Optional[str] = None,
+                 separator: str = '|',
+                 options: Optional[EncoderOptions] = None) -> None:
+        import csv
+
+        self.record_type = record_type
+        self.options = options
+        self._layout = _table_layout(record_type, name_mappings,
+                                     class_by_name, explode, separator)
+        self._writer = csv.writer(file, dialect)
+        self._writer.writerow(self._layout.columns)
+        self._count = 0
+
+    @property
+    def columns(self) -> List[str]:
+        """Return the names of the columns in order."""
+        return list(self._layout.columns)
+
+    def write(self, record: Any) -> None:
+        """Write the row or rows of the specified 'record'."""
+        if not isinstance(record, self.record_type):
+            raise ValueError(f'Expected a {self.record_type.__name__} but '
+                             f'got a {type(record)}.')
+        self._writer.writerows(
+            self._layout.rows(record, self._count, self.options))
+        self._count += 1
+
+    def write_all(self, records: Iterable[Any]) -> int:
+        """Write each of the specified 'records', and return how many were
+        written.
+        """
+        count = 0
+        for record in records:
+            self.write(record)
+            count += 1
+        return count
+
+
+class TableReader:
+    """Iterable of the instances of a generated 'Sequence' class read from
+    the rows of a table written by a 'TableWriter' with the same 'dialect',
+    'explode' and 'separator'. Only one record's rows are held in memory at
+    a time. Raise a 'ValueError' if the table's columns are not those of
+    'record_type'.
+    """
+
+    def __init__(self,
+                 file: Any,
+                 record_type: Any,
+                 name_mappings: Mapping[type, NameMapping],
+                 class_by_name: Mapping[str, type],
+                 *,
+                 dialect: Any = 'excel',
+                 explode: Optional[str] = None,
+                 separator: str = '|') -> None:
+        import csv
+
+        self.record_type = record_type
+        self._layout = _table_layout(record_type, name_mappings,
+                                     class_by_name, explode, separator)
+        self._reader = csv.reader(file, dialect)
+
+    def __iter__(self) -> Iterator[Any]:
+        import itertools
+
+        header = next(self._reader, None)
+        if header != self._layout.columns:
+            raise ValueError(f'The columns {header} are not those of '
+                             f'{self.record_type.__name__}: '
+                             f'{self._layout.columns}')
+        if self._layout.explode is None:
+            for row in self._reader:
+                yield self._layout.record([row])
+        else:
+            for _, rows in itertools.groupby(self._reader,
+                                             operator.itemgetter(0)):
+                yield self._layout.record(list(rows))
+
+
+class MemoryUsage:
+    """Deep retained size of generated objects, as measured by
+    'deep_sizeof'. 'total_bytes' counts each object once, however many
+    times it is referred to. 'by_type' maps the name of each type to the
+    number of its objects and their own bytes, excluding the objects they
+    refer to, so that its bytes sum to 'total_bytes'. 'by_field' maps e.g.
+    "Order.items" to the bytes retained through that attribute, including
+    nested objects, so that the bytes of nested fields are also counted by
+    their enclosing fields. 'roots' is the number of objects measured.
+    """
+
+    def __init__(self) -> None:
+        self.roots = 0
+        self.total_bytes = 0
+        self.objects = 0
+        self.by_type: Dict[str, List[int]] = {}  # name -> [objects, bytes]
+        self.by_field: Dict[str, int] = {}
+
+    def mean_bytes(self) -> float:
+        """Return the mean deep size of the objects measured."""
+        return self.total_bytes / self.roots if self.roots else 0.0
+
+    def merge(self, other: 'MemoryUsage') -> None:
+        """Add the counts of the specified 'other' usage to this one."""
+        self.roots += other.roots
+        self.total_bytes += other.total_bytes
+        self.objects += other.objects
+        for name, (objects, size) in other.by_type.items():
+            counts = self.by_type.setdefault(name, [0, 0])
+            counts[0] += objects
+            counts[1] += size
+        for field, size in other.by_field.items():
+            self.by_field[field] = self.by_field.get(field, 0) + size
+
+    def metrics(self, prefix: str = 'memory') -> Dict[str, float]:
+        """Return this usage as a flat mapping from metric name to value,
+        e.g. "memory.total_bytes", "memory.type.Order.bytes" and
+        "memory.field.Order.items.bytes", for reporting to a metrics system.
+        """
+        result: Dict[str, float] = {
+            f'{prefix}.roots': self.roots,
+            f'{prefix}.total_bytes': self.total_bytes,
+            f'{prefix}.objects': self.objects,
+            f'{prefix}.mean_bytes': self.mean_bytes(),
+        }
+        for name, (objects, size) in self.by_type.items():
+            result[f'{prefix}.type.{name}.objects'] = objects
+            result[f'{prefix}.type.{name}.bytes'] = size
+        for field, size in self.by_field.items():
+            result[f'{prefix}.field.{field}.bytes'] = size
+        return result
+
+    def __repr__(self) -> str:
+        return (f'MemoryUsage(roots={self.roots}, '
+                f'total_bytes={self.total_bytes}, objects={self.objects})')
+
+
+class _SizePlan:
+    """The names under which 'deep_sizeof' reports a generated class and its
+    attributes. See '_size_plan'.
+    """
+
+    def __init__(self, klass: type) -> None:
+        self.type_name = klass.__name__
+        self.fields = {
+            attr: f'{klass.__name__}.{attr}'
+            for attr in klass.__annotations__
+        }
+
+
+_size_plans: Dict[type, _SizePlan] = {}
+
+
+def _size_plan(klass: type) -> _SizePlan:
+    """Return the size plan of the specified generated 'klass', creating it
+    the first time.
+    """
+    plan = _size_plans.get(klass)
+    if plan is None:
+        plan = _size_plans[klass] = _SizePlan(klass)
+    return plan
+
+
+# types of values that refer to no other objects that 'deep_sizeof' counts
+_SIZE_LEAVES = frozenset([
+    str, bytes, int, float, decimal.Decimal, datetime.date, datetime.time,
+    datetime.datetime, datetime.timedelta
+])
+
+
+def _count_object(usage: MemoryUsage, name: str, size: int) -> None:
+    usage.objects += 1
+    counts = usage.by_type.get(name)
+    if counts is None:
+        usage.by_type[name] = [1, size]
+    else:
+        counts[0] += 1
+        counts[1] += size
+
+
+def _deep_size(obj: Any, usage: MemoryUsage, seen: Set[int]) -> int:
+    """Return the bytes retained by the specified 'obj' and by the objects
+    it refers to that are not already in 'seen', adding them to 'seen' and
+    counting them in 'usage'.
+    """
+    klass = type(obj)
+    # Singletons, enumerators and small integers are shared by everything
+    # that refers to them, so no one object retains them.
+    if obj is None or klass is bool:
+        return 0
+    if klass is int:
+        if -5 <= obj <= 256:
+            return 0
+    elif isinstance(obj, Enum):
+        return 0
+
+    key = id(obj)
+    if key in seen:
+        return 0
+    seen.add(key)
+
+    if klass in _SIZE_LEAVES or isinstance(obj, array.array):
+        size = sys.getsizeof(obj)
+        _count_object(usage, klass.__name__, size)
+        return size
+
+    if isinstance(obj, Sequence):
+        # Only attributes in the instance's '__dict__' are retained by the
+        # instance; the others are defaults shared with its class.
+        plan = _size_plans.get(klass) or _size_plan(klass)
+        attributes = obj.__dict__
+        size = sys.getsizeof(obj) + sys.getsizeof(attributes)
+        _count_object(usage, plan.type_name, size)
+        by_field = usage.by_field
+        for attr, value in attributes.items():
+            retained = _deep_size(value, usage, seen)
+            if retained:
+                field = plan.fields.get(attr) or f'{plan.type_name}.{attr}'
+                by_field[field] = by_field.get(field, 0) + retained
+                size += retained
+        return size
+
+    if isinstance(obj, Choice):
+        plan = _size_plans.get(klass) or _size_plan(klass)
+        size = sys.getsizeof(obj)
+        _count_object(usage, plan.type_name, size)
+        retained = _deep_size(obj._value, usage, seen)
+        if retained:
+            field = plan.fields[obj._attrs[obj._selection_id]]
+            usage.by_field[field] = usage.by_field.get(field, 0) + retained
+        return size + retained
+
+    size = sys.getsizeof(obj)
+    _count_object(usage, klass.__name__, size)
+    if klass is list or klass is tuple:
+        for item in obj:
+            size += _deep_size(item, usage, seen)
+    elif klass is dict:
+        for name, value in obj.items():
+            size += _deep_size(name, usage, seen)
+            size += _deep_size(value, usage, seen)
+    # Other objects are counted without the objects that they refer to.
+    return size
+
+
+def deep_sizeof(obj: Any, usage: Optional[MemoryUsage] = None) -> MemoryUsage:
+    """Return the deep retained size of the specified 'obj', which is an
+    instance of a generated class or a list, tuple or dict of them. The
+    attributes of generated classes are walked using their annotations and
+    instance dictionaries, rather than 'gc.get_referents', and an object
+    referred to more than once is counted once. Optionally specify a 'usage'
+    to add the measurement to, which is then returned.
+
+    Objects shared by everything that refers to them, such as 'None',
+    enumerators, small integers and class defaults, are not counted.
+    Interned strings are counted, since the interpreter cannot tell whether
+    another object refers to them. Python 3.11 and later can keep an
+    instance's attributes without a dictionary until '__dict__' is first
+    used, so that the instances of generated sequences may be somewhat
+    smaller than measured, and measuring one allocates its dictionary.
+    """
+    if usage is None:
+        usage = MemoryUsage()
+    usage.roots += 1
+    usage.total_bytes += _deep_size(obj, usage, set())
+    return usage
+
+
+class MemorySampler:
+    """Measure the deep size (see 'deep_sizeof') of one in every 'interval'
+    objects passed to 'observe', starting with the first, so that the memory
+    taken by records can be monitored in production at little cost. If
+    'report' is specified, it is called with the 'MemoryUsage' of each
+    sample, e.g. to send 'MemoryUsage.metrics()' to a metrics system. The
+    samples are also accumulated; see 'statistics'. Instances may be shared
+    between threads.
+    """
+
+    def __init__(self,
+                 interval: int = 10000,
+                 report: Optional[Callable[[MemoryUsage], None]] = None
+                 ) -> None:
+        if interval < 1:
+            raise ValueError(f'interval must be positive, not {interval}.')
+
+        self.interval = interval
+        self.report = report
+        self._lock = threading.Lock()
+        self._observed = 0
+        self._usage = MemoryUsage()
+
+    def observe(self, obj: Any) -> Optional[MemoryUsage]:
+        """Return the memory usage of the specified 'obj' if it is sampled,
+        or return 'None' otherwise.
+        """
+        with self._lock:
+            sampled = self._observed % self.interval == 0
+            self._observed += 1
+        if not sampled:
+            return None
+
+        # Measure without holding the lock, so that other threads are not
+        # kept waiting.
+        usage = deep_sizeof(obj)
+        with self._lock:
+            self._usage.merge(usage)
+        if self.report is not None:
+            self.report(usage)
+        return usage
 
-            attr_values[attr] = from_jsonable(elem_type, value, name_mappings,
-                                              class_by_name)
+    @property
+    def observed(self) -> int:
+        """the number of objects passed to 'observe'"""
+        return self._observed
 
-        return return_type(**attr_values)
+    def statistics(self) -> MemoryUsage:
+        """Return a snapshot of the accumulated usage of the samples."""
+        with self._lock:
+            usage = MemoryUsage()
+            usage.merge(self._usage)
+            return usage
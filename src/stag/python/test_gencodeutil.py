@@ -1,11 +1,211 @@
-from typing import Any, Callable, Union
+from typing import Any, Callable, List, Union
 
 import gencodeutil
 
+import asyncio
+import copy
 import datetime
+import enum
+import json
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import typing
 import unittest
 
 
+class Color(enum.Enum):
+    RED = 0
+    GREEN = 1
+    BLUE = 2
+
+
+class Point(gencodeutil.Sequence):
+    x: int
+    y: int
+    label: str = ''
+
+    def __init__(self, *, x: int, y: int, label: str = '') -> None:
+        gencodeutil.Sequence.__init__(**locals())
+
+
+class Shape(gencodeutil.Choice):
+    circle: float
+    polygon: typing.List["Point"]
+
+    __slots__ = ()
+    SELECTION_ID_CIRCLE = 0
+    SELECTION_ID_POLYGON = 1
+
+    def __init__(self, **kwarg: typing.Union[float, typing.List["Point"]]
+                 ) -> None:
+        gencodeutil.Choice.__init__(self, **kwarg)
+
+
+class Header(gencodeutil.Sequence):
+    timestamp: datetime.datetime
+    source: typing.Optional[str] = None
+
+    def __init__(self,
+                 *,
+                 timestamp: datetime.datetime,
+                 source: typing.Optional[str] = None) -> None:
+        gencodeutil.Sequence.__init__(**locals())
+
+
+class Item(gencodeutil.Sequence):
+    price: float
+    quantity: int = 1
+    color: typing.Optional["Color"] = None
+    tags: typing.List[str] = []
+
+    def __init__(self,
+                 *,
+                 price: float,
+                 quantity: int = 1,
+                 color: typing.Optional["Color"] = None,
+                 tags: typing.List[str] = []) -> None:
+        gencodeutil.Sequence.__init__(**locals())
+
+
+class Order(gencodeutil.Sequence):
+    header: "Header"
+    items: typing.List["Item"] = []
+    shape: typing.Optional["Shape"] = None
+
+    def __init__(self,
+                 *,
+                 header: "Header",
+                 items: typing.List["Item"] = [],
+                 shape: typing.Optional["Shape"] = None) -> None:
+        gencodeutil.Sequence.__init__(**locals())
+
+
+class Empty(gencodeutil.Sequence):
+    def __init__(self) -> None:
+        gencodeutil.Sequence.__init__(**locals())
+
+
+class Priority(enum.IntEnum):
+    LOW = 0
+    HIGH = 1
+
+
+class Task(gencodeutil.Sequence):
+    priority: "Priority"
+    history: typing.List["Priority"] = []
+
+    def __init__(self,
+                 *,
+                 priority: "Priority",
+                 history: typing.List["Priority"] = []) -> None:
+        gencodeutil.Sequence.__init__(**locals())
+
+
+class Series(gencodeutil.Sequence):
+    name: str
+    samples: gencodeutil.Float64Array = gencodeutil.Float64Array()
+    counts: gencodeutil.UInt8Array = gencodeutil.UInt8Array()
+    flags: gencodeutil.BoolArray = gencodeutil.BoolArray()
+
+    def __init__(
+            self,
+            *,
+            name: str,
+            samples: gencodeutil.Float64Array = gencodeutil.Float64Array(),
+            counts: gencodeutil.UInt8Array = gencodeutil.UInt8Array(),
+            flags: gencodeutil.BoolArray = gencodeutil.BoolArray()) -> None:
+        gencodeutil.Sequence.__init__(**locals())
+
+
+_name_mappings = {
+    Color: gencodeutil.EnumMapping(Color, {
+        'RED': 'red',
+        'GREEN': 'green',
+        'BLUE': 'blue'
+    }),
+    Priority: gencodeutil.EnumMapping(Priority, {
+        'LOW': 'low',
+        'HIGH': 'high'
+    }),
+    Task: gencodeutil.NameMapping({
+        'priority': 'Priority',
+        'history': 'History'
+    }),
+    Point: gencodeutil.NameMapping({
+        'x': 'X',
+        'y': 'Y',
+        'label': 'Label'
+    }),
+    Shape: gencodeutil.NameMapping({
+        'circle': 'Circle',
+        'polygon': 'Polygon'
+    }),
+    Header: gencodeutil.NameMapping({
+        'timestamp': 'Timestamp',
+        'source': 'Source'
+    }),
+    Item: gencodeutil.NameMapping({
+        'price': 'Price',
+        'quantity': 'Quantity',
+        'color': 'Color',
+        'tags': 'Tags'
+    }, {
+        'quantity': 'unsignedShort',
+        'tags': 'token'
+    }),
+    Order: gencodeutil.NameMapping({
+        'header': 'Header',
+        'items': 'Items',
+        'shape': 'Shape'
+    }),
+    Series: gencodeutil.NameMapping({
+        'name': 'Name',
+        'samples': 'Samples',
+        'counts': 'Counts',
+        'flags': 'Flags'
+    })
+}
+
+_class_by_name = {klass.__name__: klass for klass in _name_mappings}
+
+_ORDER_JSONABLE = {
+    'Header': {
+        'Timestamp': '2018-06-25T12:30:00Z',
+        'Source': 'feed'
+    },
+    'Items': [{
+        'Price': 1.5,
+        'Quantity': 2,
+        'Color': 'red',
+        'Tags': ['a', 'b']
+    }, {
+        'Price': 3.25
+    }],
+    'Shape': {
+        'Polygon': [{
+            'X': 0,
+            'Y': 0
+        }, {
+            'X': 1,
+            'Y': 2,
+            'Label': 'tip'
+        }]
+    }
+}
+
+
+def to_jsonable(obj: Any) -> Any:
+    return gencodeutil.to_jsonable(obj, _name_mappings)
+
+
+def from_jsonable(return_type: Any, obj: Any, only: Any = None) -> Any:
+    return gencodeutil.from_jsonable(return_type, obj, _name_mappings,
+                                     _class_by_name, only)
+
+
 class TestParseIso8601(unittest.TestCase):
     def assert_same_when_decoded(
             self, obj: Union[datetime.date, datetime.time, datetime.datetime]
@@ -72,7 +272,1506 @@ class TestParseIso8601(unittest.TestCase):
         with self.assertRaises(Exception):
             gencodeutil._parse_iso8601("This isn't date or time related.")
 
-# TODO: Test to_jsonable and from_jsonable
+
+class TestDatetimeEncoder(unittest.TestCase):
+    def values(self) -> List[Any]:
+        zones = [
+            None, datetime.timezone.utc,
+            datetime.timezone(-datetime.timedelta(hours=4, minutes=2)),
+            datetime.timezone(datetime.timedelta(seconds=37, microseconds=5))
+        ]
+        values: List[Any] = []
+        for i, microsecond in enumerate((0, 1500, 999999, 123456)):
+            for tzinfo in zones:
+                dtm = datetime.datetime(1988 + i, 11, 27, 4, 5, 6,
+                                        microsecond, tzinfo)
+                values.extend([dtm, dtm.timetz(), dtm.date()])
+        return values
+
+    def test_isoformat(self) -> None:
+        encoder = gencodeutil.DatetimeEncoder()
+        for value in self.values() * 2:  # the second time, from the caches
+            with self.subTest(value=value):
+                self.assertEqual(encoder.encode(value), value.isoformat())
+
+    def test_precision(self) -> None:
+        for precision, timespec in ((0, 'seconds'), (3, 'milliseconds'),
+                                    (6, 'microseconds')):
+            encoder = gencodeutil.DatetimeEncoder(precision)
+            for value in self.values():
+                if hasattr(value, 'microsecond'):
+                    expected = value.isoformat(timespec=timespec)
+                else:
+                    expected = value.isoformat()
+                self.assertEqual(encoder.encode(value), expected)
+        with self.assertRaises(ValueError):
+            gencodeutil.DatetimeEncoder(2)
+
+    def test_round_trip(self) -> None:
+        for precision in gencodeutil.DatetimeEncoder.PRECISIONS:
+            encoder = gencodeutil.DatetimeEncoder(precision)
+            for value in self.values():
+                if precision is not None and hasattr(value, 'microsecond'):
+                    # The encoder truncates to the precision.
+                    unit = 10**(6 - precision)
+                    value = value.replace(
+                        microsecond=value.microsecond // unit * unit)
+                with self.subTest(precision=precision, value=value):
+                    self.assertEqual(
+                        gencodeutil._parse_iso8601(encoder.encode(value)),
+                        value)
+
+    def test_options(self) -> None:
+        header = Header(timestamp=datetime.datetime(
+            2018, 6, 25, 12, 30, 0, 250000, datetime.timezone.utc))
+        self.assertEqual(
+            to_jsonable(header)['Timestamp'],
+            '2018-06-25T12:30:00.250000+00:00')
+        options = gencodeutil.EncoderOptions(datetime_precision=3)
+        self.assertEqual(
+            gencodeutil.to_jsonable([header], _name_mappings,
+                                    options)[0]['Timestamp'],
+            '2018-06-25T12:30:00.250+00:00')
+        with self.assertRaises(ValueError):
+            gencodeutil.EncoderOptions(datetime_precision=9)
+
+
+class TestElision(unittest.TestCase):
+    def test_omit_defaults(self) -> None:
+        options = gencodeutil.EncoderOptions(omit_defaults=True)
+        item = Item(price=1.5, quantity=1, color=Color.RED)
+        encoded = gencodeutil.to_jsonable(item, _name_mappings, options)
+        self.assertEqual(encoded, {'Price': 1.5, 'Color': 'red', 'Tags': []})
+        item.quantity = 2
+        self.assertEqual(
+            gencodeutil.to_jsonable(item, _name_mappings, options)['Quantity'],
+            2)
+        self.assertEqual(
+            to_jsonable(from_jsonable(Item, encoded)),
+            to_jsonable(Item(price=1.5, quantity=1, color=Color.RED)))
+
+    def test_omit_empty_arrays(self) -> None:
+        options = gencodeutil.EncoderOptions(omit_empty_arrays=True)
+        order = Order(header=Header(timestamp=datetime.datetime(2018, 6, 25)),
+                      shape=Shape(polygon=[]))
+        encoded = gencodeutil.to_jsonable(order, _name_mappings, options)
+        self.assertNotIn('Items', encoded)
+        # The selection of a choice is never omitted.
+        self.assertEqual(encoded['Shape'], {'Polygon': []})
+        series = Series(name='empty')
+        self.assertEqual(
+            gencodeutil.to_jsonable(series, _name_mappings, options),
+            {'Name': 'empty'})
+
+        for validation in ('none', 'types'):
+            decoded = gencodeutil.from_jsonable(
+                Order, encoded, _name_mappings, _class_by_name,
+                options=gencodeutil.DecoderOptions(validation=validation))
+            self.assertEqual(decoded.items, [])
+            decoded.items.append(Item(price=1))
+            self.assertEqual(Order.items, [])
+        self.assertEqual(
+            from_jsonable(Series, {'Name': 'empty'}).samples,
+            gencodeutil.Float64Array())
+
+
+class TestRuntimeVersion(unittest.TestCase):
+    def test_check(self) -> None:
+        gencodeutil.check_runtime_version(gencodeutil.RUNTIME_VERSION,
+                                          'some version')
+        with self.assertRaisesRegex(ImportError, 'some version'):
+            gencodeutil.check_runtime_version(
+                gencodeutil.RUNTIME_VERSION + 1, 'some version')
+
+
+class TestDecodeCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.calls = 0
+
+    def counting_from_jsonable(self, return_type: Any, obj: Any) -> Any:
+        self.calls += 1
+        return from_jsonable(return_type, obj)
+
+    def test_repeated_payload_is_decoded_once(self) -> None:
+        cache = gencodeutil.DecodeCache()
+        payload = b'{"X": 1, "Y": 2, "Label": "a"}'
+        first = cache.decode(Point, payload, self.counting_from_jsonable)
+        second = cache.decode(Point, payload, self.counting_from_jsonable)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(list(first), [1, 2, 'a'])
+        self.assertEqual(list(second), [1, 2, 'a'])
+        stats = cache.statistics()
+        self.assertEqual((stats.hits, stats.misses), (1, 1))
+
+    def test_copy_on_access(self) -> None:
+        payload = '{"X": 1, "Y": 2}'
+        cache = gencodeutil.DecodeCache()
+        first = cache.decode(Point, payload, from_jsonable)
+        first.x = 100
+        self.assertEqual(cache.decode(Point, payload, from_jsonable).x, 1)
+
+        shared = gencodeutil.DecodeCache(copy_on_access=False)
+        self.assertIs(
+            shared.decode(Point, payload, from_jsonable),
+            shared.decode(Point, payload, from_jsonable))
+
+    def test_copies_share_nothing_mutable(self) -> None:
+        cache = gencodeutil.DecodeCache()
+        payload = json.dumps(_ORDER_JSONABLE)
+        first = cache.decode(Order, payload, from_jsonable)
+        first.items[0].tags.append('changed')
+        first.items.pop()
+        first.shape.polygon[0].x = 100
+        second = cache.decode(Order, payload, from_jsonable)
+        self.assertEqual(to_jsonable(second),
+                         to_jsonable(from_jsonable(Order, _ORDER_JSONABLE)))
+
+    def test_keyed_by_decoder(self) -> None:
+        # Two util modules, or two decoder options, can share a cache.
+        def strict(return_type: Any, obj: Any) -> Any:
+            return gencodeutil.from_jsonable(
+                return_type, obj, _name_mappings, _class_by_name,
+                options=gencodeutil.DecoderOptions(validation='strict'))
+
+        cache = gencodeutil.DecodeCache()
+        payload = '{"Price": 1.5, "Quantity": -1}'
+        self.assertEqual(cache.decode(Item, payload, from_jsonable).quantity,
+                         -1)
+        with self.assertRaises(gencodeutil.DecodeError):
+            cache.decode(Item, payload, strict)
+
+    def test_eviction_by_entries_and_bytes(self) -> None:
+        payloads = [json.dumps({'X': i, 'Y': i}) for i in range(4)]
+
+        by_count = gencodeutil.DecodeCache(max_entries=2)
+        for payload in payloads:
+            by_count.decode(Point, payload, self.counting_from_jsonable)
+        stats = by_count.statistics()
+        self.assertEqual((stats.entries, stats.evictions), (2, 2))
+
+        by_size = gencodeutil.DecodeCache(max_bytes=len(payloads[0]) * 3)
+        for payload in payloads:
+            by_size.decode(Point, payload, from_jsonable)
+        stats = by_size.statistics()
+        self.assertEqual((stats.entries, stats.evictions), (3, 1))
+        self.assertEqual(stats.size_bytes, len(payloads[0]) * 3)
+
+        # The least recently used entry is the one evicted.
+        self.calls = 0
+        by_count.decode(Point, payloads[2], self.counting_from_jsonable)
+        by_count.decode(Point, payloads[0], self.counting_from_jsonable)
+        by_count.decode(Point, payloads[2], self.counting_from_jsonable)
+        self.assertEqual(self.calls, 1)
+
+    def test_threads(self) -> None:
+        cache = gencodeutil.DecodeCache(max_entries=8)
+        payloads = [json.dumps({'X': i, 'Y': -i}) for i in range(16)]
+        errors = []
+
+        def work() -> None:
+            try:
+                for _ in range(50):
+                    for i, payload in enumerate(payloads):
+                        point = cache.decode(Point, payload, from_jsonable)
+                        assert (point.x, point.y) == (i, -i)
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        stats = cache.statistics()
+        self.assertEqual(stats.hits + stats.misses, 4 * 50 * 16)
+        self.assertLessEqual(stats.entries, 8)
+
+
+class TestJsonable(unittest.TestCase):
+    def test_round_trip(self) -> None:
+        order = from_jsonable(Order, _ORDER_JSONABLE)
+        self.assertEqual(order.header.timestamp,
+                         datetime.datetime(
+                             2018, 6, 25, 12, 30,
+                             tzinfo=datetime.timezone.utc))
+        self.assertIs(order.items[0].color, Color.RED)
+        self.assertEqual(order.items[1].tags, [])
+        self.assertEqual(order.shape._selection, 'polygon')
+        self.assertEqual(order.shape.polygon[1].label, 'tip')
+
+        expected = json.loads(json.dumps(_ORDER_JSONABLE))
+        expected['Header']['Timestamp'] = '2018-06-25T12:30:00+00:00'
+        expected['Items'][1].update({'Quantity': 1, 'Tags': []})
+        expected['Shape']['Polygon'][0]['Label'] = ''
+        self.assertEqual(to_jsonable(order), expected)
+
+
+class TestEnums(unittest.TestCase):
+    JSONABLE = {'Priority': 'high', 'History': ['low', 'high']}
+
+    def test_int_enum(self) -> None:
+        task = from_jsonable(Task, self.JSONABLE)
+        self.assertIs(task.priority, Priority.HIGH)
+        self.assertEqual(task.history, [Priority.LOW, Priority.HIGH])
+        self.assertEqual(to_jsonable(task), self.JSONABLE)
+
+        for validation in ('none', 'strict'):
+            options = gencodeutil.DecoderOptions(validation=validation)
+            decoded = gencodeutil.from_jsonable(Task, self.JSONABLE,
+                                                _name_mappings, _class_by_name,
+                                                options=options)
+            self.assertIs(decoded.priority, Priority.HIGH)
+
+        encoded = gencodeutil.encode_binary(task, _class_by_name)
+        decoded = gencodeutil.decode_binary(Task, encoded, _class_by_name)
+        self.assertIs(decoded.history[0], Priority.LOW)
+        self.assertIs(pickle.loads(pickle.dumps(task)).priority,
+                      Priority.HIGH)
+
+    def test_enum_mapping(self) -> None:
+        mapping = _name_mappings[Color]
+        self.assertEqual(mapping.schema_to_py['green'], 'GREEN')
+        self.assertIs(mapping.schema_to_member['blue'], Color.BLUE)
+        self.assertEqual(mapping.member_to_schema[Color.RED], 'red')
+
+        # Older util modules map enumerations with a plain 'NameMapping'.
+        mappings = dict(_name_mappings)
+        mappings[Color] = gencodeutil.NameMapping(mapping.py_to_schema)
+        self.assertEqual(gencodeutil.to_jsonable(Color.BLUE, mappings), 'blue')
+        self.assertIs(
+            gencodeutil.from_jsonable(Color, 'blue', mappings,
+                                      _class_by_name), Color.BLUE)
+
+
+class TestNumericArrays(unittest.TestCase):
+    JSONABLE = {
+        'Name': 'x',
+        'Samples': [0.5, 1, -2.25],
+        'Counts': [0, 255],
+        'Flags': [True, False]
+    }
+
+    def test_round_trip(self) -> None:
+        series = from_jsonable(Series, self.JSONABLE)
+        self.assertIsInstance(series.samples, gencodeutil.Float64Array)
+        self.assertEqual(series.samples.typecode, 'd')
+        self.assertEqual(list(series.samples), [0.5, 1.0, -2.25])
+        self.assertEqual(series.counts.itemsize, 1)
+        self.assertEqual(list(series.flags), [1, 0])
+
+        expected = dict(self.JSONABLE, Samples=[0.5, 1.0, -2.25])
+        self.assertEqual(to_jsonable(series), expected)
+        self.assertEqual(to_jsonable(Series(name='y'))['Flags'], [])
+
+    def test_out_of_range(self) -> None:
+        for field, values in (('Counts', [256]), ('Counts', [-1]),
+                              ('Counts', ['1']), ('Flags', [1]),
+                              ('Samples', ['x'])):
+            with self.subTest(field=field, values=values):
+                with self.assertRaises(ValueError):
+                    from_jsonable(Series, dict(self.JSONABLE,
+                                               **{field: values}))
+
+    def test_defaults_are_not_shared(self) -> None:
+        first, second = Series(name='a'), Series(name='b')
+        first.counts.append(1)
+        self.assertEqual(len(second.counts), 0)
+        self.assertIsInstance(second.counts, gencodeutil.UInt8Array)
+
+        series = from_jsonable(Series, self.JSONABLE)
+        copied = copy.deepcopy(series)
+        self.assertIsInstance(copied.samples, gencodeutil.Float64Array)
+        self.assertIsNot(copied.samples, series.samples)
+
+    def test_binary_and_columns(self) -> None:
+        series = from_jsonable(Series, self.JSONABLE)
+        encoded = gencodeutil.encode_binary(series, _class_by_name)
+        decoded = gencodeutil.decode_binary(Series, encoded, _class_by_name)
+        self.assertIsInstance(decoded.counts, gencodeutil.UInt8Array)
+        self.assertEqual(to_jsonable(decoded), to_jsonable(series))
+
+        columns = gencodeutil.Columns.from_records(
+            Series, [series, Series(name='y')], _name_mappings,
+            _class_by_name)
+        records = columns.to_records()
+        self.assertIsInstance(records[0].flags, gencodeutil.BoolArray)
+        self.assertEqual([to_jsonable(record) for record in records],
+                         [to_jsonable(series),
+                          to_jsonable(Series(name='y'))])
+
+
+class TestDecoderOptions(unittest.TestCase):
+    def decode(self, obj: Any, **kwargs: Any) -> Any:
+        return gencodeutil.from_jsonable(Order, obj, _name_mappings,
+                                         _class_by_name,
+                                         options=gencodeutil.DecoderOptions(
+                                             **kwargs))
+
+    def assertDecodeError(self, path: str, obj: Any, **kwargs: Any) -> None:
+        with self.assertRaises(gencodeutil.DecodeError) as context:
+            self.decode(obj, **kwargs)
+        self.assertEqual(str(context.exception).split(':')[0], path)
+
+    def test_within_limits(self) -> None:
+        order = self.decode(_ORDER_JSONABLE,
+                            max_depth=4,
+                            max_list_length=2,
+                            max_string_length=20,
+                            max_elements=23)
+        self.assertEqual(to_jsonable(order),
+                         to_jsonable(from_jsonable(Order, _ORDER_JSONABLE)))
+
+    def test_limits(self) -> None:
+        self.assertDecodeError('Items[0].Tags', _ORDER_JSONABLE,
+                               max_depth=3)
+        self.assertDecodeError('Items', _ORDER_JSONABLE, max_list_length=1)
+        self.assertDecodeError('Header.Timestamp', _ORDER_JSONABLE,
+                               max_string_length=10)
+        self.assertDecodeError('Items[0].Tags', _ORDER_JSONABLE,
+                               max_elements=12)
+        self.assertDecodeError('<root>', [], max_depth=0)
+
+    def test_unknown_elements(self) -> None:
+        obj = json.loads(json.dumps(_ORDER_JSONABLE))
+        obj['Items'][1]['Discount'] = {'Deeply': [[[['nested']]]]}
+        order = self.decode(obj, max_depth=4)
+        self.assertEqual(order.items[1].price, 3.25)
+        self.assertDecodeError('Items[1].Discount', obj,
+                               skip_unknown_elements=False)
+        with self.assertRaises(KeyError):
+            from_jsonable(Order, obj)
+
+        # A choice whose only element is skipped has no selection.
+        obj['Shape'] = {'Triangle': 3}
+        self.assertDecodeError('Shape', obj)
+
+    def test_invalid(self) -> None:
+        with self.assertRaises(ValueError):
+            gencodeutil.DecoderOptions(max_depth=-1)
+        with self.assertRaises(ValueError):
+            gencodeutil.from_jsonable(Order, _ORDER_JSONABLE, _name_mappings,
+                                      _class_by_name, ['Items'],
+                                      gencodeutil.DecoderOptions())
+
+
+class TestValidation(unittest.TestCase):
+    def decode(self, obj: Any, validation: str, **kwargs: Any) -> Any:
+        return gencodeutil.from_jsonable(Order, obj, _name_mappings,
+                                         _class_by_name,
+                                         options=gencodeutil.DecoderOptions(
+                                             validation=validation,
+                                             **kwargs))
+
+    def test_levels_agree_on_valid_input(self) -> None:
+        expected = to_jsonable(from_jsonable(Order, _ORDER_JSONABLE))
+        for validation in gencodeutil.DecoderOptions.VALIDATION_LEVELS:
+            with self.subTest(validation=validation):
+                order = self.decode(_ORDER_JSONABLE, validation)
+                self.assertIsInstance(order.items[1], Item)
+                self.assertEqual(to_jsonable(order), expected)
+
+    def test_none(self) -> None:
+        order = self.decode(_ORDER_JSONABLE, 'none')
+        # Defaults are filled in but not shared.
+        self.assertEqual(order.items[1].quantity, 1)
+        order.items[1].tags.append('c')
+        self.assertEqual(Item(price=1).tags, [])
+        self.assertEqual(order.shape.polygon[0].label, '')
+
+        # Nothing is checked or coerced.
+        obj = {'Items': [{'Quantity': '7'}]}
+        order = self.decode(obj, 'none', max_depth=0)
+        self.assertEqual(order.items[0].quantity, '7')
+        self.assertFalse(hasattr(order, 'header'))
+
+    def test_types(self) -> None:
+        obj = {'Header': {'Timestamp': '2020-01-01T00:00:00'}, 'Items': [
+            {'Price': '1.5', 'Quantity': 70000, 'Tags': [' x ']}]}
+        order = self.decode(obj, 'types')
+        self.assertEqual(order.items[0].price, 1.5)
+        with self.assertRaises(TypeError):  # 'header' is required
+            self.decode({'Items': []}, 'types')
+
+    def test_strict(self) -> None:
+        def item(**kwargs: Any) -> Any:
+            return {'Header': {'Timestamp': '2020-01-01T00:00:00'},
+                    'Items': [dict({'Price': 1}, **kwargs)]}
+
+        self.assertEqual(self.decode(item(), 'strict').items[0].price, 1)
+        for path, obj in (('Items[0].Price', item(Price='1.5')),
+                          ('Items[0].Quantity', item(Quantity=True)),
+                          ('Items[0].Quantity', item(Quantity=70000)),
+                          ('Items[0].Quantity', item(Quantity=-1)),
+                          ('Items[0].Tags', item(Tags=['a', ' x '])),
+                          ('Items[0].Tags', item(Tags=['a\tb']))):
+            with self.subTest(obj=obj):
+                with self.assertRaises(gencodeutil.DecodeError) as context:
+                    self.decode(obj, 'strict')
+                self.assertEqual(str(context.exception).split(':')[0], path)
+
+    def test_sample(self) -> None:
+        invalid = {'Items': [{'Price': '1.5', 'Quantity': 70000}]}
+        self.assertEqual(
+            self.decode(invalid, 'sample', sample_percent=0).items[0].price,
+            '1.5')
+        with self.assertRaises(gencodeutil.DecodeError):
+            self.decode(invalid, 'sample', sample_percent=100)
+
+    def test_invalid(self) -> None:
+        with self.assertRaises(ValueError):
+            gencodeutil.DecoderOptions(validation='lax')
+        with self.assertRaises(ValueError):
+            gencodeutil.DecoderOptions(validation='sample', sample_percent=101)
+
+
+class TestPickle(unittest.TestCase):
+    def test_empty_sequence(self) -> None:
+        copied = pickle.loads(pickle.dumps(Empty()))
+        self.assertIs(type(copied), Empty)
+        self.assertEqual(list(copied), [])
+        self.assertIs(type(copy.deepcopy(Empty())), Empty)
+
+    def test_round_trip(self) -> None:
+        order = from_jsonable(Order, _ORDER_JSONABLE)
+        order.items.append(Item(price=4, color=Color.BLUE, tags=['z']))
+        series = from_jsonable(Series, TestNumericArrays.JSONABLE)
+        for obj in (order, series, Shape(circle=1.5), Color.GREEN):
+            for protocol in range(2, pickle.HIGHEST_PROTOCOL + 1):
+                with self.subTest(obj=type(obj), protocol=protocol):
+                    copied = pickle.loads(pickle.dumps(obj, protocol))
+                    self.assertIs(type(copied), type(obj))
+                    self.assertEqual(to_jsonable(copied), to_jsonable(obj))
+
+        copied = pickle.loads(pickle.dumps(order))
+        self.assertIs(copied.items[2].color, Color.BLUE)
+        self.assertEqual(copied.shape._selection, 'polygon')
+        self.assertIsInstance(
+            pickle.loads(pickle.dumps(series)).counts,
+            gencodeutil.UInt8Array)
+
+    def test_compact(self) -> None:
+        item = Item(price=1.5, color=Color.RED, tags=['a'])
+        self.assertNotIn(b'price', pickle.dumps(item))
+        self.assertNotIn(b'Color', pickle.dumps(item))
+        self.assertNotIn(b'circle', pickle.dumps(Shape(circle=2.0)))
+
+    def test_not_decoded(self) -> None:
+        order = from_jsonable(Order, _ORDER_JSONABLE, ['Items[].Price'])
+        copied = pickle.loads(pickle.dumps(order))
+        self.assertIs(copied.header, gencodeutil.NOT_DECODED)
+        self.assertIs(copied.items[0].color, gencodeutil.NOT_DECODED)
+
+
+# a types module as generated with stag's '--fast-import' option
+_FAST_IMPORT_SOURCE = """
+import enum
+import gencodeutil
+import typing
+
+
+class Unit(enum.Enum):
+    KG = 0
+    LB = 1
+
+
+def _define_Weight() -> type:
+    class Weight(gencodeutil.Sequence):
+        amount: float
+        unit: "Unit" = Unit.KG
+        notes: typing.List[str] = []
+
+        _required = ('amount',)
+        _mutable_defaults = ('notes',)
+
+        def __init__(self, *, amount: float, unit: "Unit" = Unit.KG,
+                     notes: typing.List[str] = []) -> None:
+            gencodeutil.Sequence.__init__(**locals())
+    return Weight
+
+
+_lazy_classes = {'Weight': _define_Weight}
+
+
+def __getattr__(name: str) -> type:
+    return gencodeutil.lazy_class(globals(), name)
+"""
+
+
+class TestFastImport(unittest.TestCase):
+    def setUp(self) -> None:
+        self.module = type(sys)('fastimportmsg')
+        sys.modules[self.module.__name__] = self.module
+        exec(_FAST_IMPORT_SOURCE, self.module.__dict__)
+        self.name_mappings = gencodeutil.LazyNameMappings(
+            self.module, {
+                'Unit': gencodeutil.EnumMapping(self.module.Unit, {
+                    'KG': 'kg',
+                    'LB': 'lb'
+                }),
+                'Weight': gencodeutil.NameMapping({
+                    'amount': 'Amount',
+                    'unit': 'Unit',
+                    'notes': 'Notes'
+                })
+            })
+        self.class_by_name = gencodeutil.LazyClassesByName(
+            self.module, ('Unit', 'Weight'))
+
+    def tearDown(self) -> None:
+        del sys.modules[self.module.__name__]
+
+    def test_lazy_class(self) -> None:
+        self.assertNotIn('Weight', vars(self.module))
+        Weight = self.module.Weight
+        self.assertIs(vars(self.module)['Weight'], Weight)
+        self.assertIs(self.module.Weight, Weight)
+        self.assertEqual(Weight.__qualname__, 'Weight')
+        with self.assertRaises(AttributeError):
+            self.module.Height
+
+    def test_precomputed_metadata(self) -> None:
+        Weight = self.module.Weight
+        with self.assertRaises(KeyError):
+            gencodeutil.Sequence.__init__(Weight.__new__(Weight),
+                                          unit=self.module.Unit.LB)
+        first, second = Weight(amount=1), Weight(amount=2)
+        first.notes.append('heavy')
+        self.assertEqual(second.notes, [])
+
+    def test_codecs(self) -> None:
+        jsonable = {'Amount': 2.5, 'Unit': 'lb', 'Notes': ['x']}
+        weight = gencodeutil.from_jsonable('Weight', jsonable,
+                                           self.name_mappings,
+                                           self.class_by_name)
+        self.assertIs(weight.unit, self.module.Unit.LB)
+        self.assertEqual(
+            gencodeutil.to_jsonable(weight, self.name_mappings), jsonable)
+        copied = pickle.loads(pickle.dumps(weight))
+        self.assertIs(type(copied), self.module.Weight)
+        self.assertEqual(
+            gencodeutil.to_jsonable(copied, self.name_mappings), jsonable)
+        with self.assertRaises(KeyError):
+            gencodeutil.to_jsonable(Point(x=1, y=2), self.name_mappings)
+
+
+# codecs for some of the classes above, as generated into the util module
+# with stag's '--static-codecs' option
+_STATIC_CODECS_SOURCE = """
+def _Point_to_jsonable(obj: types.Point) -> typing.Dict[str, typing.Any]:
+    result: typing.Dict[str, typing.Any] = {}
+    if obj.x is not None:
+        result["X"] = obj.x
+    if obj.y is not None:
+        result["Y"] = obj.y
+    if obj.label is not None:
+        result["Label"] = obj.label
+    return result
+
+
+def _Point_from_jsonable(obj: typing.Any) -> types.Point:
+    kwargs: typing.Dict[str, typing.Any] = {}
+    for elem, value in obj.items():
+        if elem == "X":
+            kwargs["x"] = int(value)
+        elif elem == "Y":
+            kwargs["y"] = int(value)
+        elif elem == "Label":
+            kwargs["label"] = str(value)
+        else:
+            raise KeyError(elem)
+    return types.Point(**kwargs)
+
+
+def _Shape_to_jsonable(obj: types.Shape) -> typing.Dict[str, typing.Any]:
+    if obj._selection_id == 0:
+        return {"Circle": obj._value}
+    else:
+        return {"Polygon": [_Point_to_jsonable(item0) for item0 in obj._value]}
+
+
+def _Shape_from_jsonable(obj: typing.Any) -> types.Shape:
+    (elem, value), = obj.items()
+    if elem == "Circle":
+        return types.Shape(circle=float(value))
+    elif elem == "Polygon":
+        return types.Shape(
+            polygon=[_Point_from_jsonable(item0) for item0 in value])
+    else:
+        raise KeyError(elem)
+
+
+_Color_to_schema: typing.Dict[types.Color, str] = {
+    types.Color.RED: "red",
+    types.Color.GREEN: "green",
+    types.Color.BLUE: "blue"
+}
+
+_Color_from_schema: typing.Dict[str, types.Color] = {
+    "red": types.Color.RED,
+    "green": types.Color.GREEN,
+    "blue": types.Color.BLUE
+}
+
+
+def _Item_to_jsonable(obj: types.Item) -> typing.Dict[str, typing.Any]:
+    result: typing.Dict[str, typing.Any] = {}
+    if obj.price is not None:
+        result["Price"] = obj.price
+    if obj.quantity is not None:
+        result["Quantity"] = obj.quantity
+    if obj.color is not None:
+        result["Color"] = _Color_to_schema[obj.color]
+    if obj.tags is not None:
+        result["Tags"] = list(obj.tags)
+    return result
+
+
+def _Item_from_jsonable(obj: typing.Any) -> types.Item:
+    kwargs: typing.Dict[str, typing.Any] = {}
+    for elem, value in obj.items():
+        if elem == "Price":
+            kwargs["price"] = float(value)
+        elif elem == "Quantity":
+            kwargs["quantity"] = int(value)
+        elif elem == "Color":
+            kwargs["color"] = _Color_from_schema[value]
+        elif elem == "Tags":
+            kwargs["tags"] = [str(item0) for item0 in value]
+        else:
+            raise KeyError(elem)
+    return types.Item(**kwargs)
+
+
+def _Header_to_jsonable(obj: types.Header) -> typing.Dict[str, typing.Any]:
+    result: typing.Dict[str, typing.Any] = {}
+    if obj.timestamp is not None:
+        result["Timestamp"] = obj.timestamp.isoformat()
+    if obj.source is not None:
+        result["Source"] = obj.source
+    return result
+
+
+def _Header_from_jsonable(obj: typing.Any) -> types.Header:
+    kwargs: typing.Dict[str, typing.Any] = {}
+    for elem, value in obj.items():
+        if elem == "Timestamp":
+            kwargs["timestamp"] = gencodeutil.from_jsonable(
+                datetime.datetime, value, _name_mappings, _class_by_name)
+        elif elem == "Source":
+            kwargs["source"] = str(value)
+        else:
+            raise KeyError(elem)
+    return types.Header(**kwargs)
+
+
+def _Order_to_jsonable(obj: types.Order) -> typing.Dict[str, typing.Any]:
+    result: typing.Dict[str, typing.Any] = {}
+    if obj.header is not None:
+        result["Header"] = _Header_to_jsonable(obj.header)
+    if obj.items is not None:
+        result["Items"] = [_Item_to_jsonable(item0) for item0 in obj.items]
+    if obj.shape is not None:
+        result["Shape"] = _Shape_to_jsonable(obj.shape)
+    return result
+
+
+def _Order_from_jsonable(obj: typing.Any) -> types.Order:
+    kwargs: typing.Dict[str, typing.Any] = {}
+    for elem, value in obj.items():
+        if elem == "Header":
+            kwargs["header"] = _Header_from_jsonable(value)
+        elif elem == "Items":
+            kwargs["items"] = [_Item_from_jsonable(item0) for item0 in value]
+        elif elem == "Shape":
+            kwargs["shape"] = _Shape_from_jsonable(value)
+        else:
+            raise KeyError(elem)
+    return types.Order(**kwargs)
+
+
+_encoders: typing.Dict[typing.Any, typing.Callable[[typing.Any], typing.Any]] = {
+    types.Point: _Point_to_jsonable,
+    types.Shape: _Shape_to_jsonable,
+    types.Color: _Color_to_schema.__getitem__,
+    types.Item: _Item_to_jsonable,
+    types.Header: _Header_to_jsonable,
+    types.Order: _Order_to_jsonable
+}
+
+_decoders: typing.Dict[typing.Any, typing.Callable[[typing.Any], typing.Any]] = {
+    types.Point: _Point_from_jsonable,
+    "Point": _Point_from_jsonable,
+    types.Shape: _Shape_from_jsonable,
+    "Shape": _Shape_from_jsonable,
+    types.Color: _Color_from_schema.__getitem__,
+    "Color": _Color_from_schema.__getitem__,
+    types.Item: _Item_from_jsonable,
+    "Item": _Item_from_jsonable,
+    types.Header: _Header_from_jsonable,
+    "Header": _Header_from_jsonable,
+    types.Order: _Order_from_jsonable,
+    "Order": _Order_from_jsonable
+}
+"""
+
+
+class TestStaticCodecs(unittest.TestCase):
+    def setUp(self) -> None:
+        self.util = {
+            'datetime': datetime,
+            'gencodeutil': gencodeutil,
+            'types': sys.modules[__name__],
+            'typing': typing,
+            '_name_mappings': _name_mappings,
+            '_class_by_name': _class_by_name
+        }
+        exec(_STATIC_CODECS_SOURCE, self.util)
+
+    def to_jsonable(self, obj: Any) -> Any:
+        return gencodeutil.static_to_jsonable(obj, self.util['_encoders'],
+                                              _name_mappings)
+
+    def from_jsonable(self, return_type: Any, obj: Any,
+                      **kwargs: Any) -> Any:
+        return gencodeutil.static_from_jsonable(return_type, obj,
+                                                self.util['_decoders'],
+                                                _name_mappings,
+                                                _class_by_name, **kwargs)
+
+    def test_same_as_generic(self) -> None:
+        for return_type in (Order, 'Order'):
+            order = self.from_jsonable(return_type, _ORDER_JSONABLE)
+            self.assertIsInstance(order, Order)
+            self.assertEqual(
+                to_jsonable(order),
+                to_jsonable(from_jsonable(Order, _ORDER_JSONABLE)))
+            self.assertEqual(self.to_jsonable(order), to_jsonable(order))
+        self.assertEqual(self.to_jsonable(Shape(circle=2.0)),
+                         {'Circle': 2.0})
+        self.assertEqual(self.to_jsonable(Color.GREEN), 'green')
+        self.assertIs(self.from_jsonable(Color, 'blue'), Color.BLUE)
+        self.assertEqual(self.to_jsonable([Point(x=1, y=2)]),
+                         [{'X': 1, 'Y': 2, 'Label': ''}])
+
+    def test_fallback(self) -> None:
+        # The static codecs raise the same errors as the generic codecs, and
+        # types without static codecs are converted by the generic codecs.
+        with self.assertRaises(KeyError):
+            self.from_jsonable(Point, {'X': 1, 'Y': 2, 'Z': 3})
+        with self.assertRaises(TypeError):
+            self.from_jsonable(Point, {'X': 1})
+        with self.assertRaises(ValueError):
+            self.from_jsonable(Item, {'Price': 'free'})
+        self.assertEqual(
+            self.to_jsonable(Task(priority=Priority.HIGH)),
+            {'Priority': 'high', 'History': []})
+        with self.assertRaises(gencodeutil.DecodeError):
+            self.from_jsonable(
+                Item, {'Price': 1.5, 'Quantity': -1},
+                options=gencodeutil.DecoderOptions(validation='strict'))
+        item = self.from_jsonable(Item, {'Price': 1.5, 'Quantity': 3},
+                                  only=['Price'])
+        self.assertIs(item.quantity, gencodeutil.NOT_DECODED)
+
+    def test_errors_propagate(self) -> None:
+        # An error in a static codec is not hidden by falling back to the
+        # generic codecs.
+        def broken(obj: Any) -> Any:
+            raise ZeroDivisionError('broken encoder')
+
+        self.util['_encoders'][Point] = broken
+        self.util['_decoders']['Point'] = broken
+        with self.assertRaisesRegex(ZeroDivisionError, 'broken encoder'):
+            self.to_jsonable(Point(x=1, y=2))
+        with self.assertRaisesRegex(ZeroDivisionError, 'broken encoder'):
+            self.from_jsonable('Point', {'X': 1, 'Y': 2})
+
+
+class _Loopback:
+    """'asyncio.StreamWriter' look-alike that feeds an 'asyncio.StreamReader'
+    """
+
+    def __init__(self, reader: Any) -> None:
+        self.reader = reader
+        self.drained = 0
+
+    def writelines(self, data: Any) -> None:
+        for chunk in data:
+            self.reader.feed_data(chunk)
+
+    async def drain(self) -> None:
+        self.drained += 1
+
+
+class TestStreams(unittest.TestCase):
+    def round_trip(self, objects: List[Any], **kwargs: Any) -> List[Any]:
+        framing = kwargs.pop('framing', 'lines')
+
+        async def run() -> List[Any]:
+            reader = asyncio.StreamReader()
+            writer = _Loopback(reader)
+            count = await gencodeutil.encode_stream(objects,
+                                                    writer,
+                                                    _name_mappings,
+                                                    framing=framing)
+            self.assertEqual(count, len(objects))
+            self.assertEqual(writer.drained, len(objects))
+            reader.feed_eof()
+            return [
+                obj async for obj in gencodeutil.decode_stream(
+                    Order, reader, _name_mappings, _class_by_name,
+                    framing=framing, **kwargs)
+            ]
+
+        return asyncio.run(run())
+
+    def test_round_trip(self) -> None:
+        orders = [from_jsonable(Order, _ORDER_JSONABLE)] * 50
+        # one order too large for a 'StreamReader' line
+        big = from_jsonable(Order, _ORDER_JSONABLE)
+        big.items = big.items * 2000
+        for framing in gencodeutil.STREAM_FRAMINGS:
+            for offload_size in (None, 0, 1000):
+                with self.subTest(framing=framing, offload_size=offload_size):
+                    decoded = self.round_trip(orders + [big],
+                                              framing=framing,
+                                              offload_size=offload_size)
+                    self.assertEqual([to_jsonable(obj) for obj in decoded],
+                                     [to_jsonable(obj)
+                                      for obj in orders + [big]])
+
+    def test_errors(self) -> None:
+        order = from_jsonable(Order, _ORDER_JSONABLE)
+        for framing in gencodeutil.STREAM_FRAMINGS:
+            with self.assertRaises(gencodeutil.DecodeError):
+                self.round_trip([order], framing=framing, max_message_size=10)
+        with self.assertRaises(ValueError):
+            self.round_trip([order], framing='xml')
+
+        async def truncated() -> List[Any]:
+            reader = asyncio.StreamReader()
+            reader.feed_data(b'\x00\x00\x00\x10{}')
+            reader.feed_eof()
+            return [
+                obj async for obj in gencodeutil.decode_stream(
+                    Order, reader, _name_mappings, _class_by_name,
+                    framing='length-prefixed')
+            ]
+
+        with self.assertRaises(gencodeutil.DecodeError):
+            asyncio.run(truncated())
+
+
+class TestJsonLines(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.orders = [from_jsonable(Order, _ORDER_JSONABLE)] * 25
+
+    def test_round_trip(self) -> None:
+        for name in ('orders.jsonl', 'orders.jsonl.gz', 'orders.jsonl.bz2',
+                     'orders.jsonl.xz'):
+            with self.subTest(name=name):
+                path = os.path.join(self.directory, name)
+                with gencodeutil.JsonLinesWriter(path, _name_mappings,
+                                                 queue_size=4) as writer:
+                    self.assertEqual(writer.write_all(self.orders), 25)
+                encode, write = writer.statistics()
+                self.assertEqual((encode.items, write.items), (25, 25))
+                self.assertEqual(encode.size_bytes, write.size_bytes)
+
+                with gencodeutil.open_compressed(path) as file:
+                    self.assertEqual(len(file.read().splitlines()), 25)
+
+                # Small reads split lines across chunks.
+                reader = gencodeutil.JsonLinesReader(path,
+                                                     Order,
+                                                     _name_mappings,
+                                                     _class_by_name,
+                                                     read_size=100,
+                                                     queue_size=3)
+                self.assertEqual([to_jsonable(order) for order in reader],
+                                 [to_jsonable(order)
+                                  for order in self.orders])
+                read, parse, decode = reader.statistics()
+                self.assertEqual((read.items, parse.items, decode.items),
+                                 (25, 25, 25))
+                self.assertEqual(read.size_bytes, encode.size_bytes)
+
+    def test_stop_early(self) -> None:
+        path = os.path.join(self.directory, 'orders.jsonl.gz')
+        with gencodeutil.JsonLinesWriter(path, _name_mappings) as writer:
+            writer.write_all(self.orders * 100)
+        reader = gencodeutil.JsonLinesReader(path,
+                                             Order,
+                                             _name_mappings,
+                                             _class_by_name,
+                                             queue_size=1,
+                                             max_chunks=1)
+        iterator = iter(reader)
+        next(iterator)
+        iterator.close()  # joins the reading thread
+        self.assertLess(reader.statistics()[0].items, 2500)
+
+    def test_errors(self) -> None:
+        path = os.path.join(self.directory, 'orders.jsonl')
+        with open(path, 'w') as file:
+            file.write(json.dumps(_ORDER_JSONABLE) + '\n\n{"Header": \n')
+        reader = gencodeutil.JsonLinesReader(path, Order, _name_mappings,
+                                             _class_by_name)
+        with self.assertRaises(json.JSONDecodeError):
+            list(reader)
+
+        missing = os.path.join(self.directory, 'missing.jsonl.gz')
+        with self.assertRaises(FileNotFoundError):
+            list(gencodeutil.JsonLinesReader(missing, Order, _name_mappings,
+                                             _class_by_name))
+
+
+class TestChoice(unittest.TestCase):
+    def test_selection(self) -> None:
+        shape = Shape(circle=2.0)
+        self.assertEqual(shape._selection_id, Shape.SELECTION_ID_CIRCLE)
+        self.assertEqual(shape._selection, 'circle')
+        self.assertEqual(shape.circle, 2.0)
+        with self.assertRaises(AttributeError):
+            shape.polygon
+        self.assertFalse(hasattr(shape, '__dict__'))
+
+        shape.polygon = [Point(x=1, y=2)]
+        self.assertEqual(shape._selection_id, Shape.SELECTION_ID_POLYGON)
+        self.assertEqual(shape._selection, 'polygon')
+        self.assertFalse(hasattr(shape, 'circle'))
+        with self.assertRaises(AttributeError):
+            shape.area = 1
+        with self.assertRaises(ValueError):
+            Shape(area=1)
+
+    def test_dispatch(self) -> None:
+        handlers = {
+            Shape.SELECTION_ID_CIRCLE: lambda radius: f'circle {radius}',
+            Shape.SELECTION_ID_POLYGON: lambda points: f'{len(points)}-gon'
+        }
+        self.assertEqual(gencodeutil.dispatch(Shape(circle=1.0), handlers),
+                         'circle 1.0')
+        self.assertEqual(
+            gencodeutil.dispatch(Shape(polygon=[Point(x=0, y=0)] * 3),
+                                 list(handlers.values())), '3-gon')
+
+        del handlers[Shape.SELECTION_ID_POLYGON]
+        with self.assertRaises(KeyError):
+            gencodeutil.dispatch(Shape(polygon=[]), handlers)
+        self.assertEqual(
+            gencodeutil.dispatch(Shape(polygon=[]), handlers, default=len), 0)
+
+        encoded = gencodeutil.encode_binary(Shape(circle=3.0), _class_by_name)
+        view = gencodeutil.view(Shape, encoded, _class_by_name)
+        self.assertEqual(gencodeutil.dispatch(view, [float, len]), 3.0)
+
+
+class TestProjection(unittest.TestCase):
+    def test_selected_fields_only(self) -> None:
+        order = from_jsonable(Order, _ORDER_JSONABLE,
+                              ['Header.Timestamp', 'Items[].Price'])
+        self.assertEqual(order.header.timestamp.year, 2018)
+        self.assertIs(order.header.source, gencodeutil.NOT_DECODED)
+        self.assertEqual([item.price for item in order.items], [1.5, 3.25])
+        self.assertIs(order.items[0].tags, gencodeutil.NOT_DECODED)
+        self.assertIs(order.items[1].color, gencodeutil.NOT_DECODED)
+        self.assertIs(order.shape, gencodeutil.NOT_DECODED)
+
+    def test_whole_element(self) -> None:
+        order = from_jsonable(Order, _ORDER_JSONABLE,
+                              ['Items', 'Items[].Price', 'Shape'])
+        self.assertEqual(order.items[0].tags, ['a', 'b'])
+        self.assertEqual(order.shape.polygon[1].x, 1)
+        self.assertIs(order.header, gencodeutil.NOT_DECODED)
+
+    def test_unselected_choice(self) -> None:
+        order = from_jsonable(Order, _ORDER_JSONABLE,
+                              ['Shape.Circle'])
+        self.assertEqual(order.shape._selection, 'polygon')
+        self.assertIs(order.shape.polygon, gencodeutil.NOT_DECODED)
+
+    def test_compiled_once(self) -> None:
+        paths = ['Items[].Price']
+        first = gencodeutil.Projection.compile(Order, paths, _name_mappings,
+                                               _class_by_name)
+        second = gencodeutil.Projection.compile(Order, paths, _name_mappings,
+                                                _class_by_name)
+        self.assertIs(first, second)
+        self.assertEqual(len(first.decode(_ORDER_JSONABLE).items), 2)
+
+    def test_same_class_name_in_two_modules(self) -> None:
+        class Order(gencodeutil.Sequence):  # another module's 'Order'
+            x: int
+
+            def __init__(self, *, x: int) -> None:
+                gencodeutil.Sequence.__init__(**locals())
+
+        name_mappings = {Order: gencodeutil.NameMapping({'x': 'Shape'})}
+        class_by_name = {'Order': Order}
+        ours = gencodeutil.from_jsonable('Order', _ORDER_JSONABLE,
+                                         _name_mappings, _class_by_name,
+                                         ['Shape'])
+        theirs = gencodeutil.from_jsonable('Order', {'Shape': 1},
+                                           name_mappings, class_by_name,
+                                           ['Shape'])
+        self.assertIsNot(type(ours), type(theirs))
+        self.assertIs(type(theirs), Order)
+        self.assertEqual(theirs.x, 1)
+
+    def test_cache_is_bounded(self) -> None:
+        saved = gencodeutil.Projection.max_cached
+        gencodeutil.Projection.max_cached = 2
+        try:
+            for path in ['Header', 'Items', 'Shape']:
+                gencodeutil.Projection.compile(Order, [path], _name_mappings,
+                                               _class_by_name)
+            self.assertLessEqual(len(gencodeutil.Projection._cache), 2)
+        finally:
+            gencodeutil.Projection.max_cached = saved
+
+    def test_invalid_paths(self) -> None:
+        for path in [
+                'Nope', 'Items.Price', 'Header[].Timestamp', 'Items[].Nope',
+                'Header.Timestamp.Year'
+        ]:
+            with self.assertRaises(ValueError, msg=path):
+                from_jsonable(Order, _ORDER_JSONABLE, [path])
+
+class TestColumns(unittest.TestCase):
+    def orders(self) -> typing.List[Order]:
+        second = json.loads(json.dumps(_ORDER_JSONABLE))
+        second['Header'] = {'Timestamp': '2019-01-02T03:04:05.000006'}
+        second['Shape'] = {'Circle': 2.5}
+        third = {'Header': second['Header'], 'Items': []}
+        return [
+            from_jsonable(Order, obj)
+            for obj in (_ORDER_JSONABLE, second, third)
+        ]
+
+    def from_records(self, records: typing.List[Any]
+                     ) -> gencodeutil.Columns:
+        return gencodeutil.Columns.from_records(
+            type(records[0]), records, _name_mappings, _class_by_name)
+
+    def test_layout(self) -> None:
+        columns = self.from_records(self.orders())
+        self.assertEqual(len(columns), 3)
+        self.assertEqual(columns.keys(), [
+            'Header.Timestamp', 'Header.Source', 'Items', 'Shape.Circle',
+            'Shape.Polygon', 'Shape'
+        ])
+        self.assertEqual(columns['Header.Source'].mask, bytearray([1, 0, 0]))
+        self.assertEqual(list(columns['Shape'].codes), [1, 0, -1])
+        self.assertEqual(list(columns['Items'].offsets), [0, 2, 4, 4])
+        items = columns['Items'].values
+        self.assertEqual(list(items['Price'].values), [1.5, 3.25] * 2)
+        self.assertEqual(list(items['Color'].codes), [0, -1] * 2)
+        self.assertEqual(list(items['Tags'].offsets), [0, 2, 2, 4, 4])
+
+    def test_wide_integers(self) -> None:
+        class Counter(gencodeutil.Sequence):
+            total: int
+            big: int
+
+            def __init__(self, *, total: int, big: int) -> None:
+                gencodeutil.Sequence.__init__(**locals())
+
+        mappings = {
+            Counter:
+            gencodeutil.NameMapping({
+                'total': 'Total',
+                'big': 'Big'
+            }, {'total': 'unsignedLong'})
+        }
+        records = [Counter(total=2**64 - 1, big=1),
+                   Counter(total=0, big=10**30)]
+        columns = gencodeutil.Columns.from_records(Counter, records, mappings,
+                                                   {'Counter': Counter})
+        self.assertEqual(columns['Total'].values.typecode, 'Q')
+        self.assertEqual(list(columns['Total'].values), [2**64 - 1, 0])
+        self.assertEqual(columns['Big'].values, [1, 10**30])
+        self.assertEqual([list(record) for record in columns.to_records()],
+                         [list(record) for record in records])
+
+    def test_layout_per_mappings(self) -> None:
+        renamed = dict(_name_mappings)
+        renamed[Point] = gencodeutil.NameMapping({
+            'x': 'Across',
+            'y': 'Down',
+            'label': 'Label'
+        })
+        points = [Point(x=1, y=2)]
+        self.assertEqual(
+            self.from_records(points).keys(), ['X', 'Y', 'Label'])
+        self.assertEqual(
+            gencodeutil.Columns.from_records(Point, points, renamed,
+                                             _class_by_name).keys(),
+            ['Across', 'Down', 'Label'])
+
+    def test_round_trip(self) -> None:
+        orders = self.orders()
+        columns = self.from_records(orders)
+        self.assertEqual([to_jsonable(order) for order in columns.to_records()],
+                         [to_jsonable(order) for order in orders])
+        self.assertEqual(to_jsonable(columns.record(-1)),
+                         to_jsonable(orders[-1]))
+
+    def test_from_jsonl(self) -> None:
+        orders = self.orders()
+        lines = [json.dumps(to_jsonable(order)) for order in orders]
+        lines[1] = json.dumps(_ORDER_JSONABLE)
+        orders[1] = from_jsonable(Order, _ORDER_JSONABLE)
+        columns = gencodeutil.Columns.from_jsonl(Order, lines + [''],
+                                                 _name_mappings,
+                                                 _class_by_name)
+        self.assertEqual([to_jsonable(order) for order in columns.to_records()],
+                         [to_jsonable(order) for order in orders])
+
+    def test_numeric_columns(self) -> None:
+        points = [Point(x=i, y=-i) for i in range(5)]
+        columns = self.from_records(points)
+        self.assertEqual(columns['X'].values.typecode, 'q')
+        self.assertEqual(list(columns['Y'].values), [0, -1, -2, -3, -4])
+        self.assertEqual(columns['Label'].get(3), '')
+
+
+class TestTables(unittest.TestCase):
+    def orders(self) -> typing.List[Order]:
+        second = json.loads(json.dumps(_ORDER_JSONABLE))
+        second['Header'] = {'Timestamp': '2019-01-02T03:04:05.000006'}
+        second['Shape'] = {'Circle': 2.5}
+        third = {'Header': second['Header'], 'Items': []}
+        return [
+            from_jsonable(Order, obj)
+            for obj in (_ORDER_JSONABLE, second, third)
+        ]
+
+    def round_trip(self, records: typing.List[Any],
+                   **kwargs: Any) -> typing.List[typing.List[str]]:
+        """Write the specified 'records' as a table and read them back, and
+        return the table's rows.
+        """
+        import csv
+        import io
+
+        file = io.StringIO(newline='')
+        writer = gencodeutil.TableWriter(file, type(records[0]),
+                                         _name_mappings, _class_by_name,
+                                         **kwargs)
+        self.assertEqual(writer.write_all(records), len(records))
+        file.seek(0)
+        reader = gencodeutil.TableReader(file, type(records[0]),
+                                         _name_mappings, _class_by_name,
+                                         **kwargs)
+        self.assertEqual([to_jsonable(record) for record in reader],
+                         [to_jsonable(record) for record in records])
+        file.seek(0)
+        return list(csv.reader(file, kwargs.get('dialect', 'excel')))
+
+    def test_joined(self) -> None:
+        rows = self.round_trip(self.orders())
+        self.assertEqual(rows[0], [
+            'Header.Timestamp', 'Header.Source', 'Items', 'Shape',
+            'Shape.Circle', 'Shape.Polygon'
+        ])
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1][:2], ['2018-06-25T12:30:00+00:00', 'feed'])
+        self.assertEqual(rows[2][3:5], ['Circle', '2.5'])
+        self.assertEqual(rows[3][1:], ['', '', '', '', ''])
+
+    def test_exploded(self) -> None:
+        rows = self.round_trip(self.orders(),
+                               dialect='excel-tab',
+                               explode='Items')
+        self.assertEqual(rows[0][:6], [
+            '#', 'Header.Timestamp', 'Header.Source', 'Items[].Price',
+            'Items[].Quantity', 'Items[].Color'
+        ])
+        self.assertEqual([row[0] for row in rows[1:]],
+                         ['0', '0', '1', '1', '2'])
+        self.assertEqual(rows[1][3:7], ['1.5', '2', 'red', 'a|b'])
+        self.assertEqual(rows[2][3:7], ['3.25', '1', '', ''])
+
+    def test_arrays(self) -> None:
+        tasks = [
+            Task(priority=Priority.HIGH,
+                 history=[Priority.LOW, Priority.HIGH]),
+            Task(priority=Priority.LOW)
+        ]
+        self.assertEqual(self.round_trip(tasks)[1], ['high', 'low|high'])
+        self.assertEqual(self.round_trip(tasks, explode='History')[1:],
+                         [['0', 'high', 'low'], ['0', 'high', 'high'],
+                          ['1', 'low', '']])
+        series = Series(name='s',
+                        samples=gencodeutil.Float64Array([0.5, 2.0]),
+                        flags=gencodeutil.BoolArray([1, 0]))
+        self.assertEqual(self.round_trip([series], separator=';')[1],
+                         ['s', '0.5;2.0', '', 'true;false'])
+
+    def test_errors(self) -> None:
+        import io
+
+        with self.assertRaises(ValueError):
+            gencodeutil.TableWriter(io.StringIO(), Order, _name_mappings,
+                                    _class_by_name, explode='Header')
+        item = Item(price=1.0, tags=['a|b'])
+        with self.assertRaises(ValueError):
+            self.round_trip([item])
+        writer = gencodeutil.TableWriter(io.StringIO(), Order, _name_mappings,
+                                         _class_by_name)
+        with self.assertRaises(ValueError):
+            writer.write(item)
+        reader = gencodeutil.TableReader(io.StringIO('Price\n1.0\n'), Item,
+                                         _name_mappings, _class_by_name)
+        with self.assertRaises(ValueError):
+            list(reader)
+
+
+class TestRecordFile(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'orders.rec')
+        second = json.loads(json.dumps(_ORDER_JSONABLE))
+        second['Header']['Timestamp'] = '2019-01-02T03:04:05.000006-05:00'
+        second['Shape'] = {'Circle': 2.5}
+        del second['Items'][0]['Color']
+        self.orders = [
+            from_jsonable(Order, _ORDER_JSONABLE),
+            from_jsonable(Order, second),
+            Order(header=Header(timestamp=datetime.datetime(2000, 1, 1)))
+        ]
+
+    def test_binary_round_trip(self) -> None:
+        for order in self.orders:
+            encoded = gencodeutil.encode_binary(order, _class_by_name)
+            decoded = gencodeutil.decode_binary(Order, encoded, _class_by_name)
+            self.assertEqual(to_jsonable(decoded), to_jsonable(order))
+        self.assertIsNone(decoded.shape)
+        self.assertEqual(decoded.items, [])
+
+    def test_wide_integers(self) -> None:
+        # e.g. an xs:unsignedLong above 2**63, or an unbounded xs:integer
+        for value in (0, -1, 1, 63, -64, 64, 2**63 - 1, -2**63, 2**64 - 1,
+                      10**30, -10**30):
+            shape = Shape(polygon=[Point(x=value, y=-value)])
+            encoded = gencodeutil.encode_binary(shape, _class_by_name)
+            decoded = gencodeutil.decode_binary(Shape, encoded, _class_by_name)
+            self.assertEqual(to_jsonable(decoded), to_jsonable(shape))
+            view = gencodeutil.view(Shape, encoded, _class_by_name)
+            self.assertEqual(view.polygon[0].x, value)
+
+    def test_threads(self) -> None:
+        # Threads that build the binary types of the same classes at once
+        # never see a sequence whose fields are not yet assigned.
+        expected = gencodeutil.encode_binary(self.orders[0], _class_by_name)
+        errors = []
+
+        def work() -> None:
+            try:
+                encoded = gencodeutil.encode_binary(self.orders[0],
+                                                    _class_by_name)
+                assert encoded == expected
+            except Exception as error:
+                errors.append(error)
+
+        # Switch threads as often as possible, to make the race likely.
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, interval)
+        for _ in range(20):
+            for klass in (Order, Header, Item, Shape, Point):
+                gencodeutil._binary_types.pop(klass, None)
+            threads = [threading.Thread(target=work) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+
+    def test_encode_error_path(self) -> None:
+        order = Order(header=Header(timestamp=datetime.datetime(2000, 1, 1)),
+                      items=[Item(price=1.0), Item(price=2.0, quantity='3')])
+        with self.assertRaises(gencodeutil.EncodeError) as context:
+            gencodeutil.encode_binary(order, _class_by_name)
+        self.assertEqual(context.exception.path, ['items', 1, 'quantity'])
+        self.assertTrue(str(context.exception).startswith('items[1].quantity'))
+
+    def test_random_access(self) -> None:
+        with gencodeutil.RecordFileWriter(self.path, Order,
+                                          _class_by_name) as writer:
+            for order in self.orders * 10:
+                writer.write(order)
+
+        expected = [to_jsonable(order) for order in self.orders * 10]
+        with gencodeutil.RecordFile(self.path, Order,
+                                    _class_by_name) as records:
+            self.assertEqual(len(records), 30)
+            self.assertEqual(to_jsonable(records[4]), expected[4])
+            self.assertEqual(to_jsonable(records[-1]), expected[-1])
+            self.assertEqual([to_jsonable(order) for order in records[3:9:2]],
+                             expected[3:9:2])
+            self.assertEqual([to_jsonable(order) for order in records],
+                             expected)
+            with self.assertRaises(IndexError):
+                records[30]
+
+    def test_append(self) -> None:
+        for i, order in enumerate(self.orders):
+            with gencodeutil.RecordFileWriter(
+                    self.path, Order, _class_by_name,
+                    append=bool(i)) as writer:
+                writer.write(order)
+                writer.write(order)
+
+        with gencodeutil.RecordFile(self.path, Order,
+                                    _class_by_name) as records:
+            self.assertEqual(
+                [to_jsonable(order) for order in records],
+                [to_jsonable(order) for order in self.orders
+                 for _ in range(2)])
+
+        # Each append overwrites the previous index, so the file holds the
+        # header, the records, and one index.
+        with gencodeutil.RecordFileWriter(self.path, Order,
+                                          _class_by_name) as writer:
+            for order in self.orders:
+                writer.write(order)
+        size = os.path.getsize(self.path)
+        for _ in range(3):
+            with gencodeutil.RecordFileWriter(self.path, Order,
+                                              _class_by_name,
+                                              append=True) as writer:
+                writer.write(self.orders[0])
+        record_size = len(
+            gencodeutil.encode_binary(self.orders[0], _class_by_name))
+        self.assertEqual(os.path.getsize(self.path),
+                         size + 3 * (record_size + 8))
+
+    def test_views(self) -> None:
+        encoded = gencodeutil.encode_binary(self.orders[0], _class_by_name)
+        order = gencodeutil.view(Order, encoded, _class_by_name)
+        self.assertEqual(type(order).__name__, 'OrderView')
+        self.assertEqual(order.header.timestamp.hour, 12)
+        self.assertEqual(order.header.source, 'feed')
+        self.assertEqual(len(order.items), 2)
+        self.assertEqual([item.price for item in order.items], [1.5, 3.25])
+        self.assertIs(order.items[0].color, Color.RED)
+        self.assertIsNone(order.items[-1].color)
+        self.assertEqual(list(order.items[0].tags), ['a', 'b'])
+        self.assertEqual(order.shape._selection, 'polygon')
+        self.assertEqual(order.shape.polygon[1].label, 'tip')
+        with self.assertRaises(AttributeError):
+            order.shape.circle
+        with self.assertRaises(IndexError):
+            order.items[2]
+        self.assertEqual(to_jsonable(order.materialize()),
+                         to_jsonable(self.orders[0]))
+        self.assertEqual(to_jsonable(order.items.materialize()),
+                         to_jsonable(self.orders[0].items))
+
+        with gencodeutil.RecordFileWriter(self.path, Order,
+                                          _class_by_name) as writer:
+            for order in self.orders:
+                writer.write(order)
+        with gencodeutil.RecordFile(self.path, Order,
+                                    _class_by_name) as records:
+            self.assertEqual(records.view(1).shape.circle, 2.5)
+            self.assertEqual(
+                to_jsonable(records.view(-1).materialize()),
+                to_jsonable(self.orders[-1]))
+
+    def test_wrong_type(self) -> None:
+        with gencodeutil.RecordFileWriter(self.path, Point,
+                                          _class_by_name) as writer:
+            writer.write(Point(x=1, y=2))
+            with self.assertRaises(ValueError):
+                writer.write(self.orders[0])
+        with self.assertRaises(ValueError):
+            gencodeutil.RecordFile(self.path, Order, _class_by_name)
+        with open(self.path, 'wb') as file:
+            file.write(b'not a record file')
+        with self.assertRaises(ValueError):
+            gencodeutil.RecordFile(self.path, Point, _class_by_name)
+
+
+class TestMemoryUsage(unittest.TestCase):
+    def test_sequence(self) -> None:
+        point = Point(x=1000, y=2, label='a label')
+        usage = gencodeutil.deep_sizeof(point)
+        own = sys.getsizeof(point) + sys.getsizeof(point.__dict__)
+        # 'y' is a small integer, which is shared rather than retained.
+        self.assertEqual(
+            usage.by_field, {
+                'Point.x': sys.getsizeof(point.x),
+                'Point.label': sys.getsizeof(point.label)
+            })
+        self.assertEqual(usage.by_type['Point'], [1, own])
+        self.assertEqual(usage.total_bytes,
+                         own + sum(usage.by_field.values()))
+        self.assertEqual(usage.objects, 3)
+        self.assertEqual(usage.roots, 1)
+
+    def test_shared_objects_counted_once(self) -> None:
+        tags = ['x' * 100]
+        items = [Item(price=1.5, tags=tags), Item(price=2.5, tags=tags)]
+        usage = gencodeutil.deep_sizeof(items)
+        self.assertEqual(usage.by_type['list'][0], 2)
+        self.assertEqual(usage.by_type['str'], [1, sys.getsizeof(tags[0])])
+        self.assertEqual(usage.by_field['Item.tags'],
+                         sys.getsizeof(tags) + sys.getsizeof(tags[0]))
+        self.assertEqual(
+            usage.total_bytes,
+            sum(size for _, size in usage.by_type.values()))
+
+    def test_nested(self) -> None:
+        order = Order(header=Header(timestamp=datetime.datetime(2020, 1, 2)),
+                      items=[Item(price=1.0, color=Color.RED)],
+                      shape=Shape(polygon=[Point(x=1, y=2)]))
+        usage = gencodeutil.deep_sizeof(order)
+        self.assertNotIn('Color', usage.by_type)
+        self.assertEqual(usage.by_type['Shape'][0], 1)
+        self.assertEqual(usage.by_type['datetime'][0], 1)
+        # A field's bytes include those of the fields nested within it.
+        self.assertGreater(usage.by_field['Order.shape'],
+                           usage.by_field['Shape.polygon'])
+        self.assertEqual(
+            usage.total_bytes,
+            sum(size for _, size in usage.by_type.values()))
+
+        metrics = usage.metrics('orders')
+        self.assertEqual(metrics['orders.total_bytes'], usage.total_bytes)
+        self.assertEqual(metrics['orders.type.Shape.objects'], 1)
+        self.assertEqual(metrics['orders.field.Order.shape.bytes'],
+                         usage.by_field['Order.shape'])
+
+    def test_sampler(self) -> None:
+        reports: List[gencodeutil.MemoryUsage] = []
+        sampler = gencodeutil.MemorySampler(3, reports.append)
+        results = [
+            sampler.observe(Point(x=1000 + i, y=0)) for i in range(7)
+        ]
+        self.assertEqual([result is not None for result in results],
+                         [True, False, False, True, False, False, True])
+        self.assertEqual(len(reports), 3)
+        self.assertEqual(sampler.observed, 7)
+
+        statistics = sampler.statistics()
+        self.assertEqual(statistics.roots, 3)
+        self.assertEqual(statistics.total_bytes,
+                         sum(report.total_bytes for report in reports))
+        self.assertEqual(statistics.mean_bytes(), reports[0].total_bytes)
+
+        with self.assertRaises(ValueError):
+            gencodeutil.MemorySampler(0)
+
 
 if __name__ == '__main__':
     unittest.main()